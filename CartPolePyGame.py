@@ -3,6 +3,8 @@ sys.path.append('./_utils/')
 import pygame
 import pygame.surfarray as surfarray
 import PyGameUtils
+import Profiling
+import Pacing
 import Box2DWorld 
 from ExpRobotSetup import ExpSetupDualCartPole
 
@@ -15,11 +17,11 @@ pygame.init()
 screen = pygame.display.set_mode(box2dWH, 0, 32)
 surfarray.use_arraytype('numpy')
 pygame.display.set_caption('Arm Simulation Learning')
-clock=pygame.time.Clock()
 
 dm = 50
 exp = ExpSetupDualCartPole(debug = True,xshift=-2.1)
 
+pacer = Pacing.Pacer(Box2DWorld.TIME_STEP)
 running=True
 while running:
     # Check the event queue
@@ -37,23 +39,26 @@ while running:
             # The user closed the window or pressed escape
             running=False
 
-    screen.fill((0,0,0,0))
+    n = pacer.steps()                  # physics steps due to keep up with real time
+    if(n > 0): exp.step_n(n)
 
-    #PyGameUtils.draw_contacts(screen,exp)
-    PyGameUtils.draw_world(screen)
-    
-    Box2DWorld.step()
-    exp.update()
+    if(pacer.render()):                # drawing is skipped while behind real time
+        screen.fill((0,0,0,0))
+
+        #PyGameUtils.draw_contacts(screen,exp)
+        PyGameUtils.draw_world(screen)
 
-    PyGameUtils.draw_salient(screen, exp)
+        PyGameUtils.draw_salient(screen, exp)
 
-    #PyGameUtils.my_draw_line(screen,[exp.getSalient()[0],exp.getLinkExtreme(0)])
-    #PyGameUtils.my_draw_line(screen,[exp.getSalient()[1],exp.getLinkExtreme(1)])
+        #PyGameUtils.my_draw_line(screen,[exp.getSalient()[0],exp.getLinkExtreme(0)])
+        #PyGameUtils.my_draw_line(screen,[exp.getSalient()[1],exp.getLinkExtreme(1)])
 
-    pygame.display.flip()              # Flip the screen and try to keep at the target FPS
-    clock.tick(Box2DWorld.TARGET_FPS)
-    pygame.display.set_caption("FPS: {:6.3}{}".format(clock.get_fps(), " "*5))
+        PyGameUtils.draw_profile(screen)
+        pygame.display.flip()
+        pygame.display.set_caption(pacer.caption() + Profiling.caption())
+    pacer.wait()
     
 pygame.quit()
+print(pacer.stats())
 print('Done!')
 
@@ -7,6 +7,8 @@ from pygame.locals import *
 
 
 import PyGameUtils
+import Profiling
+import Pacing
 import Box2DWorld 
 from ExpRobotSetup import ExpSetupEpuck
 
@@ -26,10 +28,10 @@ screen.set_alpha(None)
 surfarray.use_arraytype('numpy')
 
 pygame.display.set_caption('Epuck Simulation')
-clock=pygame.time.Clock()
 
 exp = ExpSetupEpuck(n=2, debug = True)
 
+pacer = Pacing.Pacer(Box2DWorld.TIME_STEP)
 running=True
 while running:
     # Check the event queue
@@ -46,20 +48,23 @@ while running:
             # The user closed the window or pressed escape
             running=False
 
-    screen.fill((0,0,0,0))
+    n = pacer.steps()                  # physics steps due to keep up with real time
+    if(n > 0): exp.step_n(n)
 
-    #PyGameUtils.draw_contacts(screen,exp)
-    PyGameUtils.draw_world(screen)
-   
-    exp.update()
-    Box2DWorld.step()
+    if(pacer.render()):                # drawing is skipped while behind real time
+        screen.fill((0,0,0,0))
 
-    #PyGameUtils.draw_salient(screen, exp)
+        #PyGameUtils.draw_contacts(screen,exp)
+        PyGameUtils.draw_world(screen)
 
-    pygame.display.flip()              # Flip the screen and try to keep at the target FPS
-    clock.tick(Box2DWorld.TARGET_FPS)
-    pygame.display.set_caption("FPS: {:6.3}{}".format(clock.get_fps(), " "*5))
+        #PyGameUtils.draw_salient(screen, exp)
+
+        PyGameUtils.draw_profile(screen)
+        pygame.display.flip()
+        pygame.display.set_caption(pacer.caption() + Profiling.caption())
+    pacer.wait()
     
 pygame.quit()
+print(pacer.stats())
 print('Done!')
 
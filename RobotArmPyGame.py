@@ -4,6 +4,8 @@ import numpy as np
 import pygame
 import pygame.surfarray as surfarray
 import PyGameUtils
+import Profiling
+import Pacing
 import Box2DWorld 
 from ExpRobotSetup import ExpSetupNao
 
@@ -17,7 +19,6 @@ pygame.init()
 screen = pygame.display.set_mode(box2dWH, 0, 32)
 surfarray.use_arraytype('numpy')
 pygame.display.set_caption('Two Arm Simulation Learning')
-clock=pygame.time.Clock()
 
 exp = ExpSetupNao(obj_type="box", salientMode = "minimum", debug = True, name = "bimanual")
 exp.setObjPos()
@@ -26,6 +27,7 @@ obj = exp.obj
 
 dm = np.array([1,1,1])
 
+pacer = Pacing.Pacer(Box2DWorld.TIME_STEP)
 running=True
 while running:
     # Check the event queue
@@ -43,21 +45,24 @@ while running:
             # The user closed the window or pressed escape
             running=False
 
-    screen.fill((0,0,0,0))
+    n = pacer.steps()                  # physics steps due to keep up with real time
+    if(n > 0): exp.step_n(n)
 
-    PyGameUtils.draw_contacts(screen,exp)
-    PyGameUtils.draw_world(screen)
-    PyGameUtils.my_draw_line(screen, exp.getObjLine() )
-   
-    Box2DWorld.step()
-    exp.update()
+    if(pacer.render()):                # drawing is skipped while behind real time
+        screen.fill((0,0,0,0))
 
-    PyGameUtils.draw_salient(screen, exp)
+        PyGameUtils.draw_contacts(screen,exp)
+        PyGameUtils.draw_world(screen)
+        PyGameUtils.my_draw_line(screen, exp.getObjLine() )
 
-    pygame.display.flip()              # Flip the screen and try to keep at the target FPS
-    clock.tick(Box2DWorld.TARGET_FPS)
-    pygame.display.set_caption("FPS: {:6.3}{}".format(clock.get_fps(), " "*5))
+        PyGameUtils.draw_salient(screen, exp)
+
+        PyGameUtils.draw_profile(screen)
+        pygame.display.flip()
+        pygame.display.set_caption(pacer.caption() + Profiling.caption())
+    pacer.wait()
     
 pygame.quit()
+print(pacer.stats())
 print('Done!')
 
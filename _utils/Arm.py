@@ -4,7 +4,10 @@ import numpy as np
 import itertools
 import math
 import VectorFigUtils
-from Box2DWorld import world, TIME_STEP, vel_iters, pos_iters, createArm, bDebug, SPEED_JOINT
+import Box2DWorld
+from Box2DWorld import createArm, bDebug, SPEED_JOINT, getRNG
+from JointControl import JointController, JointTrajectory, startingAt
+from Kinematics import ArmKinematics
             
 # *****************************************************************
 # Arm class of any parts and adding a joint extra hand if wanted
@@ -12,7 +15,7 @@ from Box2DWorld import world, TIME_STEP, vel_iters, pos_iters, createArm, bDebug
 class Arm:
     size_history  = 50
 
-    def __init__(self, nparts=2, position=(0,0), name="simple", length=1, bHand=False, hdiv=1, bLateralize=0, bShrink=False, collisionGroup=None,signDir=1):
+    def __init__(self, nparts=2, position=(0,0), name="simple", length=1, bHand=False, hdiv=1, bLateralize=0, bShrink=False, collisionGroup=None,signDir=1, rng=None, bMerge=False):
         global arm, bDebug
         arm = self
         self.name = name
@@ -20,7 +23,7 @@ class Arm:
         self.salientMode = "all"
         self.nparts = nparts
         self.bHand = bHand
-        self.jointList = createArm(position, nparts, bLateralize=bLateralize, length=length, bHand=bHand, hdiv=hdiv, name=name, bShrink = bShrink, collisionGroup=collisionGroup,signDir=signDir)
+        self.jointList = createArm(position, nparts, bLateralize=bLateralize, length=length, bHand=bHand, hdiv=hdiv, name=name, bShrink = bShrink, collisionGroup=collisionGroup,signDir=signDir, bMerge=bMerge)
 
         self.targetJoints = [0] * nparts      # without np multiply equals repeat
         if(bHand): self.targetJoints += [0]   # withou np sum equals concat
@@ -30,6 +33,9 @@ class Arm:
         self.iforce = -1
         self.speedGain = 12 # 1 unit in environment displacement
         self.history = []
+        self.rng = getRNG(rng)               # random deltaMotor, seed or RandomState for reproducible runs
+        self.controller = JointController([self])   # replaced by the one of the robot when it has several arms
+        self.kinematics = None                      # ArmKinematics, built by getKinematics
 
         if(bLateralize==0): self.which = "None"
         elif(bLateralize==1): self.which = "Left"
@@ -42,11 +48,20 @@ class Arm:
 
     def setTargetJoints(self, t = [0,0] ):
         self.targetMode = True
+        self.controller.cancelTrajectory(self)
         #print "Arm setTargetJoints t,len", t, len(t), "  and with ", self.targetJoints
         for i in range(len(t)):
             self.targetJoints[i] = t[i]
 
 
+    def setTrajectory(self, waypoints, times):
+        """Follow the spline through the joint waypoints at times (seconds), from the current angles
+        if the first time is > 0. Returns the JointTrajectory, its setpoints are computed once here."""
+        waypoints, times = startingAt(self.getJointAngles(), waypoints, times)
+        traj = JointTrajectory(waypoints, times)
+        self.controller.setTrajectory(traj, [self])
+        return traj
+
     def dmnorm(self,m):
         mplus=np.array(self.getJointAngles())
         return VectorFigUtils.vnorm(mplus - np.array(m))
@@ -55,14 +70,12 @@ class Arm:
         return VectorFigUtils.vnorm(self.getMotorSpeeds())
 
     def errorMinWorldLoop(self):
-        global world, TIME_STEP, vel_iters, pos_iters
         err = self.update()
         normhist, sumerr, niter = [ 1 ], 1, 0
         while(err > 0.05 and sumerr > 0.01 and niter < 500):
             m = self.getJointAngles()
             err = self.update()
-            world.Step(TIME_STEP, vel_iters, pos_iters)
-            world.ClearForces()   
+            Box2DWorld.step()      # counts nsteps, which the asleep caches rely on
             normhist.append(self.dmnorm(m))
             if(len(normhist)>15): normhist.pop(0)
             sumerr = sum(normhist)
@@ -78,6 +91,20 @@ class Arm:
         #if(err > 0.05): print self.which,"arm gotoTargetJoints",t,"Could not be reached"
         return self.getFinalPos()
 
+    def getKinematics(self):
+        if(self.kinematics is None): self.kinematics = ArmKinematics(self)
+        return self.kinematics
+
+    def solveIK(self, targets, **kwargs):
+        """Joint angles (m, joints) putting getFinalPos at each of targets (m, 2) and their remaining distance,
+        see Kinematics.ArmKinematics.solve."""
+        return self.getKinematics().solve(targets, **kwargs)
+
+    def gotoTarget(self, target):
+        """Reach the (x, y) target with the joint angles of the inverse kinematics, returns getFinalPos."""
+        Q, err = self.solveIK([target])
+        return self.gotoTargetJoints(list(Q[0]))
+
     def getJointLimits(self):
         return [(round(j.limits[0],2),round(j.limits[1],2)) for j in self.jointList]
 
@@ -105,7 +132,7 @@ class Arm:
             p = body.position
             ret = [p[0], p[1]]
             u,v = (1,0), (vertices[-2] - vertices[-1]) #vector to compute angle to return
-            angle = vangleSign(u,v)            
+            angle = VectorFigUtils.vangleSign(u,v)            
             ret = [p[0], p[1], angle]
         else:
             if(body.userData["name"] != "reversearmpart"):
@@ -140,9 +167,10 @@ class Arm:
         if(len(self.history) > Arm.size_history): 
             self.history.pop(0)     
 
-    def update(self):
+    def update(self, bPID=True):
+        """bPID=False when the controller of the robot already set the motor speeds of this arm."""
         ret = 0
-        if(self.targetMode): ret = self.updatePID()  # returns the sum of the error of each DOF
+        if(self.targetMode and bPID): ret = self.updatePID()  # returns the sum of the error of each DOF
     
         self.updateSalient()
         self.addHistory()
@@ -162,29 +190,25 @@ class Arm:
         self.deltaMotor(dm)
         for i in range(20):
             self.update()
-            world.Step(TIME_STEP, vel_iters, pos_iters)
-            world.ClearForces()
+            Box2DWorld.step()
         return self.getFinalPos()
 
     def deltaMotor(self,dm=[]):
-        if(len(dm)==0): dm = [round(2*r-1,2) for r in np.random.rand(self.nparts)]
+        if(len(dm)==0): dm = [round(2*r-1,2) for r in self.rng.rand(self.nparts)]
         self.targetMode = False
+        self.controller.cancelTrajectory(self)
         self.iforce = 10
         for i,j in enumerate(self.jointList):
             j.motorSpeed = self.speedGain*dm[i]
         return dm
 
-    def updatePID(self): #PID update for position control        
-        error_sum = 0
-        i = 0
-        for j, tangle in zip(self.jointList, self.targetJoints):
-            invj = max(1,2-i)            
-            maxSpeedJoint = self.maxSpeedJoint/float(invj)
-            angleError = j.angle - tangle            
-            j.motorSpeed = -maxSpeedJoint * angleError
-            error_sum += abs(angleError)
-            i += 1
-        return error_sum
+    def updatePID(self): #PID update for position control
+        return self.controller.update([self])[0]
+
+    def setPID(self, kp=None, ki=0.0, kd=0.0, umax=None, ilimit=0.05):
+        """Gains of the joints of this arm, in its controller (shared with the other arms of a robot),
+        see JointControl.JointController."""
+        self.controller.setGains(kp, ki, kd, umax, ilimit, arms=[self])
 
     def changeSalientMode(self,salientMode):
         self.salientMode = salientMode
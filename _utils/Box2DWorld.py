@@ -5,10 +5,11 @@ import time
 import numpy as np
 import Box2D
 import math
-import matplotlib.pyplot as plt
-from matplotlib import animation
+from LazyImport import lazyImport
+plt = lazyImport("matplotlib.pyplot")    # only the plotting functions below need it
 import VectorFigUtils
 from VectorFigUtils import drawBox, drawCircle, makeFigure, vnorm, vrotate, vangle, dist, vangleSign, computePointsAngle
+from Profiling import profiled
 
 import imp
 try:
@@ -21,15 +22,36 @@ except ImportError:
 # World Related Globals
 
 start_time = time.time()
-world = Box2D.b2World(gravity=[0.0, -0.001]) # normal gravity -9.8
+world = None
 
 if found:
     from myCollisions import consumeReward, TODESTROY, collisionDestruction
-    #world.contactListener = consumeReward()
-    world.contactListener = collisionDestruction()
 else:
     TODESTROY=[]
 
+def newWorld(gravity=(0.0, -0.001)):    # normal gravity -9.8
+    """Replace the global world by an empty one, so that a run does not depend on what was built
+    before in the process. Other modules must use Box2DWorld.getWorld() instead of importing world."""
+    global world, nsteps
+    world = Box2D.b2World(gravity=gravity)
+    nsteps = 0
+    if found:
+        #world.contactListener = consumeReward()
+        world.contactListener = collisionDestruction()
+    del TODESTROY[:]
+    return world
+
+def getWorld():
+    """The global world, created on first use rather than at import."""
+    if(world is None): newWorld()
+    return world
+
+def getRNG(seed=None):
+    """numpy RandomState from an int seed or a RandomState, the global np.random if seed is None."""
+    if(seed is None): return np.random
+    if(hasattr(seed, "rand")): return seed      # already a RandomState (or np.random itself)
+    return np.random.RandomState(seed)
+
 arm = None
 nao = None
 ground = 0
@@ -65,8 +87,8 @@ class CustomContactFilter(Box2D.b2ContactFilter):
         return 0
 
 def collisions(bOn = True):
-    if(bOn): world.contactFilter = DefaultContactFilter()
-    else: world.contactFilter = CustomContactFilter()
+    if(bOn): getWorld().contactFilter = DefaultContactFilter()
+    else: getWorld().contactFilter = CustomContactFilter()
 
 # ********************************************
 # RayCast Collisions : Robots, Epuck
@@ -83,6 +105,209 @@ class RayCastCallback(Box2D.b2RayCastCallback):
         self.normal = normal
         return fraction
 
+class AnalyticRayCastCallback(RayCastCallback):
+    """RayCast callback that skips the fixtures already intersected analytically by the RayTable."""
+
+    def ReportFixture(self, fixture, point, normal, fraction):
+        if(fixture.body.type == Box2D.b2_staticBody or fixture.type == Box2D.b2Shape.e_circle):
+            return -1      # filter the fixture and keep the ray going
+        return RayCastCallback.ReportFixture(self, fixture, point, normal, fraction)
+
+
+# ********************************************
+# Analytic RayCast against the scene geometry
+# Walls, floors and the rest of static bodies never move, so their polygon edges and
+# circles are kept in numpy arrays and intersected with a whole batch of rays at once.
+# Dynamic circles (epucks, rewards, rope) are intersected the same way from their
+# current positions, and Box2D is only asked for the rays passing by a dynamic polygon.
+
+bAnalyticRays = True          # False falls back to one Box2D RayCast per ray against everything
+minAnalyticRays = 50          # numpy overhead only pays off for batches above ~50 rays (measured)
+
+class RayTable(object):
+    """Static edges and circles in world coordinates plus the list of dynamic bodies."""
+
+    def __init__(self):
+        self.world = None
+        self.bodyCount = -1
+        self.bDirty = True
+        self.bodies = []
+        self.segP, self.segD = np.zeros((0, 2)), np.zeros((0, 2))
+        self.segBody = np.zeros(0, dtype=int)
+        self.circC, self.circR2 = np.zeros((0, 2)), np.zeros(0)
+        self.circBody = np.zeros(0, dtype=int)
+        self.dynCircles = []
+        self.dynPolys, self.dynPolyR2 = [], np.zeros(0)
+
+    def rebuild(self):
+        """Collect the edges (CCW, as Box2D stores them) of every active static body,
+        the circles of dynamic bodies and the bounding radius of dynamic polygons."""
+        self.bodies = []
+        segP, segD, segBody, circC, circR2, circBody = [], [], [], [], [], []
+        dynCircles, dynCircR2, dynCircBody, dynPolys, dynPolyR2 = [], [], [], [], []
+        world = getWorld()
+        for body in world.bodies:
+            if(not body.active): continue
+            ibody = len(self.bodies)
+            self.bodies.append(body)
+            bStatic = body.type == Box2D.b2_staticBody
+            rpoly = -1
+            for fixture in body.fixtures:
+                shape = fixture.shape
+                if(isinstance(shape, Box2D.b2CircleShape)):
+                    if(bStatic):
+                        c = body.transform * shape.pos
+                        circC.append((c[0], c[1]))
+                        circR2.append(shape.radius ** 2)
+                        circBody.append(ibody)
+                    else:
+                        lpos = (shape.pos[0], shape.pos[1])
+                        dynCircles.append((body, None if lpos == (0, 0) else lpos))
+                        dynCircR2.append(shape.radius ** 2)
+                        dynCircBody.append(ibody)
+                elif(bStatic and isinstance(shape, Box2D.b2PolygonShape)):
+                    v = [body.transform * p for p in shape.vertices]
+                    for i in range(len(v)):
+                        a, b = v[i], v[(i + 1) % len(v)]
+                        segP.append((a[0], a[1]))
+                        segD.append((b[0] - a[0], b[1] - a[1]))
+                        segBody.append(ibody)
+                elif(not bStatic):
+                    rpoly = max([rpoly] + [vnorm(p) for p in getattr(shape, 'vertices', [])])
+            if(not bStatic and rpoly >= 0):
+                dynPolys.append(body)
+                dynPolyR2.append((rpoly + 0.01) ** 2)
+
+        self.segP, self.segD = np.array(segP, dtype=float).reshape(-1, 2), np.array(segD, dtype=float).reshape(-1, 2)
+        self.segBody = np.array(segBody, dtype=int)
+        # static circles first, the centers of the dynamic ones are appended at each cast
+        self.circC = np.array(circC, dtype=float).reshape(-1, 2)
+        self.circR2 = np.array(circR2 + dynCircR2, dtype=float)
+        self.circBody = np.array(circBody + dynCircBody, dtype=int)
+        self.dynCircles = dynCircles
+        self.dynPolys, self.dynPolyR2 = dynPolys, np.array(dynPolyR2, dtype=float)
+        self.world = world
+        self.bodyCount = world.bodyCount
+        self.bDirty = False
+
+    def refresh(self):
+        world = getWorld()
+        if(self.bDirty or self.world is not world or self.bodyCount != world.bodyCount): self.rebuild()
+
+    def nearStatic(self, points, radius):
+        """Which points (k, 2) are within radius of a static edge or circle. Rays not longer than radius
+        from the other points cannot hit a static body."""
+        self.refresh()
+        near = np.zeros(len(points), dtype=bool)
+        x, y = points[:, 0, np.newaxis], points[:, 1, np.newaxis]
+        if(len(self.segP) > 0):
+            dx, dy = self.segD[:, 0], self.segD[:, 1]
+            wx, wy = x - self.segP[:, 0], y - self.segP[:, 1]
+            t = np.clip((wx * dx + wy * dy) / np.maximum(dx * dx + dy * dy, 1e-12), 0, 1)
+            ex, ey = wx - t * dx, wy - t * dy
+            near |= np.any(ex * ex + ey * ey <= radius * radius, axis=1)
+        if(len(self.circC) > 0):
+            reach = radius + np.sqrt(self.circR2[:len(self.circC)])
+            ex, ey = x - self.circC[:, 0], y - self.circC[:, 1]
+            near |= np.any(ex * ex + ey * ey <= reach * reach, axis=1)
+        return near
+
+    def castRays(self, p1, p2, bDynamic=True):
+        """Closest analytic hit of every ray p1[k] -> p2[k] as (fraction, body index), inf and -1 if none.
+        Also returns which rays pass close to a dynamic polygon and still need a Box2D RayCast.
+        With bDynamic=False only the static bodies are cast against."""
+        self.refresh()
+        k = len(p1)
+        x1, y1 = p1[:, 0, np.newaxis], p1[:, 1, np.newaxis]
+        rx, ry = p2[:, 0, np.newaxis] - x1, p2[:, 1, np.newaxis] - y1
+        rr = rx * rx + ry * ry
+        frac, hit = np.full(k, np.inf), np.full(k, -1, dtype=int)
+        rows = np.arange(k)
+
+        if(len(self.segP) > 0):
+            dx, dy = self.segD[:, 0], self.segD[:, 1]
+            wx, wy = self.segP[:, 0] - x1, self.segP[:, 1] - y1
+            denom = rx * dy - ry * dx
+            tn = wx * dy - wy * dx         # t = tn / denom and u = un / denom must be in [0,1]
+            un = wx * ry - wy * rx
+            # like b2PolygonShape.RayCast only front facing edges (denom < 0) count,
+            # so rays starting inside a polygon do not hit it
+            valid = (denom < 0) & (tn <= 0) & (tn >= denom) & (un <= 0) & (un >= denom)
+            t = np.where(valid, tn / np.where(valid, denom, -1), np.inf)
+            j = np.argmin(t, axis=1)
+            frac, hit = t[rows, j], self.segBody[j]
+
+        centers, circR2 = self.circC, self.circR2[:len(self.circC)]
+        if(bDynamic and len(self.dynCircles) > 0):
+            centers, circR2 = np.concatenate((centers, self.dynamicCenters())), self.circR2
+        if(len(circR2) > 0):
+            sx, sy = x1 - centers[:, 0], y1 - centers[:, 1]
+            b = sx * rx + sy * ry
+            sigma = b * b - rr * (sx * sx + sy * sy - circR2)
+            # like b2CircleShape.RayCast rays starting inside do not hit
+            t = -(b + np.sqrt(np.maximum(sigma, 0))) / rr
+            t[(sigma < 0) | (t < 0) | (t > 1)] = np.inf
+            j = np.argmin(t, axis=1)
+            tc = t[rows, j]
+            closer = tc < frac
+            frac[closer], hit[closer] = tc[closer], self.circBody[j[closer]]
+
+        hit[np.isinf(frac)] = -1
+        near = np.zeros(k, dtype=bool)
+        if(bDynamic and len(self.dynPolys) > 0):
+            c = np.array([(p[0], p[1]) for p in [body.position for body in self.dynPolys]])
+            wx, wy = c[:, 0] - x1, c[:, 1] - y1
+            t = np.clip((wx * rx + wy * ry) / rr, 0, np.minimum(frac, 1)[:, np.newaxis])
+            ex, ey = wx - t * rx, wy - t * ry
+            near = np.any(ex * ex + ey * ey <= self.dynPolyR2, axis=1)
+        return frac, hit, near
+
+    def dynamicCenters(self):
+        centers = [body.position if lpos is None else body.transform * lpos for body, lpos in self.dynCircles]
+        return np.array([(c[0], c[1]) for c in centers], dtype=float).reshape(-1, 2)
+
+
+rayTable = RayTable()
+analyticRayCallback = AnalyticRayCastCallback()
+allRayCallback = RayCastCallback()
+
+def invalidateRays():
+    """Rebuild the ray table on next cast. Needed after moving a static body or (de)activating
+    a body, creating and destroying bodies is detected from the body count."""
+    rayTable.bDirty = True
+    awakeState["key"] = None
+
+def rayCast(p1, p2):
+    """Cast the batch of rays p1[k] -> p2[k], returns the list of hit bodies (None if no hit)
+    and the array of hit points (p2[k] if no hit)."""
+    p1 = np.asarray(p1, dtype=float).reshape(-1, 2)
+    p2 = np.asarray(p2, dtype=float).reshape(-1, 2)
+    k = len(p1)
+    bodies, points = [None] * k, p2.copy()
+    if(k == 0): return bodies, points
+
+    if(bAnalyticRays and k >= minAnalyticRays):
+        frac, hit, near = rayTable.castRays(p1, p2)
+        callback = analyticRayCallback
+        ihit = hit >= 0
+        if(np.any(ihit)):
+            bodies = [rayTable.bodies[i] if i >= 0 else None for i in hit.tolist()]
+            points[ihit] = p1[ihit] + frac[ihit, np.newaxis] * (p2[ihit] - p1[ihit])
+        todo = np.nonzero(near & (frac > 1e-6))[0]
+        if(len(todo) > 0):
+            # stop Box2D just before the analytic hit, Box2D does not accept zero length rays
+            ends = p1 + np.minimum(frac - 1e-6, 1)[:, np.newaxis] * (p2 - p1)
+    else:
+        callback, ends, todo = allRayCallback, p2, range(k)
+
+    for i in todo:
+        callback.fixture = None
+        getWorld().RayCast(callback, (p1[i, 0], p1[i, 1]), (ends[i, 0], ends[i, 1]))
+        if(callback.fixture is not None):
+            bodies[i] = callback.fixture.body
+            points[i] = (callback.point[0], callback.point[1])
+    return bodies, points
+
 class fwQueryCallback(Box2D.b2QueryCallback):
 
     def __init__(self, p):
@@ -107,7 +332,7 @@ def queryPoint(p):
 
     # Query the world for overlapping shapes.
     query = fwQueryCallback(p)
-    world.QueryAABB(query, aabb)
+    getWorld().QueryAABB(query, aabb)
 
     if query.fixture:
         body = query.fixture.body
@@ -125,10 +350,79 @@ def createGlobalFigure():
         ax = plt.axes(xlim=VectorFigUtils.x_lim, ylim=VectorFigUtils.y_lim)
 
 
+@profiled("Box2DWorld.step")
 def step():
-    global world, TIME_STEP, vel_iters, pos_iters, arm
+    global TIME_STEP, vel_iters, pos_iters, arm
+    world = getWorld()
     world.Step(TIME_STEP, vel_iters, pos_iters)
     world.ClearForces()
+    global nsteps
+    nsteps += 1
+
+
+# ********************************************
+# Sleeping bodies. Box2D stops simulating a body that rests for b2_timeToSleep until a
+# contact, joint or force wakes it, so what is computed from its pose (vertices, salient
+# points, contacts) is kept meanwhile. Static bodies never move and inactive ones are not
+# simulated. Sensors also depend on the bodies around: their readings are kept only while
+# no awake body came within their range. Box2D does not wake a body whose position is set,
+# the pose check of cachedAsleep covers it but not the range check of sensors nearby.
+
+nsteps = 0                  # physics steps of the current world
+awakeState = {"key": None, "cur": None, "prev": None, "bodyCount": 0}
+
+def isAsleep(body):
+    """Whether the simulation leaves the body where it is."""
+    return not body.awake or not body.active or body.type == Box2D.b2_staticBody
+
+def bodyExtent(body):
+    """Radius around its origin covering all the fixtures of the body."""
+    extent = body.userData.get("extent")
+    if(extent is None):
+        extent = 0
+        for fixture in body.fixtures:
+            shape = fixture.shape
+            if(isinstance(shape, Box2D.b2CircleShape)): extent = max(extent, vnorm(shape.pos) + shape.radius)
+            else: extent = max([extent] + [vnorm(v) + shape.radius for v in getattr(shape, "vertices", [])])
+        body.userData["extent"] = extent
+    return extent
+
+def awakeNear(p, radius):
+    """Whether some body awake now or at the previous call might be within radius of p. Always True if
+    that call was more than b2_timeToSleep ago: a body could have woken, moved and slept meanwhile."""
+    world = getWorld()
+    key = (id(world), nsteps)
+    if(awakeState["key"] != key):
+        last = awakeState["key"]
+        recent = (last is not None and last[0] == key[0] and nsteps - last[1] < Box2D.b2_timeToSleep / TIME_STEP
+                  and awakeState["bodyCount"] == world.bodyCount)
+        c, e = [], []
+        for body in world.bodies:
+            if(not isAsleep(body) and body.userData is not None):
+                c.append((body.position[0], body.position[1]))
+                e.append(bodyExtent(body))
+        cur = (np.array(c, dtype=float).reshape(-1, 2), np.array(e, dtype=float))
+        awakeState.update(key=key, prev=awakeState["cur"] if recent else None, cur=cur, bodyCount=world.bodyCount)
+    if(awakeState["prev"] is None): return True
+    for c, e in (awakeState["cur"], awakeState["prev"]):
+        if(len(c) and np.any(np.hypot(c[:, 0] - p[0], c[:, 1] - p[1]) <= radius + e)): return True
+    return False
+
+def cachedAsleep(body, key, compute, radius=None):
+    """compute(body), reused while the body sleeps at the same pose. With radius (sensors), also only
+    while awakeNear(body.position, radius) is False."""
+    if(body.userData is None or not isAsleep(body)):
+        if(body.userData is not None): body.userData.get("asleep", {}).pop(key, None)
+        return compute(body)
+    cache = body.userData.setdefault("asleep", {})
+    p = body.position
+    pose = (p[0], p[1], body.angle)
+    hit = cache.get(key)
+    if(hit is not None and hit[0] == pose and (radius is None or not awakeNear(pose, radius))):
+        return hit[1]
+    value = compute(body)
+    cache[key] = (pose, value)
+    return value
 
 def destroy(dyingLists=[]):
     global world,TODESTROY
@@ -145,16 +439,17 @@ def destroy(dyingLists=[]):
                     o = o.body
                     if '_destroy' in o.userData['name'] or '_destroy' in o2.userData['name']:
                         ids.append(i)
-                        world.DestroyBody(o)
+                        getWorld().DestroyBody(o)
                 else:
                     if '_destroy' in o.userData['name']:
                         ids.append(i)
-                        world.DestroyBody(o)
+                        getWorld().DestroyBody(o)
             for i,idx in enumerate(ids):
                 del l[idx-i]
 
         del TODESTROY[:]
         flag=True
+        invalidateRays()
         print 'destruction "finished"!'
         #
     return flag
@@ -165,7 +460,7 @@ def destroy(dyingLists=[]):
 def plotWorld(ax, alpha=0.3, nao=None, obj=None, bDrawGround=False, color='b', centers=[], specials=[], cradius=0.1, ccolor='r', label='_'):
     global world
     # ax.plot([pobj[0],pnao[0]], [pobj[1],pnao[1]], linestyle='--', color='g', lw=2)
-    for body in world.bodies:
+    for body in getWorld().bodies:
         name = body.userData["name"]
         for fixture in body.fixtures:
             shape = fixture.shape
@@ -293,7 +588,7 @@ def myCreateDistanceJoint(bodyA,bodyB,dx=0):
 
     pA = (bodyA.worldCenter[0]+dx, bodyA.worldCenter[1])
     pB = (bodyB.worldCenter[0], bodyB.worldCenter[1])
-    joint = world.CreateDistanceJoint(
+    joint = getWorld().CreateDistanceJoint(
             bodyA=bodyA, 
             bodyB=bodyB, 
             anchorA=pA,
@@ -308,7 +603,7 @@ def myCreateDistanceJoint(bodyA,bodyB,dx=0):
 def myCreateLinearJoint(bodyA,bodyB,force=100,lowerTranslation = -0.2,upperTranslation = 0):
     global world
     center = (bodyA.worldCenter + bodyB.worldCenter)/2.0
-    joint = world.CreatePrismaticJoint(
+    joint = getWorld().CreatePrismaticJoint(
             bodyA=bodyA, 
             bodyB=bodyB, 
             anchor=center,
@@ -327,7 +622,7 @@ def myCreateLinearJoint(bodyA,bodyB,force=100,lowerTranslation = -0.2,upperTrans
 def myCreateRevoluteJoint(bodyA,bodyB,anchor,lowerAngle = -0.7 * np.pi, upperAngle = 0.7 * np.pi,iswheel=False):
     global world
     if(not iswheel):
-        return world.CreateRevoluteJoint(
+        return getWorld().CreateRevoluteJoint(
                 bodyA=bodyA, 
                 bodyB=bodyB, 
                 anchor=anchor,
@@ -340,7 +635,7 @@ def myCreateRevoluteJoint(bodyA,bodyB,anchor,lowerAngle = -0.7 * np.pi, upperAng
                 collideConnected = False,
                 )
     else:
-        return world.CreateRevoluteJoint(
+        return getWorld().CreateRevoluteJoint(
                 bodyA=bodyA, 
                 bodyB=bodyB, 
                 anchor=anchor,
@@ -354,7 +649,7 @@ def createGround(position=[0,-20]):
     global world
     groundBodyDef = Box2D.b2BodyDef()
     groundBodyDef.position = Box2D.b2Vec2(0, -20)
-    groundBody = world.CreateBody(groundBodyDef)
+    groundBody = getWorld().CreateBody(groundBodyDef)
 
     groundBox = Box2D.b2PolygonShape()
     groundBox.SetAsBox(100, 10)
@@ -363,7 +658,7 @@ def createGround(position=[0,-20]):
     return groundBody
 
 
-def createCircle(position, r=0.3, bDynamic=True, bCollideNoOne=False, density=1, damping=0.05, restitution=0.1, friction=200, name="",categoryBits=0x0001,maskBits=0x0009):
+def createCircle(position, r=0.3, bDynamic=True, bCollideNoOne=False, density=1, damping=0.05, restitution=0.1, friction=200, name="",categoryBits=0x0001,maskBits=0x0009,collisionGroup=None):
     global world, fig, ax
     bodyDef = Box2D.b2BodyDef()
     bodyDef.position = position
@@ -372,30 +667,52 @@ def createCircle(position, r=0.3, bDynamic=True, bCollideNoOne=False, density=1,
     else:
         bodyDef.type = Box2D.b2_staticBody
 
-    if(abs(world.gravity[1]) > 1):
+    if(abs(getWorld().gravity[1]) > 1):
         bodyDef.linearDamping = damping
         bodyDef.angularDamping = damping
     else:
         bodyDef.linearDamping = 70
         bodyDef.angularDamping = 30
 
-    body = world.CreateBody(bodyDef)
+    body = getWorld().CreateBody(bodyDef)
     shape = Box2D.b2CircleShape(radius=r)
 
     mask=maskBits
     if(bCollideNoOne):
         mask = 0x0000
     fixture = body.CreateFixture(maskBits=mask, shape=shape, density=density, restitution=restitution, friction=friction,categoryBits=categoryBits)
+    if(collisionGroup!=None):
+        filterData = fixture.filterData         # a copy, set back
+        filterData.groupIndex = collisionGroup
+        fixture.filterData = filterData
     body.userData = {"name": name}
 
     return body
 
 
-def createRope(position, nparts=10, r=0.3, density=1, name=""):
+ROPE_JOINTS = ["distance", "revolute", "rope"]
+
+def createRopeJoint(bodyA, bodyB, joint="distance"):
+    """Link of two consecutive rope segments: a distance joint between their centers, a revolute joint at the
+    middle point, or a rope joint (only a maximum distance, the current one)."""
+    if(joint == "distance"): return myCreateDistanceJoint(bodyA, bodyB)
+    pA, pB = bodyA.worldCenter, bodyB.worldCenter
+    if(joint == "revolute"):
+        return getWorld().CreateRevoluteJoint(bodyA=bodyA, bodyB=bodyB, anchor=(pA + pB) / 2.0, collideConnected=False)
+    if(joint == "rope"):
+        return getWorld().CreateRopeJoint(bodyA=bodyA, bodyB=bodyB, localAnchorA=(0, 0), localAnchorB=(0, 0),
+                                          maxLength=max((pB - pA).length, 0.01), collideConnected=False)
+    raise ValueError("rope joint %r, not one of %s" % (joint, ROPE_JOINTS))
+
+
+def createRope(position, nparts=10, r=0.3, density=1, name="", joint="distance", spacing=1.55, damping=0.05, collisionGroup=None):
+    """Chain of nparts + 1 circles along x, spacing*r apart (the first two at position), linked by joints of
+    type joint (see createRopeJoint). A negative collisionGroup keeps the segments from colliding with each other,
+    joined segments never do. damping is the one of createCircle under normal gravity."""
     global world
     jointList = []
 
-    firstBody = createCircle(position, r=r)
+    firstBody = createCircle(position, r=r, damping=damping, collisionGroup=collisionGroup)
     firstBody.userData["name"]="ropepart"
 
     prevBody = firstBody
@@ -403,9 +720,9 @@ def createRope(position, nparts=10, r=0.3, density=1, name=""):
 
     pos = position
     for i in range(nparts):
-        body = createCircle(pos, r=r, density=density)
-        jointList.append(myCreateDistanceJoint(prevBody,body) )
-        pos = (pos[0]+1.55*r, pos[1])
+        body = createCircle(pos, r=r, density=density, damping=damping, collisionGroup=collisionGroup)
+        jointList.append(createRopeJoint(prevBody, body, joint))
+        pos = (pos[0]+spacing*r, pos[1])
         prevBody = body
         rbodies.append(body)
     return rbodies, [jointList[0], jointList[-1]]
@@ -419,7 +736,7 @@ def createBoxFixture(pos = (0,0), width=1.0, height=1.0, bDynamic=True, friction
     fixtureDef.shape = boxShape
 
     fixtureDef.friction = friction
-    if(abs(world.gravity[1]) > 1):
+    if(abs(getWorld().gravity[1]) > 1):
         fixtureDef.restitution = 0.05
 
     if(restitution != None): fixtureDef.restitution = restitution
@@ -432,12 +749,14 @@ def createBoxFixture(pos = (0,0), width=1.0, height=1.0, bDynamic=True, friction
 
 def createBox(position, w=1.0, h=1.0, wdiv=1, hdiv=1, bDynamic=True, density=1, friction=0.3, damping=0,
               collisionGroup=None, restitution=None, bCollideNoOne=False, name="",angle=0,categoryBits=0x0001,
-              maskBits=0x0009):
+              maskBits=0x0009, bMerge=False):
+    """Box of half sizes w, h made of wdiv x hdiv fixtures, or with bMerge of a single fixture whatever wdiv
+    and hdiv: one broadphase proxy and one polygon to draw."""
     global world
     bodyDef = Box2D.b2BodyDef()
     bodyDef.position = position
 
-    if(abs(world.gravity[1]) > 1):
+    if(abs(getWorld().gravity[1]) > 1):
         bodyDef.linearDamping = damping
         bodyDef.angularDamping = 0
     else:
@@ -447,11 +766,12 @@ def createBox(position, w=1.0, h=1.0, wdiv=1, hdiv=1, bDynamic=True, density=1,
     if bDynamic: bodyDef.type = Box2D.b2_dynamicBody
     else:        bodyDef.type = Box2D.b2_staticBody
 
-    body = world.CreateBody(bodyDef)
+    body = getWorld().CreateBody(bodyDef)
     body.userData = {"name":name}
 
     dw = w / float(wdiv)
     dh = h / float(hdiv)
+    if(bMerge): wdiv, hdiv, dw, dh = 1, 1, w, h
 
     for i in range(hdiv):
         for j in range(wdiv):
@@ -467,6 +787,33 @@ def createBox(position, w=1.0, h=1.0, wdiv=1, hdiv=1, bDynamic=True, density=1,
     return body
 
 
+def statsName(body):
+    name = body.userData.get("name") if isinstance(body.userData, dict) else None
+    if(name): return name
+    return "(static)" if body.type == Box2D.b2_staticBody else "(unnamed)"
+
+
+def fixtureStats():
+    """Bodies, fixtures, broadphase proxies and contact pairs (touching or only overlapping bounding boxes) of the
+    world, in total and per body name. Contacts per name count the pairs with a body of that name, once
+    when both bodies have it."""
+    world = getWorld()
+    names = {}
+    nfixtures, ntouching = 0, 0
+    for body in world.bodies:
+        stats = names.setdefault(statsName(body), {"bodies": 0, "fixtures": 0, "proxies": 0, "contacts": 0})
+        stats["bodies"] += 1
+        stats["fixtures"] += len(body.fixtures)
+        stats["proxies"] += sum(f.shape.childCount for f in body.fixtures)
+        nfixtures += len(body.fixtures)
+    for contact in world.contacts:
+        if(contact.touching): ntouching += 1
+        for name in set([statsName(contact.fixtureA.body), statsName(contact.fixtureB.body)]):
+            names[name]["contacts"] += 1
+    return {"bodies": world.bodyCount, "fixtures": nfixtures, "proxies": world.proxyCount,
+            "contacts": world.contactCount, "touching": ntouching, "names": names}
+
+
 def createTri(position, r=0.3, dynamic=True):
     global world, fig, ax
     bodyDef = Box2D.b2BodyDef()
@@ -481,7 +828,7 @@ def createTri(position, r=0.3, dynamic=True):
     bodyDef.position = position
     bodyDef.linearDamping = 70
     bodyDef.angularDamping = 50
-    body = world.CreateBody(bodyDef)
+    body = getWorld().CreateBody(bodyDef)
     v = [(-r,-r),(0,r),(r,-r)]
     fixture = body.CreateFixture(shape=Box2D.b2PolygonShape(vertices=v), density=1.0, friction=0.3)
     body.userData = {"name":"tri"}
@@ -489,7 +836,7 @@ def createTri(position, r=0.3, dynamic=True):
     return body
 
 
-def createArm(position=(0, 0), nparts = 4, name="simple", collisionGroup = None, length = 1, bHand = False, hdiv = 1, bLateralize = 0, bShrink = False, signDir=1):
+def createArm(position=(0, 0), nparts = 4, name="simple", collisionGroup = None, length = 1, bHand = False, hdiv = 1, bLateralize = 0, bShrink = False, signDir=1, bMerge=False):
     global world
     jointList = []
     d = 1
@@ -505,8 +852,8 @@ def createArm(position=(0, 0), nparts = 4, name="simple", collisionGroup = None,
         pos = tuple(map(sum,zip(position, (0, signDir*d*(l*0.5 + lsum)))))
         anchor = tuple(map(sum,zip(position, (0, signDir*d*lsum))))
 
-        if(i==0): box = createBox( pos, w, l*0.5, hdiv = hdiv, collisionGroup=-1 )
-        else: box = createBox( pos, w, l*0.5, damping=500, hdiv = hdiv, collisionGroup=collisionGroup)
+        if(i==0): box = createBox( pos, w, l*0.5, hdiv = hdiv, collisionGroup=-1, bMerge=bMerge )
+        else: box = createBox( pos, w, l*0.5, damping=500, hdiv = hdiv, collisionGroup=collisionGroup, bMerge=bMerge)
 
         box.userData["name"]="armpart"
         if(signDir < 0): box.userData["name"]="reversearmpart"
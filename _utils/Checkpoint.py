@@ -0,0 +1,158 @@
+import zlib
+import numpy as np
+import cPickle as pickle
+import Box2DWorld
+import Rollouts
+
+# *****************************************************************
+# Checkpoints of a running setup as one compressed binary blob, to resume or clone it in
+# another process. Box2D worlds cannot be pickled, so the setup is built again from its
+# Rollouts config and seed (same bodies and joints in the same order), then every body
+# gets back its pose, velocities and awake/active flags, every joint its motor and limits,
+# and the setup, robots, arms and controllers their plain Python state (targetJoints,
+# history, iforce, haptic, PID integral, trajectory tracks, random generators...).
+#
+#     blob = checkpoint(exp, {"setup": "ExpSetupNao", "kwargs": {"name": "bimanual"}}, seed)
+#     exp = restore(blob)                  # in a new world, e.g. in another process
+#
+# Not reachable from pybox2d: the solver warm start impulses of contacts and joints, the
+# order of the contact list and the sleep timers of the bodies. A restored world starts
+# without warm start and builds its contacts again in its own order, so it drifts from the
+# world it was saved from. With getWorld().warmStarting = False in both it follows it
+# exactly while the contact order does not matter (e.g. the Nao setups), but not with many
+# bodies in contact: the rope of ExpSetupDualCartPole (objBetween=4) drifts after about
+# ten steps. All the worlds restored from one blob follow each other bit for bit, in any
+# process.
+# *****************************************************************
+
+CHECKPOINT_VERSION = 1
+
+JOINT_FIELDS = ("motorSpeed", "motorEnabled", "limitEnabled", "lowerLimit", "upperLimit", "maxMotorTorque",
+                "maxMotorForce", "length", "frequency", "dampingRatio")
+RECORDED = ("ExpRobotSetup", "Robots", "Arm", "JointControl")   # modules of the objects whose state is kept
+SKIP = ("kinematics", "workspace")                              # caches rebuilt on demand
+
+
+def isPlain(v):
+    """Whether v is data that pickles on its own: numbers, strings, arrays, random generators and containers of them."""
+    if(v is None or isinstance(v, (bool, int, long, float, str, unicode, np.generic, np.ndarray, np.random.RandomState))):
+        return True
+    if(isinstance(v, (list, tuple))): return all(isPlain(x) for x in v)
+    if(isinstance(v, dict)): return all(isPlain(k) and isPlain(x) for k, x in v.items())
+    return False
+
+
+def isRecorded(v):
+    return hasattr(v, "__dict__") and getattr(v.__class__, "__module__", None) in RECORDED
+
+
+def objectState(obj, seen=None):
+    """Plain attributes of obj, and recursively the state of the recorded objects it holds (each one once)."""
+    if(seen is None): seen = set()
+    seen.add(id(obj))
+    state = {"plain": {}, "objects": {}, "lists": {}}
+    for k in sorted(vars(obj)):
+        v = getattr(obj, k)
+        if(k in SKIP): continue
+        if(isPlain(v)): state["plain"][k] = v
+        elif(isRecorded(v)):
+            if(id(v) not in seen): state["objects"][k] = objectState(v, seen)
+        elif(isinstance(v, list) and v and all(isRecorded(x) for x in v)):
+            state["lists"][k] = [objectState(x, seen) if id(x) not in seen else None for x in v]
+    return state
+
+
+def assignInPlace(cur, v):
+    """Write v into cur if both are lists, dicts, same shape arrays or generators, which other objects may
+    share (e.g. the sensor rows of a Swarm in the userData of its bodies). False if it cannot."""
+    if(isinstance(cur, np.random.RandomState) and isinstance(v, np.random.RandomState)): cur.set_state(v.get_state())
+    elif(isinstance(cur, list) and isinstance(v, list)): cur[:] = v
+    elif(isinstance(cur, dict) and isinstance(v, dict)):
+        cur.clear()
+        cur.update(v)
+    elif(isinstance(cur, np.ndarray) and isinstance(v, np.ndarray) and cur.shape == v.shape): cur[...] = v
+    else: return False
+    return True
+
+
+def assign(obj, k, v):
+    """Set attribute k, in place when possible (see assignInPlace)."""
+    if(not assignInPlace(getattr(obj, k, None), v)): setattr(obj, k, v)
+
+
+def setObjectState(obj, state):
+    for k, v in state["plain"].items(): assign(obj, k, v)
+    for k, s in state["objects"].items(): setObjectState(getattr(obj, k), s)
+    for k, states in state["lists"].items():
+        for x, s in zip(getattr(obj, k), states):
+            if(s is not None): setObjectState(x, s)
+
+
+def bodyUserData(body):
+    """Plain entries of the userData of body, without the asleep caches (recomputed)."""
+    if(body.userData is None): return None
+    return dict((k, v) for k, v in body.userData.items() if k != "asleep" and isPlain(v))
+
+
+def checkpoint(exp, config, seed):
+    """Blob of the state of exp, built by Rollouts.makeSetup(config, seed), and of the world."""
+    world = Box2DWorld.getWorld()
+    # x, y, angle, vx, vy, angular velocity, awake, active
+    bodies = np.array([(b.position[0], b.position[1], b.angle, b.linearVelocity[0], b.linearVelocity[1],
+                        b.angularVelocity, b.awake, b.active) for b in world.bodies], dtype=float)
+    joints = np.array([[float(getattr(j, f, np.nan)) for f in JOINT_FIELDS] for j in world.joints], dtype=float)
+    state = {"version": CHECKPOINT_VERSION, "config": config, "seed": seed, "nsteps": Box2DWorld.nsteps,
+             "gravity": tuple(world.gravity), "warmStarting": world.warmStarting, "bodies": bodies, "joints": joints.reshape(-1, len(JOINT_FIELDS)),
+             "userData": [bodyUserData(b) for b in world.bodies], "exp": objectState(exp)}
+    return zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+
+def load(blob):
+    """The content of a checkpoint blob."""
+    state = pickle.loads(zlib.decompress(blob))
+    if(state["version"] != CHECKPOINT_VERSION):
+        raise ValueError("checkpoint version %r, expected %d" % (state["version"], CHECKPOINT_VERSION))
+    return state
+
+
+def restore(blob):
+    """The setup of a checkpoint blob, in a new world set to the state it had."""
+    state = load(blob)
+    exp = Rollouts.makeSetup(state["config"], state["seed"])
+    world = Box2DWorld.getWorld()
+    bodies, joints = list(world.bodies), list(world.joints)
+    if(len(bodies) != len(state["bodies"]) or len(joints) != len(state["joints"])):
+        raise ValueError("checkpoint of %d bodies and %d joints, the setup has %d and %d" %
+                         (len(state["bodies"]), len(state["joints"]), len(bodies), len(joints)))
+    world.gravity, world.warmStarting = state["gravity"], state["warmStarting"]
+    for b, (x, y, angle, vx, vy, w, awake, active), userData in zip(bodies, state["bodies"], state["userData"]):
+        b.position, b.angle = (x, y), angle
+        b.linearVelocity, b.angularVelocity = (vx, vy), w
+        b.active, b.awake = bool(active), bool(awake)
+        if(userData is not None):
+            b.userData.pop("asleep", None)
+            for k, v in userData.items():
+                if(not assignInPlace(b.userData.get(k), v)): b.userData[k] = v
+    for j, values in zip(joints, state["joints"]):
+        fields = dict((f, v) for f, v in zip(JOINT_FIELDS, values) if not np.isnan(v))
+        if("lowerLimit" in fields): j.SetLimits(fields.pop("lowerLimit"), fields.pop("upperLimit"))
+        for f, v in fields.items():
+            setattr(j, f, bool(v) if f.endswith("Enabled") else v)
+    setObjectState(exp, state["exp"])
+    Box2DWorld.nsteps = state["nsteps"]
+    Box2DWorld.invalidateRays()
+    return exp
+
+
+def rollout(blob, actions, steps_per_action=1):
+    """Trajectory of Rollouts.worldState after each action (see Rollouts.rollout) from the checkpoint blob."""
+    act = Rollouts.ACTIONS[load(blob)["config"]["setup"]]
+    exp = restore(blob)
+    traj = []
+    for a in np.asarray(actions, dtype=float):
+        act(exp, a)
+        for i in range(steps_per_action):
+            Box2DWorld.step()
+            exp.update()
+        traj.append(Rollouts.worldState())
+    return np.array(traj)
@@ -0,0 +1,227 @@
+import numpy as np
+import Rollouts
+from Box2DWorld import getRNG
+
+# *****************************************************************
+# Gym style environments of the experimental setups: reset() -> obs and
+# step(action) -> (obs, reward, done, info). The observation is written in place in
+# a float32 array allocated once per environment and returned by every reset/step,
+# copy it to keep it. reset() builds the setup again in a new world, so there is one
+# environment per process (the Box2D world is global).
+#
+#     env = EpuckEnv(n=2, seed=0)
+#     obs = env.reset()
+#     obs, reward, done, info = env.step(env.action_space.sample())
+# *****************************************************************
+
+class BoxSpace(object):
+    """Box of float32 arrays between low and high (same fields as gym.spaces.Box)."""
+
+    def __init__(self, low, high, rng=None):
+        self.low = np.asarray(low, dtype=np.float32)
+        self.high = np.asarray(high, dtype=np.float32)
+        self.shape = self.low.shape
+        self.dtype = np.float32
+        self.rng = getRNG(rng)
+
+    def sample(self):
+        low = np.where(np.isinf(self.low), -1, self.low)
+        high = np.where(np.isinf(self.high), 1, self.high)
+        return self.rng.uniform(low, high).astype(np.float32)
+
+    def contains(self, x):
+        x = np.asarray(x)
+        return x.shape == self.shape and bool(np.all(x >= self.low) and np.all(x <= self.high))
+
+    def __repr__(self):
+        return "BoxSpace%s" % (self.shape,)
+
+
+class SetupEnv(object):
+    """Base class: subclasses give the setup, how to apply an action and the observation layout."""
+    setup = None
+
+    def __init__(self, seed=None, steps_per_action=1, max_steps=0, reward=None, **kwargs):
+        self.kwargs = kwargs                      # constructor arguments of the setup
+        self.seed = seed
+        self.steps_per_action = steps_per_action  # physics steps and updates per step()
+        self.max_steps = max_steps                # done after max_steps steps, never if 0
+        self.reward = reward                      # reward(env) -> float, 0 if None
+        self.exp = None
+        self.reset(seed)
+        low, high = self.observationBounds()
+        self.obs = np.zeros(len(low), dtype=np.float32)
+        self.observation_space = BoxSpace(low, high, seed)
+        self.action_space = BoxSpace(*self.actionBounds(), rng=seed)
+        self.observe(self.obs)
+
+    def reset(self, seed=None):
+        """Build the setup in a new world, seed (default the one of the constructor) drives its randomness."""
+        if(seed is None): seed = self.seed
+        self.exp = Rollouts.makeSetup({"setup": self.setup, "kwargs": self.kwargs}, seed)
+        self.nsteps = 0
+        self.afterReset()
+        self.exp.update()
+        if(hasattr(self, "obs")): self.observe(self.obs)
+        return getattr(self, "obs", None)
+
+    def step(self, action):
+        """Sensors are only updated after the last of the steps_per_action physics steps,
+        reward(env) is summed over all of them."""
+        reward = None if self.reward is None else (lambda exp: self.reward(self))
+        reward = self.exp.step_n(self.steps_per_action, self.setupAction(np.asarray(action, dtype=float)), reward)
+        self.nsteps += 1
+        self.observe(self.obs)
+        done = self.max_steps > 0 and self.nsteps >= self.max_steps
+        return self.obs, reward, done, {"steps": self.nsteps}
+
+    def afterReset(self):
+        pass
+
+    def observationBounds(self):
+        raise NotImplementedError
+
+    def actionBounds(self):
+        raise NotImplementedError
+
+    def setupAction(self, action):
+        """Action as taken by the act of the setup."""
+        return action
+
+    def observe(self, obs):
+        """Write the observation in obs."""
+        raise NotImplementedError
+
+
+def armBounds(arm):
+    """Box around the base of arm that holds every point of its bodies: each body turns around its joint,
+    so no point is further from the base than the sum of the extents of the bodies from their joints."""
+    reach = 0
+    for j in arm.jointList:
+        anchor = np.array(j.GetLocalAnchorB())
+        reach += max(np.linalg.norm(np.array(v) - anchor) for f in j.bodyB.fixtures for v in f.shape.vertices)
+    base = np.array(arm.jointList[0].anchorA)
+    return list(base - reach), list(base + reach)
+
+
+def epuckSensors(e):
+    """Value lists of the IR and gradient sensors of an epuck."""
+    return [e.IR.IRValues] + [g.GradValues for g in e.GradSensors]
+
+
+class RandallEnv(SetupEnv):
+    """ExpSetupRandall: per epuck its IRs, x and x velocity. Action: x velocity of each epuck in [-1, 1]."""
+    setup = "ExpSetupRandall"
+    speed = 1.0
+
+    def observationBounds(self):
+        low, high = [], []
+        for e in self.exp.epucks:
+            low += [0] * e.IR.nir + [-np.inf, -np.inf]
+            high += [1] * e.IR.nir + [np.inf, np.inf]
+        return low, high
+
+    def actionBounds(self):
+        n = len(self.exp.epucks)
+        return [-1] * n, [1] * n
+
+    def setupAction(self, action):
+        return self.speed * action
+
+    def observe(self, obs):
+        k = 0
+        for e in self.exp.epucks:
+            nir = e.IR.nir
+            obs[k:k + nir] = e.IR.IRValues
+            obs[k + nir] = e.body.position[0]
+            obs[k + nir + 1] = e.body.linearVelocity[0]
+            k += nir + 2
+
+
+class EpuckEnv(SetupEnv):
+    """ExpSetupEpuck: per epuck its IR, other and reward gradient sensors, x, y and angle.
+    Action: (left, right) motors of each epuck in [-1, 1]."""
+    setup = "ExpSetupEpuck"
+
+    def observationBounds(self):
+        low, high = [], []
+        for e in self.exp.epucks:
+            nsensors = sum(len(v) for v in epuckSensors(e))
+            low += [0] * nsensors + [-np.inf] * 3
+            high += [1] * nsensors + [np.inf] * 3
+        return low, high
+
+    def actionBounds(self):
+        n = 2 * len(self.exp.epucks)
+        return [-1] * n, [1] * n
+
+    def observe(self, obs):
+        k = 0
+        for e in self.exp.epucks:
+            for values in epuckSensors(e):
+                obs[k:k + len(values)] = values
+                k += len(values)
+            p = e.body.position
+            obs[k], obs[k + 1], obs[k + 2] = p[0], p[1], e.body.angle
+            k += 3
+
+
+class MultiAgentEnv(EpuckEnv):
+    """ExpSetupMultiAgent, same observations and actions as EpuckEnv."""
+    setup = "ExpSetupMultiAgent"
+
+
+class DualCartPoleEnv(SetupEnv):
+    """ExpSetupDualCartPole: per cart pole angle, x, x velocity and IR. Action: motor speed of each cart
+    within +-max_motor_speed."""
+    setup = "ExpSetupDualCartPole"
+
+    def observationBounds(self):
+        return [-np.inf] * 3 * 2 + [0] * 2, [np.inf] * 3 * 2 + [1] * 2
+
+    def actionBounds(self):
+        v = self.exp.max_motor_speed
+        return [-v, -v], [v, v]
+
+    def observe(self, obs):
+        for i, cart in enumerate(self.exp.carts):
+            obs[i] = cart.box.angle
+            obs[2 + i] = cart.circle.position[0]
+            obs[4 + i] = cart.circle.linearVelocity[0]
+            obs[6 + i] = cart.IR.IRValues[0]
+
+
+class NaoEnv(SetupEnv):
+    """ExpSetupNao: joint angles within m_mins/m_maxs, salient points within s_mins/s_maxs and the reach
+    of every arm (armBounds) and their haptic values. Action: deltaMotor (joint speeds) within dm_mins/dm_maxs.
+    Box2D joint limits are soft and collisions push joints and objects past them, the observed angles and
+    salient points are clipped to the bounds."""
+    setup = "ExpSetupNao"
+
+    def afterReset(self):
+        self.exp.setObjPos()
+
+    def observationBounds(self):
+        nao = self.exp.nao
+        nsalient = len(self.exp.salient)
+        bounds = [armBounds(arm) for arm in nao.arms]
+        lo = np.min([nao.s_mins()] + [b[0] for b in bounds], axis=0).tolist()
+        hi = np.max([nao.s_maxs()] + [b[1] for b in bounds], axis=0).tolist()
+        s_mins, s_maxs = lo * nsalient, hi * nsalient
+        return nao.m_mins() + s_mins + [0] * nsalient, nao.m_maxs() + s_maxs + [1] * nsalient
+
+    def actionBounds(self):
+        return self.exp.nao.dm_mins(), self.exp.nao.dm_maxs()
+
+    def observe(self, obs):
+        k = 0
+        for arm in self.exp.nao.arms:
+            for j in arm.jointList:
+                obs[k] = j.angle
+                k += 1
+        nsalient = len(self.exp.salient)
+        obs[k:k + 2 * nsalient] = np.ravel(self.exp.salient)
+        k += 2 * nsalient
+        space = self.observation_space
+        np.clip(obs[:k], space.low[:k], space.high[:k], out=obs[:k])
+        obs[k:k + nsalient] = self.exp.haptic[:nsalient]
@@ -0,0 +1,169 @@
+import os
+import sys
+import time
+import itertools
+import multiprocessing
+import numpy as np
+import Box2DWorld
+import Rollouts
+from ExpRobotSetup import ExpSetupDualCartPole
+
+# *****************************************************************
+# Evaluation of balancing policies of the dual cart pole over a grid of initial conditions.
+# Each condition is one headless episode in a new world: the policy maps the observation
+# (see observe) to the motor speed of each cart every physics step, and the episode ends
+# when a pole leans beyond threshold (getAngles) or after duration seconds. Episodes run
+# in a pool of processes (the Box2D world is global per process), processes=0 runs them
+# in sequence in this process. The policy has to be picklable (a module level function or
+# object) only with processes > 0 on platforms without fork.
+#
+#     conditions = conditionGrid(positions=[0, 0.3], angles=[0, 0.1, -0.1], objBetween=[1, 4])
+#     survival, stats = evaluate(PDPolicy(), conditions, duration=10.0, processes=4)
+#
+# survival is the time (seconds) each pole pair stayed up, in the order of conditions;
+# stats summarizes it overall and per value of each varied parameter.
+# *****************************************************************
+
+GRID_KEYS = ("positions", "angles", "objBetween", "objWidth", "objForce")
+SETUP_KEYS = ("objBetween", "objWidth", "objForce")       # passed to ExpSetupDualCartPole
+
+
+def pair(v):
+    """(left, right) of a value given for both carts or per cart."""
+    return tuple(v) if np.ndim(v) else (v, v)
+
+
+def conditionGrid(positions=[0], angles=[0], objBetween=[4], objWidth=[0.1], objForce=[100]):
+    """Every combination of the values: positions and angles are displacements (x) and pole angles (rad)
+    of the carts, each value for both carts or a (left, right) pair. Returns a list of condition dicts."""
+    values = [positions, angles, objBetween, objWidth, objForce]
+    return [dict(zip(GRID_KEYS, c)) for c in itertools.product(*values)]
+
+
+def observe(exp):
+    """Array of the positions (2), velocities (2), pole angles (2) and pole angular velocities (2) of the carts."""
+    obs = np.zeros(8)
+    for i, cart in enumerate(exp.carts):
+        obs[i] = cart.circle.position[0]
+        obs[2 + i] = cart.circle.linearVelocity[0]
+        obs[4 + i] = cart.box.angle
+        obs[6 + i] = cart.box.angularVelocity
+    return obs
+
+
+class PDPolicy(object):
+    """Reference controller: each cart drives under its pole, speed = -(kp angle + kd angular velocity)."""
+
+    def __init__(self, kp=200.0, kd=20.0):
+        self.kp, self.kd = kp, kd
+
+    def __call__(self, obs):
+        return -(self.kp * obs[4:6] + self.kd * obs[6:8])
+
+
+def moveBody(body, dx, pivot=None, angle=0):
+    """Shift body by dx, and rotate it by angle around pivot."""
+    p = np.array(body.position) + (dx, 0)
+    if(pivot is not None and angle != 0):
+        c, s = np.cos(angle), np.sin(angle)
+        v = p - pivot
+        p = pivot + (c * v[0] - s * v[1], s * v[0] + c * v[1])
+        body.angle += angle
+    body.position = (p[0], p[1])
+
+
+def startEpisode(condition, seed=None):
+    """ExpSetupDualCartPole of condition in a new world: carts moved by positions, poles rotated by angles
+    around their wheel, the object between them moved by the mean displacement."""
+    kwargs = dict((k, condition[k]) for k in SETUP_KEYS if k in condition)
+    exp = Rollouts.makeSetup({"setup": "ExpSetupDualCartPole", "kwargs": kwargs}, seed)
+    dxs, angles = pair(condition.get("positions", 0)), pair(condition.get("angles", 0))
+    for cart, dx, angle in zip(exp.carts, dxs, angles):
+        moveBody(cart.circle, dx)
+        moveBody(cart.box, dx, np.array(cart.circle.position), angle)
+    for body in getattr(exp, "link", []):
+        moveBody(body, np.mean(dxs))
+    Box2DWorld.invalidateRays()
+    return exp
+
+
+def runEpisode(policy, condition, duration=10.0, threshold=0.5, seed=None, bSensors=False):
+    """Seconds until a pole leans beyond threshold (duration if none does). bSensors also updates
+    the IR of the carts every step, not needed by policies of observe()."""
+    exp = startEpisode(condition, seed)
+    smax = ExpSetupDualCartPole.max_motor_speed
+    nsteps = int(round(duration / Box2DWorld.TIME_STEP))
+    for k in range(nsteps):
+        speeds = np.clip(policy(observe(exp)), -smax, smax)
+        for i in [0, 1]: exp.setMotorSpeed(i, float(speeds[i]))
+        Box2DWorld.step()
+        if(bSensors): exp.update()
+        if(max(abs(exp.carts[0].box.angle), abs(exp.carts[1].box.angle)) > threshold):
+            return (k + 1) * Box2DWorld.TIME_STEP
+    return nsteps * Box2DWorld.TIME_STEP
+
+
+workerPolicy = None        # policy of this worker process, set once by initWorker
+
+def initWorker(policy, bQuiet):
+    global workerPolicy
+    workerPolicy = policy
+    if(bQuiet): sys.stdout = open(os.devnull, "w")     # the setups print when created
+
+def episodeTask(task):
+    i, condition, kwargs = task
+    try:
+        return i, runEpisode(workerPolicy, condition, **kwargs), None
+    except Exception as e:
+        return i, np.nan, "%s: %s" % (type(e).__name__, e)
+
+
+def evaluate(policy, conditions, duration=10.0, threshold=0.5, processes=None, seed=0, bSensors=False, bQuiet=True):
+    """Survival time (seconds) of each condition and the stats dict (see evaluationStats). Episode i uses
+    seed + i, so the result does not depend on processes. processes=None uses all the cpus."""
+    if(processes is None): processes = multiprocessing.cpu_count()
+    tasks = [(i, c, {"duration": duration, "threshold": threshold, "bSensors": bSensors,
+                     "seed": None if seed is None else seed + i}) for i, c in enumerate(conditions)]
+    survival = np.full(len(conditions), np.nan)
+    errors = {}
+    tstart = time.time()
+    if(processes <= 0):
+        initWorker(policy, False)
+        results = itertools.imap(episodeTask, tasks)
+    else:
+        pool = multiprocessing.Pool(processes, initWorker, (policy, bQuiet))
+        results = pool.imap_unordered(episodeTask, tasks, chunksize=max(1, len(tasks) // (8 * processes)))
+    try:
+        for i, t, error in results:
+            survival[i] = t
+            if(error is not None): errors[i] = error
+    finally:
+        if(processes > 0):
+            pool.close()
+            pool.join()
+    stats = evaluationStats(survival, conditions, duration)
+    elapsed = time.time() - tstart
+    stats.update(seconds=round(elapsed, 3), episodes_per_s=round(len(tasks) / elapsed, 2) if elapsed > 0 else 0,
+                 processes=processes, errors=errors)
+    return survival, stats
+
+
+def evaluationStats(survival, conditions, duration):
+    """Mean, median and min survival, fraction of episodes that lasted the duration, and the mean survival
+    per value of each parameter that varies over the conditions, over the completed episodes (NaN if none)."""
+    def summary(f, x, digits=3):
+        x = x[~np.isnan(x)]
+        return round(f(x), digits) if len(x) else np.nan
+
+    stats = {"episodes": len(survival),
+             "completed": int(np.sum(~np.isnan(survival))),
+             "mean_s": summary(np.mean, survival),
+             "median_s": summary(np.median, survival),
+             "min_s": summary(np.min, survival),
+             "survived": summary(lambda x: np.mean(x >= duration - 1e-9), survival, 4),
+             "by": {}}
+    for key in GRID_KEYS:
+        values = [repr(c.get(key)) for c in conditions]
+        if(len(set(values)) < 2): continue
+        stats["by"][key] = dict((v, summary(np.mean, survival[np.array([w == v for w in values])])) for v in sorted(set(values)))
+    return stats
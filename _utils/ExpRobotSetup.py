@@ -1,12 +1,14 @@
 import numpy as np
 import Box2D
-from Box2DWorld import (world, arm, createBox, createCircle, createTri, createRope,
+import Box2DWorld
+from Box2DWorld import (arm, step, getRNG, createBox, createCircle, createTri, createRope,
                         myCreateRevoluteJoint, myCreateDistanceJoint,
-                        myCreateLinearJoint, collisions, RayCastCallback)
+                        myCreateLinearJoint, collisions, RayCastCallback, invalidateRays, cachedAsleep)
 
 from VectorFigUtils import vnorm, dist
-from Robots import NaoRobot, CartPole, Epuck
-import random
+from Robots import NaoRobot, CartPole, Epuck, Swarm, MotorDrive, updateIRs
+from Profiling import profiled
+from Scene import loadScene
 
 
 # put some walls independant of the screen; beacuse screen is defined in PyGame
@@ -36,21 +38,70 @@ def addReward(who, pos=(0,0), vel=(0,0), reward_type=0, bDynamic=True, bCollideN
     who.objs.append(obj)
 
 
+def contactPoints(body):
+    """First world point of each contact of the body, leaving out the (0, 0) of contacts not touching."""
+    points = [c.contact.worldManifold.points[0] for c in body.contacts]
+    return [(p[0], p[1]) for p in points if vnorm(p) >= 0.01]
+
+
+def updateGradients(e, epucks, objs):
+    """Gradient sensors of the epuck e: the other epucks, the first reward of objs and the last one."""
+    pos, angle = e.getPosition(), e.getAngle()
+    for g in e.GradSensors:
+        if(g.name == "other"):
+            centers = [o.getPosition() for o in epucks if o != e]
+            g.update(pos, angle, centers)
+        elif(g.name == "reward"):
+            centers = [o.position for o in objs[:1]]
+            g.update(pos, angle, centers)
+            centers = [o.position for o in objs[-1:]]
+            g.update(pos, angle, centers, extremes=1)
+
+
+# *****************************************************************
+# Common stepping of the experimental setups
+# *****************************************************************
+
+class ExpSetup(object):
+    """Base of the setups: act applies an action to the actuators, control updates only the
+    actuators (motors, controllers) and update the actuators plus all the sensors."""
+
+    def act(self, action):
+        raise NotImplementedError
+
+    def control(self):
+        pass
+
+    def step_n(self, k=1, action=None, reward=None):
+        """Apply action (if not None) and advance k physics steps. Only the actuators are updated after
+        the first k-1 steps, sensors and salient points after the last one. reward(exp) is summed
+        over the k steps and returned, 0 if not given."""
+        if(action is not None): self.act(action)
+        total = 0.0
+        for i in range(k):
+            step()
+            if(i < k - 1): self.control()
+            else: self.update()
+            if(reward is not None): total += reward(self)
+        return total
+
+
 # *****************************************************************
 # Experimental Setup Randall 1D Agent
 # *****************************************************************
 
 
-class ExpSetupRandall():
+class ExpSetupRandall(ExpSetup):
     """Experimental setup including 2 agents in a 1D horizontal line."""
 
-    def __init__(self, n=2, radius=0.2, frontIR=12, debug=False):
+    def __init__(self, n=2, radius=0.2, frontIR=12, debug=False, seed=None):
         global bDebug
         bDebug = debug
+        self.rng = getRNG(seed)
         print "-------------------------------------------------"
         self.yini = -1.2
         self.radius = radius
-        world.gravity = Box2D.b2Vec2(0, -1.01)
+        Box2DWorld.getWorld().gravity = Box2D.b2Vec2(0, -1.01)
         self.epucks = [Epuck(position=[-1 + 2 * i, self.yini], frontIR=frontIR, bHorizontal=True) for i in range(n)]
 
         for e in self.epucks:
@@ -79,16 +130,27 @@ class ExpSetupRandall():
     def clearOcclusion(self):
         """Clears the occulsion box."""
         if(self.box is not None):
-            world.DestroyBody(self.box)
+            Box2DWorld.getWorld().DestroyBody(self.box)
+            invalidateRays()
         self.box = None
 
-    def update(self):
-        epucks = self.epucks
-        for e in epucks:
-            e.update()
+    def control(self):
+        for e in self.epucks:
+            e.update(bIR=False)
             x, y = e.body.position
             e.body.position = [x, self.yini]
 
+    @profiled("ExpSetupRandall.update")
+    def update(self):
+        sensors = [(e.IR, e.body.position, e.body.angle, e.r) for e in self.epucks]
+        self.control()
+        updateIRs(sensors)
+
+    def act(self, velocities):
+        """Horizontal velocity of each epuck (horizontal epucks do not use their motors)."""
+        for i, v in enumerate(velocities):
+            self.setVelocity(epuck=i, vel=[v, 0])
+
     def setVelocity(self, epuck=0, vel=[0,0]):
         self.epucks[epuck].body.linearVelocity = vel
 
@@ -112,60 +174,99 @@ class ExpSetupRandall():
 # Experimental Setup Epuck
 # *****************************************************************
 
-class ExpSetupEpuck(object):
+class ExpSetupEpuck(ExpSetup):
     """Exp setup class with two epucks and two reward sites."""
 
-    def __init__(self, n=1, debug=False):
-        """Create the two epucks, two rewards and walls."""
+    def __init__(self, n=1, drive="velocity", debug=False, seed=None):
+        """Create the two epucks, two rewards and walls, drive is the MotorDrive mode of the epucks."""
         global bDebug
         bDebug = debug
+        self.rng = getRNG(seed)
         print "-------------------------------------------------"
         th = .2
         positions = [(-3, 2 + th), (3, 2 + th)]
         angles = [2 * np.pi, np.pi]
         self.epucks = [Epuck(position=positions[i], angle=angles[i], frontIR=0, nother=2, nrewsensors=4) for i in range(n)]
+        self.drive = MotorDrive([e.body for e in self.epucks], drive)
         addWalls((0, 0), dx=3.75, dh=0.1, h=3, th=th)
         self.objs = []
         addReward(self, pos=(0, 4 + th), vel=(0, 0), bDynamic=False, bCollideNoOne=True)
         addReward(self, pos=(0, 0 + th), vel=(0, 0), reward_type=1, bDynamic=False, bCollideNoOne=True)
 
+    def control(self):
+        self.drive.apply([e.motors for e in self.epucks])
+
+    def act(self, motors):
+        """(left, right) motors of each epuck, as pairs or flat."""
+        for i, m in enumerate(np.reshape(motors, (-1, 2))):
+            self.epucks[i].motors = list(m)
+
+    @profiled("ExpSetupEpuck.update")
     def update(self):
         """Update of epucks positions and gradient sensors: other and reward."""
+        self.control()
+        self.updateSensors()
+
+    def updateSensors(self):
         for e in self.epucks:
-            e.update()
-            pos = e.getPosition()
+            e.updateIR()
+            reach = max([g.maxd for g in e.GradSensors] + [0])
+            cachedAsleep(e.body, "gradients", lambda body: updateGradients(e, self.epucks, self.objs), radius=reach)
+
+    def setMotors(self, epuck=0, motors=[10, 10]):
+        self.epucks[epuck].motors = motors
 
-            for g in e.GradSensors:
-                if(g.name == "other"):
-                    centers = [o.getPosition() for o in self.epucks if o != e]
-                    g.update(pos, e.getAngle(), centers)
-                elif(g.name == "reward"):
-                    centers = [o.position for o in self.objs[:1]]
-                    g.update(pos, e.getAngle(), centers)
-                    centers = [o.position for o in self.objs[-1:]]
-                    g.update(pos, e.getAngle(), centers, extremes=1)
 
+# *****************************************************************
+# Experimental Setup from a declarative scene
+# *****************************************************************
 
+class ExpSetupScene(ExpSetupEpuck):
+    """Setup built from a scene (see Scene): its epucks act and sense as in ExpSetupEpuck, with the bodies
+    named reward* as the rewards of their gradient sensors, and its cart poles and Nao are updated."""
 
-    def setMotors(self, epuck=0, motors=[10, 10]):
-        self.epucks[epuck].motors = motors
+    def __init__(self, scene="epuck.json", drive="velocity", cache=None, debug=False, seed=None):
+        """scene is a scene dict or JSON file name, cache an optional directory of parsed scenes."""
+        global bDebug
+        bDebug = debug
+        self.rng = getRNG(seed)
+        self.scene = loadScene(scene, cache)
+        self.epucks = self.scene.robots("Epuck")
+        self.carts = self.scene.robots("CartPole")
+        naos = self.scene.robots("NaoRobot")
+        self.nao = naos[0] if naos else None
+        self.objs = [b for b in self.scene.bodies() if b.userData.get("name", "").startswith("reward")]
+        self.drive = MotorDrive([e.body for e in self.epucks], drive)
+
+    @profiled("ExpSetupScene.update")
+    def update(self):
+        self.control()
+        self.updateSensors()
+        for cart in self.carts: cart.update()
+        if(self.nao is not None): self.nao.update()
 
 
 # *****************************************************************
 # Experimental Setup Class : Dual CartPole holding object
 # *****************************************************************
 
-class ExpSetupDualCartPole:
+class ExpSetupDualCartPole(ExpSetup):
 
     max_motor_speed = 30
 
-    def __init__(self, xshift=0, salientMode="center", name="simple", debug = False, objBetween = 4, objWidth = 0.1, objForce=100, bSelfCollisions=True):
-        global world, bDebug
+    def __init__(self, xshift=0, salientMode="center", name="simple", debug = False, objBetween = 4, objWidth = 0.1, objForce=100, bSelfCollisions=True, seed=None,
+                 ropeParts=10, ropeJoint="distance", bRopeSelfCollide=True, ropeDensity=0.1):
+        """objBetween=4 links the carts with a rope of ropeParts+1 segments of ropeDensity joined by ropeJoint (see
+        Box2DWorld.createRope), bRopeSelfCollide=False keeps its segments from colliding with each other."""
+        global bDebug
         bDebug = debug
+        if(objBetween == 4 and objWidth > 0 and ropeParts < 2):
+            raise ValueError("ropeParts is %r, the rope between the carts needs at least 2" % (ropeParts,))
+        self.rng = getRNG(seed)
         print "-------------------------------------------------"
         print "Created Exp Dual Cart Pole Setup ", name, "Debug: ", bDebug
 
-        world.gravity = Box2D.b2Vec2(0, -250)
+        Box2DWorld.getWorld().gravity = Box2D.b2Vec2(0, -250)
 
         self.name = name
         self.salient = []
@@ -199,7 +300,9 @@ class ExpSetupDualCartPole:
                     self.jointright = myCreateRevoluteJoint(bodyright,bodyB, (xshift+1.95*objLong,y+objWidth/2.0-dy),lowerAngle = -2*np.pi, upperAngle = 2*np.pi)
             elif(objBetween == 4):
                 pini = (bodyleft.position[0] + 0.8, bodyleft.position[1])
-                rbodies, rlinks = createRope(pini, 10, r=0.1, density=0.1)
+                spacing = 1.55 * 9 / (ropeParts - 1)        # the same length between the carts for any ropeParts
+                rbodies, rlinks = createRope(pini, ropeParts, r=0.1, density=ropeDensity, joint=ropeJoint, spacing=spacing,
+                                             collisionGroup=None if bRopeSelfCollide else -3)
                 self.link = rbodies
                 myCreateDistanceJoint(bodyleft, rbodies[0], dx=0.8)
                 myCreateDistanceJoint(bodyright, rbodies[-1], dx=-0.8)
@@ -212,10 +315,16 @@ class ExpSetupDualCartPole:
         if(bDebug):
             print "Exp Setup created", "salient points: ", self.salient
 
+    @profiled("ExpSetupDualCartPole.update")
     def update(self):
         for i in [0, 1]:
             self.carts[i].update()
 
+    def act(self, speeds):
+        """Motor speed of each cart."""
+        for i in [0, 1]:
+            self.setMotorSpeed(i, speeds[i])
+
     def addWalls(self, pos):
         """Limits of the world. Also defined globaly!!! """
         x, y = pos
@@ -300,19 +409,21 @@ class ExpSetupDualCartPole:
 # *****************************************************************
 
 
-class ExpSetupNao:
+class ExpSetupNao(ExpSetup):
     max_motor_speed = 30
 
-    def __init__(self, pos_obj = (0,1.3), pos_nao = (0,0), obj_type = "circle", salientMode = "center", name="bimanual", debug = False, bTwoArms=True, bSelfCollisions=True):
+    def __init__(self, pos_obj = (0,1.3), pos_nao = (0,0), obj_type = "circle", salientMode = "center", name="bimanual", debug = False, bTwoArms=True, bSelfCollisions=True, seed=None):
         global bDebug
         bDebug = debug
+        self.rng = getRNG(seed)
         print "-------------------------------------------------------------"
         print "Created Exp Bimanual Setup: ", name, "Debug: ", bDebug, "Object"
         self.name = name.lower()
         self.dm_lim = 1
         self.v_lim = 0.3
 
-        self.salient = []
+        self.salient = np.zeros((0, 2))    # salient points, updated in place (see updateSalient)
+        self.bSalientDirty = True           # the world moved since they were computed
         self.haptic = []
         self.obj_type = obj_type
 
@@ -336,7 +447,7 @@ class ExpSetupNao:
             self.boxA = createBox([-0.8, 1.5], w=w, h=w, bDynamic=False, bCollideNoOne=True, name="boxA") 
             self.boxB = createBox([0.8, 1.5], w=w, h=w, bDynamic=False, bCollideNoOne=True, name="boxB") 
 
-        self.nao = NaoRobot(pos_nao, name=self.name_robot, bTwoArms=bTwoArms, bOppositeArms=bOppositeArms, collisionGroup=collisionGroup)
+        self.nao = NaoRobot(pos_nao, name=self.name_robot, bTwoArms=bTwoArms, bOppositeArms=bOppositeArms, collisionGroup=collisionGroup, rng=self.rng)
         self.arms = self.nao.arms
 
         self.ini_obj_pos = pos_obj
@@ -395,12 +506,13 @@ class ExpSetupNao:
         else:
             self.obj.position = obj_pos
         self.nao.restPosition(online=False)
+        self.bSalientDirty = True
 
     def getSalient(self):
+        if(self.bSalientDirty): self.updateSalient()
         return self.salient
 
     def getSalientType(self, i):
-        self.update()
         narms = len(self.nao.arms)
         leftsalient = len(self.nao.arms[0].salient)
         if(i < leftsalient):
@@ -409,45 +521,57 @@ class ExpSetupNao:
             return "right"
         return "obj"
 
-    def updateSalient(self):
-        naosalient = self.nao.getSalient()
-        self.salient = [s for s in naosalient]
+    # number of salient points of the object per salientMode, for a circle and for a box
+    obj_salient = {"center": (1, 1), "laterals": (3, 3), "minimum": (1, 2), "all": (1, 9)}
 
-        if(self.obj_type not in ["box", "circle"]):
-            return
+    def objSalientCount(self):
+        if(self.obj_type not in ["box", "circle"]): return 0
+        return self.obj_salient.get(self.salientMode, (0, 0))[self.obj_type == "box"]
 
-        b = self.obj.position
-        b = [round(e, 2) for e in b]
-        body = self.obj
-        shape = self.obj.fixtures[-1].shape
+    @profiled("ExpSetupNao.updateSalient")
+    def updateSalient(self):
+        """Salient points of the arms then of the object, written in place in the array self.salient (n, 2).
+        The array is only allocated again when the number of points changes."""
+        n = sum(len(a.salient) for a in self.nao.arms) + self.objSalientCount()
+        if(len(self.salient) != n):
+            self.salient = np.zeros((n, 2))
+        S = self.salient
+        k = 0
+        for a in self.nao.arms:
+            if(a.salient):
+                S[k:k + len(a.salient)] = a.salient
+                k += len(a.salient)
+        self.bSalientDirty = False
+        if(k < n):
+            S[k:] = cachedAsleep(self.obj, ("salient", self.salientMode), self.objSalient)
+
+    def objSalient(self, body):
+        """Salient points (m, 2) of the object body for the salientMode."""
+        S = np.zeros((self.objSalientCount(), 2))
+        b = body.position
+        S[0] = (round(b[0], 2), round(b[1], 2))
+        shape = body.fixtures[-1].shape
+        if(self.obj_type == "circle"):
+            if(self.salientMode == "laterals"):
+                S[1] = (S[0, 0] - shape.radius, S[0, 1])
+                S[2] = (S[0, 0] + shape.radius, S[0, 1])
+            return S
 
         if(self.salientMode == "center"):
-            self.salient += [(b[0], b[1])]
-        elif(self.salientMode == "laterals"):
-            if(self.obj_type == "circle"):
-                self.salient += [(b[0], b[1])]
-                self.salient += [(b[0] - shape.radius,b[1])]
-                self.salient += [(b[0] + shape.radius,b[1])]
-            if(self.obj_type == "box"):
-                v = [body.transform * v for v in shape.vertices]
-                self.salient += [(b[0],b[1])]
-                self.salient += [(v[1] + v[2])/2.0]
-                self.salient += [(v[0] + v[3])/2.0]
+            return S
+        v = [body.transform * v for v in shape.vertices]
+        if(self.salientMode == "laterals"):
+            S[1] = (v[1] + v[2]) / 2.0
+            S[2] = (v[0] + v[3]) / 2.0
         elif(self.salientMode == "minimum"):
-            self.salient += [(b[0], b[1])]
-            if(self.obj_type == "box"):
-                v = [body.transform * v for v in shape.vertices]
-                self.salient += [[v[0][0], v[0][1]]]
+            S[1] = v[0]
         elif(self.salientMode == "all"):
-            self.salient += [(b[0], b[1])]
-            if(self.obj_type == "box"):
-                v = [body.transform * v for v in shape.vertices]
-                for p in v:
-                    self.salient += [p]
-                self.salient += [(v[1] + v[2]) / 2.0]
-                self.salient += [(v[0] + v[3]) / 2.0]
-                self.salient += [(v[2] + v[3]) / 2.0]
-                self.salient += [(v[0] + v[1]) / 2.0]
+            S[1:5] = v
+            S[5] = (v[1] + v[2]) / 2.0
+            S[6] = (v[0] + v[3]) / 2.0
+            S[7] = (v[2] + v[3]) / 2.0
+            S[8] = (v[0] + v[1]) / 2.0
+        return S
 
     def getFinalHaptic(self, arm=0):
         """First salient is always the end point."""
@@ -457,11 +581,13 @@ class ExpSetupNao:
             i = len(self.nao.arms[0].salient)
         return self.haptic[i]
 
+    @profiled("ExpSetupNao.updateHaptic")
     def updateHaptic(self):
         if(len(self.haptic) < len(self.salient)):
             self.haptic = [0] * len(self.salient)
         maxd = 0.5
         dt = 1.3
+        contacts = cachedAsleep(self.obj, "contacts", contactPoints)
         for i, s in enumerate(self.salient):
             sbox = (s[0], s[1])
             mind = maxd
@@ -469,22 +595,28 @@ class ExpSetupNao:
                 self.haptic[i] /= dt
             else:
                 self.haptic[i] = 0
-            for c in self.obj.contacts:
-                cpos = c.contact.worldManifold.points[0]
-                if(vnorm(cpos) < 0.01):
-                    continue
+            for cpos in contacts:
                 d = dist(cpos, sbox)
                 if(d < maxd and d < mind):
                     mind = d
                     h = 1 - d / maxd
                     self.haptic[i] = h
 
+    def control(self, iarm=-1):
+        self.bSalientDirty = True
+        return self.nao.update(iarm=iarm)
+
+    @profiled("ExpSetupNao.update")
     def update(self, iarm=-1):
-        err = self.nao.update(iarm=arm)
+        err = self.control(iarm)
         self.updateSalient()
         self.updateHaptic()
         return err
 
+    def act(self, dm):
+        """deltaMotor of all the joints."""
+        self.deltaMotor(list(dm))
+
     def getObjLine(self):
         b = self.obj.position
         b = (b[0], b[1])
@@ -501,7 +633,6 @@ class ExpSetupNao:
         self.update()
 
     def getObjPos(self, bAngle=False, PPM=1):
-        self.update()
         p = self.obj.position
         p = [PPM * round(p[0], 2), PPM * round(p[1], 2)]
         if(bAngle):
@@ -538,40 +669,43 @@ class ExpSetupNao:
 # Experimental Setup MultiAgent
 # *****************************************************************
 
-class ExpSetupMultiAgent(object):
+class ExpSetupMultiAgent(ExpSetup):
     """Exp setup class with two epucks and two reward sites."""
 
-    def __init__(self, n=1, debug=False):
-        """Create the two epucks, two rewards and walls."""
+    def __init__(self, n=1, drive="velocity", debug=False, seed=None):
+        """Create the n epucks at random positions, two rewards and walls, drive is the MotorDrive mode of the epucks."""
         global bDebug
         bDebug = debug
+        self.rng = getRNG(seed)
         print "-------------------------------------------------"
         th = .2
 
-        positions = [ (random.uniform(-5,5), random.uniform(-1,3)) for i in range(n)]
+        positions = [ (self.rng.uniform(-5,5), self.rng.uniform(-1,3)) for i in range(n)]
 
-        angles = [random.uniform(0,2*np.pi) for i in range(n)]
+        angles = [self.rng.uniform(0,2*np.pi) for i in range(n)]
         self.epucks = [Epuck(position=positions[i], angle=angles[i], frontIR=0, nother=2, nrewsensors=4) for i in range(n)]
+        self.drive = MotorDrive([e.body for e in self.epucks], drive)
 
         self.objs = []
         addReward(self, pos=(0, 4 + th), vel=(0, 0), bDynamic=False, bCollideNoOne=True)
         addReward(self, pos=(0, 0 + th), vel=(0, 0), reward_type=1, bDynamic=False, bCollideNoOne=True)
 
+    def control(self):
+        self.drive.apply([e.motors for e in self.epucks])
+
+    def act(self, motors):
+        """(left, right) motors of each epuck, as pairs or flat."""
+        for i, m in enumerate(np.reshape(motors, (-1, 2))):
+            self.epucks[i].motors = list(m)
+
+    @profiled("ExpSetupMultiAgent.update")
     def update(self):
         """Update of epucks positions and gradient sensors: other and reward."""
+        self.control()
         for e in self.epucks:
-            e.update()
-            pos = e.getPosition()
-
-            for g in e.GradSensors:
-                if(g.name == "other"):
-                    centers = [o.getPosition() for o in self.epucks if o != e]
-                    g.update(pos, e.getAngle(), centers)
-                elif(g.name == "reward"):
-                    centers = [o.position for o in self.objs[:1]]
-                    g.update(pos, e.getAngle(), centers)
-                    centers = [o.position for o in self.objs[-1:]]
-                    g.update(pos, e.getAngle(), centers, extremes=1)
+            e.updateIR()
+            reach = max([g.maxd for g in e.GradSensors] + [0])
+            cachedAsleep(e.body, "gradients", lambda body: updateGradients(e, self.epucks, self.objs), radius=reach)
 
 
 
@@ -580,4 +714,51 @@ class ExpSetupMultiAgent(object):
 
 
 
+# *****************************************************************
+# Experimental Setup Swarm
+# *****************************************************************
+
+class ExpSetupSwarm(ExpSetup):
+    """Exp setup with a swarm of n epucks (1000s) in a square arena with two reward sites. The state of the
+    epucks is kept in the arrays of a Swarm: exp.swarm.pos, angle, motors, ir, other and reward."""
+
+    def __init__(self, n=1000, density=0.25, r=0.2, nir=6, nother=2, nrewsensors=4, drive="velocity", debug=False, seed=None):
+        """n epucks on random cells of a grid (no overlaps) of density epucks per unit of area, drive is the
+        MotorDrive mode of the epucks."""
+        global bDebug
+        bDebug = debug
+        self.rng = getRNG(seed)
+        print "-------------------------------------------------"
+        self.side = np.sqrt(n / float(density))
+        half, wl = self.side / 2.0, 0.2
+        for (x, y), (w, h), name in [((0, -half - wl), (half + 2 * wl, wl), "wall_top"), ((0, half + wl), (half + 2 * wl, wl), "wall_bottom"),
+                                     ((-half - wl, 0), (wl, half), "wall_left"), ((half + wl, 0), (wl, half), "wall_right")]:
+            createBox((x, y), w=w, h=h, bDynamic=False, name=name)
+
+        k = int(np.ceil(np.sqrt(n)))
+        cell = self.side / k
+        cells = self.rng.permutation(k * k)[:n]
+        jitter = self.rng.uniform(-1, 1, (n, 2)) * max(0, cell / 2.0 - r)
+        positions = np.column_stack((cells % k, cells // k)) * cell - half + cell / 2.0 + jitter
+        angles = self.rng.uniform(0, 2 * np.pi, n)
+        self.swarm = Swarm(positions, angles, r=r, nir=nir, nother=nother, nrewsensors=nrewsensors, drive=drive)
 
+        self.objs = []
+        addReward(self, pos=(0, half / 2.0), vel=(0, 0), bDynamic=False, bCollideNoOne=True)
+        addReward(self, pos=(0, -half / 2.0), vel=(0, 0), reward_type=1, bDynamic=False, bCollideNoOne=True)
+        self.rewards = np.array([(o.position[0], o.position[1]) for o in self.objs])
+
+    def control(self):
+        self.swarm.readState()
+        self.swarm.applyMotors()
+
+    def act(self, motors):
+        """(left, right) motors of each epuck, as an array (n, 2) or flat."""
+        self.swarm.motors[:] = np.reshape(motors, (-1, 2))
+
+    @profiled("ExpSetupSwarm.update")
+    def update(self):
+        self.swarm.update(self.rewards)
+
+    def setMotors(self, epuck=0, motors=[10, 10]):
+        self.swarm.motors[epuck] = motors
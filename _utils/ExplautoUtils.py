@@ -3,11 +3,14 @@ import numpy as np
 from explauto import Environment
 from explauto import SensorimotorModel
 from explauto import InterestModel
+from scipy.spatial import cKDTree       # explauto needs scipy anyway
+from Box2DWorld import getRNG
 
 class myEnvironment(Environment):
 
-    def __init__(self, m_mins, m_maxs, s_mins, s_maxs):
+    def __init__(self, m_mins, m_maxs, s_mins, s_maxs, rng=None):
         Environment.__init__(self, m_mins, m_maxs, s_mins, s_maxs)
+        self.rng = getRNG(rng)     # seed or RandomState for reproducible random inputs
         
     def compute_motor_command(self, m_values):
         return bounds_min_max(m_values, self.conf.m_mins, self.conf.m_maxs)
@@ -19,14 +22,14 @@ class myEnvironment(Environment):
         m_mins = self.conf.m_mins
         m_maxs = self.conf.m_maxs
         l = len(m_mins)
-        m = [round(r*(m_maxs[i]-m_mins[i])+m_mins[i],2) for i,r in enumerate(np.random.rand(l))]
+        m = [round(r*(m_maxs[i]-m_mins[i])+m_mins[i],2) for i,r in enumerate(self.rng.rand(l))]
         return m
 
     def getRandomOutput(self):
         s_mins = self.conf.s_mins
-        s_maxs = self.conf.s_mins
+        s_maxs = self.conf.s_maxs
         l = len(s_mins)
-        s = [r*(s_maxs[i]-s_mins[i])+s_mins[i] for i,r in enumerate(np.random.rand(l))]
+        s = [r*(s_maxs[i]-s_mins[i])+s_mins[i] for i,r in enumerate(self.rng.rand(l))]
         return s
 
 
@@ -39,20 +42,99 @@ class mySMmodel(object):
         self.fms.update(m,s)
 
     def fwd_prediction(self,m):
-    	fms.mode = "exploit" 
-        res = fms.forward_prediction(m)
-    	fms.mode = "explore" 
+        self.fms.mode = "exploit"
+        res = self.fms.forward_prediction(m)
+        self.fms.mode = "explore"
         return res
 
     def inv_prediction(self,s):
-    	fms.mode = "exploit" 
-        res = fms.inverse_prediction(s)
-    	fms.mode = "explore" 
+        self.fms.mode = "exploit"
+        res = self.fms.inverse_prediction(s)
+        self.fms.mode = "explore"
         return res
 
 
+# ********************************************
+# Batched nearest neighbor sensorimotor model: same predictions as mySMmodel (explauto's
+# nearest_neighbor in exploit mode) but samples are added and queried as 2D arrays.
+# explauto rebuilds its KD-tree over all the samples after every update. Here the samples
+# are indexed by a few KD-trees over consecutive runs of samples of doubling sizes, plus a
+# short tail searched by brute force: an update only builds the tree of the newest samples
+# and merges it with the previous ones of similar size (amortized O(log^2 n) per sample).
+
+class NNIndex(object):
+    """Nearest neighbor index of the rows of a growing array."""
+
+    def __init__(self, dim, tail=256):
+        self.X = np.zeros((1024, dim))
+        self.n = 0
+        self.tail = tail          # newest samples searched by brute force
+        self.trees = []           # (start, end, cKDTree of X[start:end]), sizes decreasing
+
+    def add(self, X):
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        if(self.n + len(X) > len(self.X)):
+            grown = np.zeros((max(2 * len(self.X), self.n + len(X)), self.X.shape[1]))
+            grown[:self.n] = self.X[:self.n]
+            self.X = grown
+        self.X[self.n:self.n + len(X)] = X
+        self.n += len(X)
+        indexed = self.trees[-1][1] if self.trees else 0
+        if(self.n - indexed >= self.tail):
+            start = indexed
+            while(self.trees and self.trees[-1][1] - self.trees[-1][0] <= self.n - start):
+                start = self.trees.pop()[0]       # merge with the previous tree of similar size
+            self.trees.append((start, self.n, cKDTree(self.X[start:self.n])))
+
+    def query(self, Q):
+        """Index of the nearest stored row to each row of Q."""
+        Q = np.atleast_2d(np.asarray(Q, dtype=float))
+        best = np.full(len(Q), np.inf)
+        ibest = np.zeros(len(Q), dtype=int)
+        for start, end, tree in self.trees:
+            d, i = tree.query(Q)
+            closer = d < best
+            best[closer], ibest[closer] = d[closer], i[closer] + start
+        start = self.trees[-1][1] if self.trees else 0
+        if(start < self.n):
+            d = np.sqrt(((Q[:, np.newaxis, :] - self.X[np.newaxis, start:self.n, :]) ** 2).sum(axis=2))
+            i = np.argmin(d, axis=1)
+            d = d[np.arange(len(Q)), i]
+            closer = d < best
+            best[closer], ibest[closer] = d[closer], i[closer] + start
+        return ibest
+
+
+class BatchSMmodel(object):
+    """Nearest neighbor forward and inverse models over motor and sensory arrays."""
+
+    def __init__(self, env, tail=256):
+        self.m_dims, self.s_dims = len(env.conf.m_mins), len(env.conf.s_mins)
+        self.mIndex = NNIndex(self.m_dims, tail)
+        self.sIndex = NNIndex(self.s_dims, tail)
+
+    def size(self):
+        return self.mIndex.n
 
+    def update(self,m,s):
+        self.update_many([m], [s])
+
+    def update_many(self, M, S):
+        """Add the samples (M[k], S[k]), arrays (n, m_dims) and (n, s_dims)."""
+        M, S = np.atleast_2d(M), np.atleast_2d(S)
+        if(len(M) != len(S)): raise ValueError("%d motor and %d sensory samples" % (len(M), len(S)))
+        self.mIndex.add(M)
+        self.sIndex.add(S)
+
+    def predict_many(self, X, inverse=False):
+        """Sensory outcome of the nearest stored motor command of each row of X, or with inverse=True
+        the motor command of the nearest stored sensory outcome."""
+        if(self.size() == 0): raise ValueError("the model has no samples yet")
+        query, out = (self.sIndex, self.mIndex) if inverse else (self.mIndex, self.sIndex)
+        return out.X[query.query(X)]
 
+    def fwd_prediction(self,m):
+        return self.predict_many([m])[0]
 
-
-
+    def inv_prediction(self,s):
+        return self.predict_many([s], inverse=True)[0]
@@ -0,0 +1,188 @@
+import sys
+import time
+import multiprocessing
+import numpy as np
+import Rollouts
+from Box2DWorld import getRNG
+from ExplautoUtils import myEnvironment, mySMmodel
+
+# *****************************************************************
+# Goal babbling with the simulation and the learning pipelined.
+# Every worker process owns a world with the setup (the Box2D world is global per
+# process, threads would share it) and always has a second batch of motor commands
+# queued, so it never waits for the learner. Meanwhile the main process updates the
+# model with the results that came back and infers the motor commands of the next
+# batch of goals. With processes=0 everything runs in sequence in this process.
+#
+#     gb = GoalBabbling({"setup": "ExpSetupNao", "kwargs": {"name": "bimanual"}}, processes=4)
+#     stats = gb.run(2000)        # {"samples_per_s": ..., "coverage": ...}
+# *****************************************************************
+
+NAO = {"setup": "ExpSetupNao", "kwargs": {"name": "bimanual"}}
+
+
+def bounds(nao, iarm=0):
+    """m_mins, m_maxs, s_mins, s_maxs of one arm of the robot, or both with iarm=-1."""
+    limits = nao.getJointLimits(iarm)
+    narms = 2 if iarm < 0 else 1
+    return ([l[0] for l in limits], [l[1] for l in limits], nao.s_mins() * narms, nao.s_maxs() * narms)
+
+def simulate(nao, M, iarm=0):
+    """Sensory outcome (final position of the hand) of reaching each motor command in turn."""
+    return np.array([nao.gotoTargetJoints(list(m), iarm=iarm) for m in M], dtype=float)
+
+
+def worker(wid, config, seed, iarm, tasks, results):
+    try:
+        exp = Rollouts.makeSetup(config, seed)
+        results.put(("ready", wid, bounds(exp.nao, iarm)))
+        while True:
+            task = tasks.get()
+            if(task is None): break
+            ibatch, M = task
+            results.put(("done", wid, (ibatch, M, simulate(exp.nao, M, iarm))))
+    except Exception as e:
+        results.put(("error", wid, "%s: %s" % (type(e).__name__, e)))
+
+
+class Coverage(object):
+    """Fraction of the cells of a grid over [s_mins, s_maxs] where some outcome fell."""
+
+    def __init__(self, s_mins, s_maxs, bins=20):
+        self.mins, self.maxs = np.array(s_mins, dtype=float), np.array(s_maxs, dtype=float)
+        self.bins = bins
+        self.visited = np.zeros(bins ** len(s_mins), dtype=bool)
+
+    def add(self, S):
+        S = np.atleast_2d(S)
+        cells = ((S - self.mins) / (self.maxs - self.mins) * self.bins).astype(int)
+        cells = cells[np.all((cells >= 0) & (cells < self.bins), axis=1)]
+        if(len(cells)): self.visited[np.ravel_multi_index(cells.T, (self.bins,) * S.shape[1])] = True
+
+    def value(self):
+        return self.visited.mean()
+
+
+class GoalBabbling(object):
+    """Random goals in the sensory space, reached through the inverse model plus exploration noise."""
+
+    def __init__(self, config=NAO, iarm=0, processes=2, batch=16, model=None, bootstrap=64,
+                 sigma_explo_ratio=0.1, random_motor=0.1, seed=None, verbose=True):
+        self.config, self.iarm = config, iarm
+        self.processes, self.batch = processes, batch
+        self.model = model                    # mySMmodel of the environment unless given
+        self.bootstrap = bootstrap            # first samples with random motor commands
+        self.sigma_explo_ratio = sigma_explo_ratio
+        self.random_motor = random_motor      # probability of a random motor command afterwards
+        self.seed = seed
+        self.rng = getRNG(seed)
+        self.verbose = verbose
+        self.M, self.S = [], []
+
+    def setBounds(self, b):
+        self.m_mins, self.m_maxs, self.s_mins, self.s_maxs = [np.array(v, dtype=float) for v in b]
+        self.env = myEnvironment(*b, rng=self.rng)
+        if(self.model is None): self.model = mySMmodel(self.env)
+        self.coverage = Coverage(self.s_mins, self.s_maxs)
+
+    def nextBatch(self):
+        """Motor commands of the next batch: random while bootstrapping, else inverse model of random goals."""
+        n, dims = self.batch, len(self.m_mins)
+        M = self.rng.uniform(self.m_mins, self.m_maxs, (n, dims))
+        if(self.nupdated < self.bootstrap): return M
+        goals = self.rng.uniform(self.s_mins, self.s_maxs, (n, len(self.s_mins)))
+        if(hasattr(self.model, "predict_many")): inv = self.model.predict_many(goals, inverse=True)
+        else: inv = np.array([self.model.inv_prediction(g) for g in goals])
+        inv = inv + self.rng.normal(0, 1, inv.shape) * self.sigma_explo_ratio * (self.m_maxs - self.m_mins)
+        explore = self.rng.rand(n) >= self.random_motor
+        M[explore] = np.clip(inv, self.m_mins, self.m_maxs)[explore]
+        return M
+
+    def learn(self, M, S):
+        t = time.time()
+        if(hasattr(self.model, "update_many")): self.model.update_many(M, S)
+        else:
+            for m, s in zip(M, S): self.model.update(m, s)
+        self.coverage.add(S)
+        self.M.append(M)
+        self.S.append(S)
+        self.nupdated += len(M)
+        self.tlearn += time.time() - t
+
+    def run(self, nsamples=1000, report_every=5.0):
+        """Explore nsamples motor commands, returns the stats dict (see stats())."""
+        self.nupdated, self.tlearn, self.twait = 0, 0.0, 0.0
+        self.tstart, self.treport = time.time(), time.time()
+        if(self.processes <= 0): self.runSequential(nsamples, report_every)
+        else: self.runPipelined(nsamples, report_every)
+        return self.stats()
+
+    def runSequential(self, nsamples, report_every):
+        seed = self.seed if self.seed is None else self.seed + 1
+        exp = Rollouts.makeSetup(self.config, seed)
+        self.setBounds(bounds(exp.nao, self.iarm))
+        while(self.nupdated < nsamples):
+            M = self.nextBatch()[:nsamples - self.nupdated]
+            self.learn(M, simulate(exp.nao, M, self.iarm))
+            self.report(report_every)
+
+    def runPipelined(self, nsamples, report_every):
+        results = multiprocessing.Queue()
+        tasks = [multiprocessing.Queue() for k in range(self.processes)]
+        seeds = [None if self.seed is None else self.seed + 1 + k for k in range(self.processes)]
+        workers = [multiprocessing.Process(target=worker, args=(k, self.config, seeds[k], self.iarm, tasks[k], results))
+                   for k in range(self.processes)]
+        for w in workers:
+            w.daemon = True
+            w.start()
+        try:
+            ready = [self.receive(results, "ready") for k in range(self.processes)]
+            self.setBounds(ready[0])
+            nsent, ibatch = 0, 0
+            for depth in range(2):                  # one batch running and one queued per worker
+                for k in range(self.processes):
+                    if(nsent < nsamples):
+                        M = self.nextBatch()[:nsamples - nsent]
+                        tasks[k].put((ibatch, M))
+                        nsent, ibatch = nsent + len(M), ibatch + 1
+            while(self.nupdated < nsamples):
+                wid, (ib, M, S) = self.receive(results, "done", withWorker=True)
+                if(nsent < nsamples):               # refill the worker before learning from its results
+                    Mnext = self.nextBatch()[:nsamples - nsent]
+                    tasks[wid].put((ibatch, Mnext))
+                    nsent, ibatch = nsent + len(Mnext), ibatch + 1
+                self.learn(M, S)
+                self.report(report_every)
+        finally:
+            for q in tasks: q.put(None)
+            for w in workers: w.join(5)
+
+    def receive(self, results, kind, withWorker=False):
+        t = time.time()
+        msg, wid, data = results.get()
+        self.twait += time.time() - t
+        if(msg == "error"): raise RuntimeError("exploration worker %d: %s" % (wid, data))
+        if(msg != kind): raise RuntimeError("exploration worker %d: expected %s, got %s" % (wid, kind, msg))
+        return (wid, data) if withWorker else data
+
+    def report(self, every):
+        if(not self.verbose or time.time() - self.treport < every): return
+        self.treport = time.time()
+        st = self.stats()
+        print "explored %d samples, %.1f samples/s, coverage %.3f" % (st["samples"], st["samples_per_s"], st["coverage"])
+        sys.stdout.flush()
+
+    def stats(self):
+        """samples/s, coverage of [s_mins, s_maxs] and how long the learner spent learning and waiting."""
+        elapsed = time.time() - self.tstart
+        return {"samples": self.nupdated,
+                "seconds": round(elapsed, 3),
+                "samples_per_s": round(self.nupdated / elapsed, 2) if elapsed > 0 else 0,
+                "coverage": round(self.coverage.value(), 4),
+                "learn_s": round(self.tlearn, 3),
+                "wait_s": round(self.twait, 3),
+                "processes": self.processes}
+
+    def samples(self):
+        """Arrays M (n, m_dims) and S (n, s_dims) of everything explored, in the order it was learnt."""
+        return np.concatenate(self.M), np.concatenate(self.S)
@@ -0,0 +1,187 @@
+import numpy as np
+from Box2DWorld import TIME_STEP
+from LazyImport import lazyImport
+interpolate = lazyImport("scipy.interpolate")    # splines of JointTrajectory
+
+# ********************************************
+# Position control of the joints of several arms as one vector.
+# The angles of all the joints are read into one array, the PID terms computed with
+# per joint gains and the motor speeds written back, in one pass for all the arms.
+# With the default gains (P only, kp = maxSpeedJoint of the arm divided by 2 for the
+# first joint) it gives the same motor speeds as the former per joint loop.
+#
+#     control = JointController(nao.arms, ki=4.0, kd=0.05, umax=SPEED_JOINT)
+#     errors = control.update()        # sum of |angle - target| of each arm in targetMode
+#
+# Anti-windup: the integral is frozen while the output saturates at umax in the direction
+# of the error, clamped within +-ilimit, and reset for a joint whose target changes or
+# whose arm leaves targetMode.
+#
+# Trajectories: a JointTrajectory is a table of setpoints, one row per physics step, of a
+# spline through joint space waypoints, computed once. An arm following one takes the next
+# row as its targetJoints at each update, and holds the last one when it ends.
+#
+#     nao.setTrajectory([[0.5, -1, -0.5, 1], [1, -0.5, -1, 0.5]], [1.0, 2.0])  # from the current angles
+
+def defaultGains(arm):
+    """P gain of each joint of the arm: maxSpeedJoint, halved for the first joint."""
+    return [arm.maxSpeedJoint / float(max(1, 2 - i)) for i in range(len(arm.jointList))]
+
+
+class JointTrajectory(object):
+    """Setpoints every dt of the cubic spline through waypoints (k, njoints) at times (k,) seconds,
+    at rest at the first and last waypoints. Row i of table is the setpoint at times[0] + i dt."""
+
+    def __init__(self, waypoints, times, dt=TIME_STEP):
+        waypoints = np.atleast_2d(np.asarray(waypoints, dtype=float))
+        times = np.asarray(times, dtype=float)
+        if(len(times) != len(waypoints) or np.any(np.diff(times) <= 0)):
+            raise ValueError("JointTrajectory needs one time per waypoint, increasing")
+        self.times, self.dt = times, dt
+        if(len(times) == 1):
+            self.table = waypoints.copy()
+        else:
+            t = times[0] + dt * np.arange(int(np.ceil((times[-1] - times[0]) / dt)) + 1)
+            spline = interpolate.CubicSpline(times, waypoints, axis=0, bc_type="clamped")
+            self.table = spline(np.minimum(t, times[-1]))
+
+    def __len__(self):
+        return len(self.table)
+
+    def duration(self):
+        return (len(self.table) - 1) * self.dt
+
+
+def startingAt(angles, waypoints, times):
+    """Waypoints and times with angles prepended at time 0 when the first waypoint is later."""
+    if(times[0] <= 0): return waypoints, times
+    return [list(angles)] + [list(w) for w in waypoints], [0.0] + list(times)
+
+
+class JointController(object):
+    """PID on the joint angles of the arms towards their targetJoints."""
+
+    def __init__(self, arms, kp=None, ki=0.0, kd=0.0, umax=None, ilimit=0.05, dt=TIME_STEP):
+        self.arms = list(arms)
+        self.joints = [j for arm in self.arms for j in arm.jointList]
+        self.slices, k = [], 0
+        for arm in self.arms:
+            self.slices.append(slice(k, k + len(arm.jointList)))
+            k += len(arm.jointList)
+        self.dt = dt
+        self.tracks = [None] * len(self.arms)   # per arm [setpoint table, next row] of its trajectory
+        n = len(self.joints)
+        self.kp, self.ki, self.kd = np.zeros(n), np.zeros(n), np.zeros(n)
+        self.umax = np.full(n, np.inf)          # output clamp, inf for none
+        self.ilimit = np.zeros(n)               # integral clamp (rad s)
+        self.reset()
+        self.setGains(kp, ki, kd, umax, ilimit)
+
+    def setGains(self, kp=None, ki=0.0, kd=0.0, umax=None, ilimit=0.05, arms=None):
+        """Gains of the joints of arms (default all, the others keep theirs), scalars or one value per
+        joint of these arms; kp=None keeps defaultGains, umax=None no output clamp."""
+        if(arms is None): arms = self.arms
+        idx = np.concatenate([np.arange(len(self.joints))[self.slices[self.arms.index(a)]] for a in arms])
+        n = len(idx)
+        if(kp is None): kp = [g for arm in arms for g in defaultGains(arm)]
+        self.kp[idx] = np.broadcast_to(np.asarray(kp, dtype=float), (n,))
+        self.ki[idx] = np.broadcast_to(np.asarray(ki, dtype=float), (n,))
+        self.kd[idx] = np.broadcast_to(np.asarray(kd, dtype=float), (n,))
+        self.umax[idx] = np.inf if umax is None else np.broadcast_to(np.asarray(umax, dtype=float), (n,))
+        self.ilimit[idx] = np.broadcast_to(np.asarray(ilimit, dtype=float), (n,))
+        self.bI, self.bD = bool(self.ki.any()), bool(self.kd.any())
+        self.bU = bool(np.isfinite(self.umax).any())
+        for arm in arms: self.reset(arm)
+
+    def reset(self, arm=None):
+        """Forget the integral and previous angles, of one arm or all."""
+        if(arm is None):
+            n = len(self.joints)
+            self.integral = np.zeros(n)
+            self.prev = np.full(n, np.nan)
+            self.target = np.full(n, np.nan)
+        else:
+            s = self.slices[self.arms.index(arm)]
+            self.integral[s], self.prev[s], self.target[s] = 0, np.nan, np.nan
+
+    def update(self, arms=None):
+        """Set the motor speeds of the arms (default all) that are in targetMode, returns the
+        sum of the absolute angle error of each of them (0 for the others)."""
+        if(arms is None): arms = self.arms
+        iarms = [self.arms.index(a) for a in arms]
+        active = [i for i in iarms if self.arms[i].targetMode]
+        for i in iarms:
+            if(not self.arms[i].targetMode and (self.bI or self.bD)): self.reset(self.arms[i])
+        errors = [0] * len(iarms)
+        if(not active): return errors
+        tracking = [self.advance(i) for i in active]
+
+        if(len(active) == len(self.arms)): idx, joints = slice(None), self.joints
+        else:
+            idx = np.concatenate([np.arange(len(self.joints))[self.slices[i]] for i in active])
+            joints = [self.joints[k] for k in idx]
+        angles = np.array([j.angle for j in joints])
+        target = np.array([t for i in active for t in self.arms[i].targetJoints[:len(self.arms[i].jointList)]], dtype=float)
+        error = angles - target
+        u = -self.kp[idx] * error
+
+        if(self.bD):
+            prev = self.prev[idx]
+            rate = np.where(np.isnan(prev), 0, angles - prev) / self.dt
+            u -= self.kd[idx] * rate             # on the measurement, no kick when the target changes
+            self.prev[idx] = angles
+        if(self.bI):
+            changed = target != self.target[idx]
+            if(any(tracking)):                   # setpoints of a trajectory move every step
+                changed &= ~np.repeat(tracking, [len(self.arms[i].jointList) for i in active])
+            integral = np.where(changed, 0, self.integral[idx])
+            self.target[idx] = target
+            if(self.bU):
+                usat = u - self.ki[idx] * integral
+                grow = (np.abs(usat) < self.umax[idx]) | (np.sign(usat) == np.sign(error))
+                integral = np.where(grow, integral + error * self.dt, integral)
+            else:
+                integral = integral + error * self.dt
+            integral = np.clip(integral, -self.ilimit[idx], self.ilimit[idx])
+            self.integral[idx] = integral
+            u -= self.ki[idx] * integral
+        if(self.bU): u = np.clip(u, -self.umax[idx], self.umax[idx])
+
+        for j, s in zip(joints, u.tolist()): j.motorSpeed = s
+        abserr, k = np.abs(error).tolist(), 0
+        for i in active:
+            nj = len(self.arms[i].jointList)
+            e = 0
+            for v in abserr[k:k + nj]: e += v
+            errors[iarms.index(i)] = e
+            k += nj
+        return errors
+
+    def setTrajectory(self, traj, arms=None):
+        """Follow traj, a JointTrajectory over the joints of arms (default all, in order), from the next update."""
+        if(arms is None): arms = self.arms
+        k = 0
+        for arm in arms:
+            nj = len(arm.jointList)
+            self.tracks[self.arms.index(arm)] = [traj.table[:, k:k + nj], 0]
+            arm.targetMode = True
+            k += nj
+        if(k != traj.table.shape[1]):
+            raise ValueError("trajectory of %d joints for arms of %d joints" % (traj.table.shape[1], k))
+
+    def cancelTrajectory(self, arm):
+        self.tracks[self.arms.index(arm)] = None
+
+    def tracking(self, arm):
+        """Whether the arm is still following a trajectory."""
+        return self.tracks[self.arms.index(arm)] is not None
+
+    def advance(self, i):
+        """Next setpoint of the trajectory of arm i into its targetJoints, False if it has none."""
+        track = self.tracks[i]
+        if(track is None): return False
+        table, k = track
+        self.arms[i].targetJoints[:table.shape[1]] = table[k].tolist()
+        if(k + 1 < len(table)): track[1] = k + 1
+        else: self.tracks[i] = None       # the last setpoint is held
+        return True
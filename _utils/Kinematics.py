@@ -0,0 +1,136 @@
+import numpy as np
+from LazyImport import lazyImport
+spatial = lazyImport("scipy.spatial")    # kd-tree of the warm start grid
+
+# ********************************************
+# Planar kinematics of the arms built by createArm, read from their joint anchors and
+# the fixtures of the last part, so any nparts, bShrink, hdiv or signDir is modelled.
+# The end point is the one of Arm.getFinalPos (without its rounding): the end of the
+# last part, or with bHand the centre of the hand and the angle getFinalPos reports.
+#
+#     kin = arm.getKinematics()
+#     Q, err = kin.solve(targets)          # targets (m, 2), Q (m, len(arm.jointList))
+#
+# solve() runs damped least squares Jacobian iterations on all the targets at once,
+# projected on getJointLimits(). Each target starts from the nearest end point of a grid
+# of joint configurations, computed once per arm geometry and kept in seedGrids.
+# Collisions (with the other arm or the body of the robot) are not modelled: the physics
+# verifies, e.g. arm.gotoTarget(xy).
+
+seedGrids = {}      # ArmKinematics.key() -> (joint configurations, kd-tree of their end points)
+
+
+def wrap(a):
+    """Angles into [-pi, pi)."""
+    return (a + np.pi) % (2 * np.pi) - np.pi
+
+def rotate(v, c, s):
+    """Vectors v (..., 2) rotated by the angles of cosines c and sines s (...)."""
+    return np.stack((v[..., 0] * c - v[..., 1] * s, v[..., 0] * s + v[..., 1] * c), axis=-1)
+
+
+class ArmKinematics(object):
+    """Forward kinematics, Jacobian and batched inverse kinematics of an Arm."""
+
+    def __init__(self, arm):
+        self.bHand = arm.bHand
+        joints = arm.jointList[:-1] if arm.bHand else arm.jointList
+        self.n = len(joints)
+        base = joints[0].bodyA
+        self.base = np.array(base.GetWorldPoint(joints[0].GetLocalAnchorA()), dtype=float)
+        self.angle0 = base.angle + np.array([j.GetReferenceAngle() for j in joints]).sum()
+        links = []
+        for j, jnext in zip(joints[:-1], joints[1:]):
+            links.append(np.array(jnext.GetLocalAnchorA()) - np.array(j.GetLocalAnchorB()))
+        last = joints[-1]
+        if(arm.bHand):
+            end = np.array(arm.jointList[-1].GetLocalAnchorA())
+        else:
+            vertices = last.bodyB.fixtures[-1].shape.vertices
+            if(last.bodyB.userData["name"] != "reversearmpart"): end = (np.array(vertices[-1]) + np.array(vertices[-2])) / 2.0
+            else: end = (np.array(vertices[0]) + np.array(vertices[1])) / 2.0
+        links.append(end - np.array(last.GetLocalAnchorB()))
+        self.links = np.array(links, dtype=float)
+        self.limits = np.array(arm.getJointLimits(), dtype=float)
+        self.lo, self.hi = self.limits[:self.n, 0], self.limits[:self.n, 1]
+
+    def key(self):
+        """The geometry relative to the base, the same for arms built alike anywhere."""
+        return (self.bHand, round(self.angle0, 6), tuple(np.round(self.links, 6).ravel()), tuple(np.round(self.limits, 6).ravel()))
+
+    def points(self, Q):
+        """Joint positions and end point (m, n+1, 2) and absolute angles (m, n) of the chain angles Q (m, n)."""
+        Q = np.atleast_2d(Q)[:, :self.n]
+        theta = self.angle0 + np.cumsum(Q, axis=1)
+        steps = rotate(self.links, np.cos(theta), np.sin(theta))
+        P = np.concatenate((np.zeros((len(Q), 1, 2)), np.cumsum(steps, axis=1)), axis=1) + self.base
+        return P, theta
+
+    def forward(self, Q):
+        """End points (m, 2) of the joint angles Q (m, n), and with bHand the angle of getFinalPos (m, 3)."""
+        Q = np.atleast_2d(np.asarray(Q, dtype=float))
+        P, theta = self.points(Q)
+        if(not self.bHand): return P[:, -1]
+        hand = Q[:, self.n] if Q.shape[1] > self.n else 0
+        return np.column_stack((P[:, -1], wrap(-(theta[:, -1] + hand))))
+
+    def jacobian(self, Q):
+        """End points (m, 2) and the Jacobian (m, 2, n) of their position."""
+        P, theta = self.points(Q)
+        d = P[:, -1:, :] - P[:, :-1, :]
+        return P[:, -1], np.stack((-d[..., 1], d[..., 0]), axis=1)
+
+    def seeds(self, per_joint=None):
+        """Joint configurations of the warm start grid and the kd-tree of their end points."""
+        key = self.key()
+        if(key not in seedGrids):
+            if(per_joint is None): per_joint = max(4, int(round(20000 ** (1.0 / self.n))))
+            axes = [np.linspace(l, h, per_joint) for l, h in zip(self.lo, self.hi)]
+            Q = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, self.n)
+            P, theta = self.points(Q)
+            seedGrids[key] = (Q, spatial.cKDTree(P[:, -1] - self.base))
+        return seedGrids[key]
+
+    def iterate(self, Q, T, tol, maxiter, damping):
+        """Damped least squares steps of Q (m, n) in place towards T (m, 2), projected on the limits."""
+        lam2 = damping ** 2
+        active = np.arange(len(T))
+        for it in range(maxiter):
+            P, J = self.jacobian(Q[active])
+            e = T[active] - P
+            left = np.hypot(e[:, 0], e[:, 1]) > tol
+            if(not left.any()): break
+            active, J, e = active[left], J[left], e[left]
+            # dq = J^T (J J^T + lam2 I)^-1 e, the 2x2 inverse written out
+            A = np.einsum("mij,mkj->mik", J, J)
+            a, b, c = A[:, 0, 0] + lam2, A[:, 0, 1], A[:, 1, 1] + lam2
+            det = a * c - b * b
+            y = np.stack(((c * e[:, 0] - b * e[:, 1]) / det, (a * e[:, 1] - b * e[:, 0]) / det), axis=1)
+            Q[active] = np.clip(Q[active] + np.einsum("mij,mi->mj", J, y), self.lo, self.hi)
+        return np.hypot(*(T - self.points(Q)[0][:, -1]).T)
+
+    def solve(self, targets, Q0=None, tol=1e-3, maxiter=100, damping=0.05, restarts=3):
+        """Joint angles (m, len(jointList)) reaching targets (m, 2), or (m, 3) with the hand angle if bHand,
+        within the joint limits; and the distance (m,) of each end point to its target. Targets not reached
+        from their nearest grid seed (or Q0) start again from the next nearest ones, restarts times.
+        The hand joint is solved after the chain, clipped to its limits."""
+        targets = np.atleast_2d(np.asarray(targets, dtype=float))
+        T = targets[:, :2]
+        Qgrid, tree = self.seeds()
+        near = tree.query(T - self.base, k=restarts + 1)[1].reshape(len(T), -1)
+        if(Q0 is None): Q = Qgrid[near[:, 0]]
+        else: Q = np.clip(np.atleast_2d(np.asarray(Q0, dtype=float))[:, :self.n], self.lo, self.hi)
+        err = self.iterate(Q, T, tol, maxiter, damping)
+        for k in range(restarts):
+            left = np.flatnonzero(err > tol)
+            if(len(left) == 0): break
+            Qk = Qgrid[near[left, k + (Q0 is None)]]
+            errk = self.iterate(Qk, T[left], tol, maxiter, damping)
+            better = errk < err[left]
+            Q[left[better]], err[left[better]] = Qk[better], errk[better]
+        if(self.bHand):
+            lo, hi = self.limits[self.n]
+            theta = self.points(Q)[1]
+            hand = wrap(-targets[:, 2] - theta[:, -1]) if targets.shape[1] > 2 else np.zeros(len(Q))
+            Q = np.column_stack((Q, np.clip(hand, lo, hi)))
+        return Q, err
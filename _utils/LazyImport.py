@@ -0,0 +1,34 @@
+import importlib
+
+# ********************************************
+# Heavy optional modules (matplotlib, scipy, explauto) are only imported the first
+# time one of their attributes is used, so that a physics only import of
+# Box2DWorld/Robots/ExpRobotSetup costs about as much as importing Box2D.
+#     plt = lazyImport("matplotlib.pyplot")
+#     plt.figure()        # matplotlib.pyplot is imported here
+
+class LazyModule(object):
+    """Stand-in for a module, imported on first attribute access."""
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        if(self._module is None):
+            self.__dict__["_module"] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return "<lazy module '%s' (%s)>" % (self._name, state)
+
+
+def lazyImport(name):
+    return LazyModule(name)
@@ -1,8 +1,16 @@
 import numpy as np
 from numpy import linalg as npla
-from scipy.ndimage.filters import gaussian_filter
 import math
 
+def fftSize(n):
+    """Smallest size >= n with no prime factor above 5, fast for np.fft."""
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0: m //= p
+        if(m == 1): return n
+        n += 1
+
 class Matrix():
 
     @staticmethod
@@ -21,42 +29,105 @@ class Matrix():
 
 
     def __init__(self, xlim=[], ylim=[], width_height=[640,480],size=32,fwhm=12):
-        self.w,self.h = width_height 
+        self.w,self.h = width_height
         self.xlim, self.ylim = xlim,ylim
         self.m = np.zeros((self.w,self.h))
         self.gaussian_kernel = self.makeGaussian(size,fwhm=fwhm)
+        self.invalidate()
 
     def getM(self):
         return np.transpose(self.m)
 
+    def corners(self, xs, ys):
+        """Matrix cell of the top left corner of the kernel centred at each (x, y)."""
+        xlim, ylim = self.xlim, self.ylim
+        n = len(self.gaussian_kernel[0])
+        i0 = (np.asarray(xs, dtype=float) - xlim[0]) / float(xlim[1]-xlim[0])
+        j0 = (np.asarray(ys, dtype=float) - ylim[0]) / float(ylim[1]-ylim[0])
+        i = np.trunc(i0*self.w - n//2).astype(int)
+        j = np.trunc(j0*self.h - n//2).astype(int)
+        return i, j
+
     def add(self, x, y, iMaxVal=0):
-        xlim = self.xlim
-        ylim = self.ylim
-        i0 = (x - xlim[0]) / float(xlim[1]-xlim[0])
-        j0 = (y - ylim[0]) / float(ylim[1]-ylim[0])
+        """Stamp the gaussian kernel centred at (x, y), clipped at the borders of the matrix."""
+        i, j = self.corners(x, y)
+        self.stamp(int(i), int(j), iMaxVal)
+
+    def stamp(self, i, j, iMaxVal=0):
         n = len(self.gaussian_kernel[0])
-        i = i0*self.w - n/2
-        j = j0*self.h - n/2
-        i = int(i)
-        j = int(j)
+        ki0, ki1 = max(0, -i), min(n, self.w - i)
+        kj0, kj1 = max(0, -j), min(n, self.h - j)
+        if(ki0 >= ki1 or kj0 >= kj1): return
+        block = self.m[i+ki0:i+ki1, j+kj0:j+kj1]
+        block += self.gaussian_kernel[ki0:ki1, kj0:kj1]
+        if(iMaxVal>0): np.minimum(block, iMaxVal, out=block)
+        self.dirty[i+ki0:i+ki1] = True
+
+    def add_many(self, xs, ys, iMaxVal=0):
+        """Same as calling add(x, y, iMaxVal) for every point. Large batches are binned in a histogram of
+        kernel corners convolved once with the kernel (fft), small ones stamped one by one."""
+        K = self.gaussian_kernel
+        n = len(K[0])
+        i, j = self.corners(xs, ys)
+        inside = (i > -n) & (i < self.w) & (j > -n) & (j < self.h)
+        i, j = i[inside], j[inside]
+        if(len(i) <= self.w*self.h // 32):      # measured: below this a block add per point beats the fft
+            for ii, jj in zip(i.tolist(), j.tolist()):
+                self.stamp(ii, jj, iMaxVal)
+            return
 
-        for row1, row2 in zip(self.m[i:], self.gaussian_kernel):
-            row = row1[j:n + j]
-            row1[j:n + j] = map(sum, zip(row2, row))
-            if(iMaxVal>0):
-                indices = row1 > iMaxVal
-                row1[indices] = iMaxVal
+        # counts of kernel corners, shifted by n so that corners above/left of the matrix fit
+        cw, ch = self.w + n, self.h + n
+        counts = np.bincount((i + n) * ch + (j + n), minlength=cw*ch).reshape(cw, ch).astype(float)
+        shape = (fftSize(self.w + 2*n - 1), fftSize(self.h + 2*n - 1))   # no wrap around of the convolution
+        full = np.fft.irfft2(np.fft.rfft2(counts, shape) * np.fft.rfft2(K, shape), shape)
+        delta = full[n:n + self.w, n:n + self.h]
+        delta[delta < 1e-9 * K.max()] = 0                   # fft round off on untouched cells
 
+        self.m += delta
+        touched = delta > 0
+        if(iMaxVal>0): np.minimum(self.m, iMaxVal, out=self.m, where=touched)
+        self.dirty |= touched.any(axis=1)
+
+    # ********************************************
+    # Sampling cells with probability proportional to their value, from a two level
+    # cumulative distribution: one per row and one of the row totals. add and add_many
+    # mark the rows they touch and only those rows are summed again before sampling.
+
+    def invalidate(self):
+        """Forget the cumulative distribution, needed after writing self.m directly."""
+        self.dirty = np.ones(self.w, dtype=bool)
+        self.rowcdf = np.zeros((self.w, self.h))
+
+    def updateCDF(self):
+        rows = np.flatnonzero(self.dirty)
+        if(len(rows) > 0):
+            self.rowcdf[rows] = np.cumsum(self.m[rows], axis=1)
+            self.dirty[:] = False
+            self.rowtotals = self.rowcdf[:, -1]
+            self.cdf = np.cumsum(self.rowtotals)
+
+    def sample(self, k=1, rng=np.random):
+        """k cells drawn with probability proportional to their value in O(k log(w h)), as an array (k, 2)
+        of (i/w, 1-j/h) like sampleMat. Uniform over the matrix while it is still empty."""
+        self.updateCDF()
+        w, h = self.w, self.h
+        total = self.cdf[-1]
+        if(total <= 0):
+            i, j = rng.randint(w, size=k), rng.randint(h, size=k)
+        else:
+            u = rng.uniform(0, total, k)
+            i = np.minimum(np.searchsorted(self.cdf, u, side='right'), w - 1)
+            r = u - (self.cdf[i] - self.rowtotals[i])
+            # vectorized binary search of r in the cdf of each sampled row
+            lo, hi = np.zeros(k, dtype=int), np.full(k, h - 1, dtype=int)
+            for it in range(int(math.ceil(math.log(h, 2))) + 1):
+                mid = (lo + hi) // 2
+                right = self.rowcdf[i, mid] > r
+                hi = np.where(right, mid, hi)
+                lo = np.where(right, lo, np.minimum(mid + 1, hi))
+            j = lo
+        return np.column_stack((i/float(w), 1-j/float(h)))
 
     def sampleMat(self):
-        maux = np.copy(self.m)
-        maux = maux / np.max(maux)
-        w,h = maux.shape
-        th = 0.01
-        niter, bFound = 0, False
-        while not bFound:
-            i,j = np.random.randint(w), np.random.randint(h)
-            bFound = (maux[i,j] > th)
-            niter += 1
-            if(niter%100==0): th -= 0.01
-        return (i/float(w),1-j/float(h))
\ No newline at end of file
+        return tuple(self.sample(1)[0])
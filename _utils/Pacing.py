@@ -0,0 +1,95 @@
+import time
+import numpy as np
+
+# ********************************************
+# Fixed timestep real time pacing of the pygame loops.
+# Wall clock time is accumulated and consumed by physics steps of TIME_STEP, as many as
+# needed each frame to keep simulated time with real time. When a frame is slow the next
+# ones run up to max_steps steps each and skip rendering until caught up, the backlog is
+# kept meanwhile. Only a frame drawn after max_skip skipped ones in a row gives up the
+# simulated time beyond max_steps steps of backlog (counted as dropped).
+#
+#     pacer = Pacer(Box2DWorld.TIME_STEP)
+#     while running:
+#         n = pacer.steps()
+#         if(n > 0): exp.step_n(n)
+#         if(pacer.render()): draw and flip
+#         pacer.wait()
+
+class Pacer(object):
+    """Accumulator of wall clock time into physics steps, with lag statistics."""
+
+    def __init__(self, dt, speed=1.0, max_steps=10, max_skip=5):
+        self.dt = dt                  # simulated seconds per physics step
+        self.speed = speed            # simulated seconds per wall clock second
+        self.max_steps = max_steps    # physics steps per frame at most
+        self.max_skip = max_skip      # consecutive frames without rendering at most
+        self.reset()
+
+    def reset(self):
+        self.last = time.time()
+        self.start = self.last
+        self.acc = 0.0
+        self.skipped = 0
+        self.nsteps, self.nframes, self.nrendered = 0, 0, 0
+        self.dropped_s = 0.0
+        self.lags = []                # backlog after the steps of each frame, seconds of sim time
+        self.renderTimes = []
+
+    def steps(self):
+        """Number of physics steps due since the previous call."""
+        now = time.time()
+        self.acc += (now - self.last) * self.speed
+        self.last = now
+        n = min(int(self.acc / self.dt), self.max_steps)
+        self.acc -= n * self.dt             # what is left makes render() skip this frame
+        if(self.skipped >= self.max_skip):  # this frame is drawn whatever the backlog
+            excess = int(self.acc / self.dt) - self.max_steps
+            if(excess > 0):
+                self.dropped_s += excess * self.dt
+                self.acc -= excess * self.dt
+        self.nsteps += n
+        self.nframes += 1
+        self.lags.append(self.acc)
+        if(len(self.lags) > 1000): del self.lags[:500]
+        return n
+
+    def render(self):
+        """Whether to draw this frame: only when caught up with real time, or after max_skip frames."""
+        if(self.acc >= self.dt and self.skipped < self.max_skip):
+            self.skipped += 1
+            return False
+        self.skipped = 0
+        self.nrendered += 1
+        self.renderTimes.append(time.time())
+        if(len(self.renderTimes) > 100): del self.renderTimes[:50]
+        return True
+
+    def wait(self):
+        """Sleep until the next physics step is due."""
+        due = (self.dt - self.acc) / self.speed - (time.time() - self.last)
+        if(due > 0): time.sleep(due)
+
+    def fps(self):
+        """Rendered frames per second over the last ones."""
+        t = self.renderTimes[-30:]
+        return (len(t) - 1) / (t[-1] - t[0]) if len(t) > 1 and t[-1] > t[0] else 0.0
+
+    def stats(self):
+        elapsed = time.time() - self.start
+        lags = np.array(self.lags) if self.lags else np.zeros(1)
+        return {"seconds": round(elapsed, 3),
+                "steps": self.nsteps,
+                "sim_speed": round(self.nsteps * self.dt / elapsed, 3) if elapsed > 0 else 0,
+                "frames": self.nframes,
+                "rendered": self.nrendered,
+                "render_dropped": self.nframes - self.nrendered,
+                "lag_mean_ms": round(1e3 * lags.mean(), 2),
+                "lag_p99_ms": round(1e3 * np.percentile(lags, 99), 2),
+                "lag_max_ms": round(1e3 * lags.max(), 2),
+                "sim_dropped_s": round(self.dropped_s, 3)}
+
+    def caption(self):
+        lag = 1e3 * self.lags[-1] if self.lags else 0
+        dropped = self.nframes - self.nrendered
+        return "FPS: {:5.1f} lag {:5.1f}ms skipped {:d} behind {:.2f}s ".format(self.fps(), lag, dropped, self.dropped_s)
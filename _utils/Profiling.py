@@ -0,0 +1,92 @@
+import os
+import math
+import timeit
+from functools import wraps
+
+# ********************************************
+# Hot path profiling: per function call count, cumulative time and a log
+# histogram for p50/p99. Enabled with the environment variable
+#     ROBOT2DSIM_PROFILE=1 python TwoArmPyGame.py
+# When disabled @profiled returns the function itself, so it costs nothing.
+
+bProfile = os.environ.get("ROBOT2DSIM_PROFILE", "") not in ("", "0")
+clock = timeit.default_timer
+BINS_PER_OCTAVE = 4       # histogram resolution: 2**(1/4) ~ 19% per bin
+NBINS = 48 * BINS_PER_OCTAVE
+
+timers = {}
+
+class Timer(object):
+    """Call count, cumulative ns and log2 histogram of the call durations of one function."""
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.total_ns = 0
+        self.hist = [0] * NBINS
+
+    def add(self, ns):
+        self.calls += 1
+        self.total_ns += ns
+        if(ns < 1): ns = 1
+        m, e = math.frexp(ns)           # ns = m * 2**e, 0.5 <= m < 1
+        b = e * BINS_PER_OCTAVE + int((2 * m - 1) * BINS_PER_OCTAVE)
+        self.hist[min(b, NBINS - 1)] += 1
+
+    def percentile(self, q):
+        """Approximate q-th percentile in ns, centre of its histogram bin."""
+        if(self.calls == 0): return 0
+        target, acc = q / 100.0 * self.calls, 0
+        for b, n in enumerate(self.hist):
+            acc += n
+            if(acc >= target): break
+        e, f = divmod(b, BINS_PER_OCTAVE)
+        return 2 ** (e - 1) * (1 + (f + 0.5) / BINS_PER_OCTAVE)
+
+    def stats(self):
+        return {"calls": self.calls,
+                "total_ns": int(self.total_ns),
+                "mean_ns": int(self.total_ns / self.calls) if self.calls else 0,
+                "p50_ns": int(self.percentile(50)),
+                "p99_ns": int(self.percentile(99))}
+
+
+def profiled(name):
+    """Decorator timing every call of the function under the given name."""
+    def decorator(f):
+        if(not bProfile): return f
+        timer = timers.setdefault(name, Timer(name))
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            t = clock()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                timer.add(1e9 * (clock() - t))
+        return wrapper
+    return decorator
+
+
+def stats():
+    """Dict name -> {calls, total_ns, mean_ns, p50_ns, p99_ns} of the functions called so far."""
+    return dict((name, t.stats()) for name, t in timers.items() if t.calls > 0)
+
+def reset():
+    for t in timers.values():
+        t.reset()
+
+def lines(n=6):
+    """Text lines of the n functions with the largest cumulative time."""
+    s = sorted(stats().items(), key=lambda item: -item[1]["total_ns"])[:n]
+    return ["%-28s %7d calls %8.1f ms  p50 %6.0f us  p99 %6.0f us" %
+            (name, st["calls"], st["total_ns"] / 1e6, st["p50_ns"] / 1e3, st["p99_ns"] / 1e3) for name, st in s]
+
+def caption(n=2):
+    """Short summary for the window caption, empty when profiling is off."""
+    if(not bProfile): return ""
+    s = sorted(stats().items(), key=lambda item: -item[1]["total_ns"])[:n]
+    return " | ".join("%s p50 %.0fus" % (name, st["p50_ns"] / 1e3) for name, st in s)
@@ -3,6 +3,8 @@ import pygame
 import Box2D # The main library
 from Box2D.b2 import * # This maps Box2D.b2Vec2 to vec2 (and so on)
 import Box2DWorld
+import Profiling
+from Profiling import profiled
 
 SCREEN_WIDTH, SCREEN_HEIGHT, X0, Y0 = 640,480,640/2,480/5
 PPM = 65 # pixel size only for pygame
@@ -70,10 +72,22 @@ def draw_polygon(screen, vertices, color = (0,255,0), width=3):
     vertices=[(X0+v[0], -Y0+SCREEN_HEIGHT-v[1]) for v in vertices]
     pygame.draw.polygon(screen, color, vertices, width)
         
-def box2d_draw_polygon(screen, polygon, body, fixture, color = [], width=3):
+def polygonVertices(body):
+    """World vertices of each polygon fixture of the body (None for other shapes)."""
+    vertices = []
+    for fixture in body.fixtures:
+        shape = fixture.shape
+        if(isinstance(shape, Box2D.b2PolygonShape)):
+            vertices.append([tuple(body.transform * v) for v in shape.vertices])
+        else:
+            vertices.append(None)
+    return vertices
+
+def box2d_draw_polygon(screen, polygon, body, fixture, color = [], width=3, vertices=None):
     bDraw = 1
     if(len(color)==0): color = colors[body.type]
-    vertices=[(body.transform*v)*PPM for v in polygon.vertices]
+    if(vertices is None): vertices = [tuple(body.transform * v) for v in polygon.vertices]
+    vertices = [(PPM * v[0], PPM * v[1]) for v in vertices]
     if(body.userData["name"]=="bar"):
         draw_polygon(screen, vertices, (10,10,100), 2)
     elif(body.userData["name"]=="occlusion"):
@@ -175,7 +189,7 @@ def box2d_draw_circle(screen, circle, body, fixture, color=[], width=3):
     if(name.startswith("reward")):
         if(bDraw):
             #e = userData["energy"]
-            color=userData['RGB']
+            color=userData.get('RGB', color)
             #width, color = 6, [80 - 80 * e, 80 * e, 0]
             #if(name == "reward_small"):
             #    color = [10, 100, 255]
@@ -241,16 +255,29 @@ def draw_salient(screen, exp):
 
 
 
+@profiled("PyGameUtils.draw_world")
 def draw_world(screen):
-    for body in Box2DWorld.world.bodies:
-        for fixture in body.fixtures:
+    for body in Box2DWorld.getWorld().bodies:
+        vertices = Box2DWorld.cachedAsleep(body, "vertices", polygonVertices)    # kept while the body sleeps
+        for i, fixture in enumerate(body.fixtures):
             shape = fixture.shape
             if(body.active):
                 if(isinstance(shape,Box2D.b2CircleShape)): box2d_draw_circle(screen, shape, body, fixture)
-                if(isinstance(shape,Box2D.b2PolygonShape)): box2d_draw_polygon(screen, shape, body, fixture)
+                if(isinstance(shape,Box2D.b2PolygonShape)): box2d_draw_polygon(screen, shape, body, fixture, vertices=vertices[i])
             else:
                 if(isinstance(shape,Box2D.b2CircleShape)): box2d_draw_circle(screen, shape, body, fixture, color=(0,90,10), width=1)
-                if(isinstance(shape,Box2D.b2PolygonShape)): box2d_draw_polygon(screen, shape, body, fixture, color=(0,90,10), width=1)
+                if(isinstance(shape,Box2D.b2PolygonShape)): box2d_draw_polygon(screen, shape, body, fixture, color=(0,90,10), width=1, vertices=vertices[i])
+
+
+profile_font = None
+
+def draw_profile(screen, n=6):
+    """Overlay of the slowest profiled functions, nothing when ROBOT2DSIM_PROFILE is off."""
+    global profile_font
+    if(not Profiling.bProfile): return
+    if(profile_font is None): profile_font = pygame.font.SysFont("monospace", 12)
+    for i, line in enumerate(Profiling.lines(n)):
+        screen.blit(profile_font.render(line, True, (200, 200, 120)), (5, 5 + 14 * i))
 
 
 def draw_grid(screen):
@@ -1,8 +1,14 @@
 import numpy as np
-from Box2DWorld import (world, step, createBox, createBoxFixture, createCircle,
-                        myCreateRevoluteJoint, vrotate, vangle, RayCastCallback,Box2D)
+import Box2DWorld
+from Box2DWorld import (step, getRNG, createBox, createBoxFixture, createCircle,
+                        myCreateRevoluteJoint, vrotate, vangle, rayCast, cachedAsleep, Box2D)
 from Arm import Arm
+from JointControl import JointController, JointTrajectory, startingAt
+from Workspace import RobotWorkspace
 from VectorFigUtils import dist
+from Profiling import profiled
+from LazyImport import lazyImport
+spatial = lazyImport("scipy.spatial")    # kd-tree of the Swarm
 
 
 class GradSensor(object):
@@ -22,6 +28,7 @@ class GradSensor(object):
         self.GradAngles = [k * da - ((ngrad - m) / 2) * da - m * da / 2 for k in range(ngrad)]
         self.GradValues = [0 for i in range(ngrad)]
 
+    @profiled("GradSensor.update")
     def update(self, pos, angle, centers=[], extremes=0):
         """Update passing agnet pos, angle and list of positions of gradient emmiters."""
         sensors = range(self.ngrad)
@@ -46,10 +53,9 @@ class IR(object):
     """Infraread sensors class implemented as RayCast used by EPuck, CartPole."""
 
     def __init__(self, nir=1,ignoreList=[]):
-        """Init IRAngles and IRValues and RayCast."""
+        """Init IRAngles and IRValues."""
         self.nir = nir
         self.maxdist = 1
-        self.callback = RayCastCallback()
         if(nir < 4):
             m, da = (1 + nir) % 2, np.pi / (2 + nir)
         else:
@@ -58,32 +64,55 @@ class IR(object):
         self.IRValues = [1 for i in range(nir)]
         self.ignoreList=ignoreList
 
-    def update(self, pos, angle, r=0.1):
-        """Udpate casting ray."""
-        for k in range(self.nir):
-            v = vrotate((1, 0), angle + self.IRAngles[k])
-            c = pos + [0.9 * r * v[0], 0.9 * r * v[1]]
-            cdist = pos + [self.maxdist * v[0], self.maxdist * v[1]]
-            self.callback.fixture = None
-            world.RayCast(self.callback, c, cdist)
-            if(self.callback.fixture is not None):
-                if 'ignore' in self.callback.fixture.body.userData.keys():
+    def rays(self, pos, angle, r=0.1):
+        """Start and end points of the rays."""
+        a = angle + np.array(self.IRAngles[:self.nir])
+        v = np.column_stack((np.cos(a), np.sin(a)))
+        p = np.array([pos[0], pos[1]])
+        return p + 0.9 * r * v, p + self.maxdist * v
+
+    def setValues(self, c, bodies, points):
+        """Set IRValues from the RayCast results of the rays starting at c."""
+        dists = np.hypot(points[:, 0] - c[:, 0], points[:, 1] - c[:, 1]) / self.maxdist
+        for k, body in enumerate(bodies):
+            if(body is not None):
+                if 'ignore' in body.userData.keys():
                     self.IRValues[k] = 1
-                elif any([ig in self.callback.fixture.body.userData['name'] for ig in self.ignoreList]):
+                elif any([ig in body.userData['name'] for ig in self.ignoreList]):
                     self.IRValues[k] = 1
                 else:
-                    self.IRValues[k] = dist(c, self.callback.point) / self.maxdist
+                    self.IRValues[k] = dists[k]
             else:
                 self.IRValues[k] = 1
 
+    @profiled("IR.update")
+    def update(self, pos, angle, r=0.1):
+        """Udpate casting all the rays in one batch."""
+        c, cdist = self.rays(pos, angle, r)
+        bodies, points = rayCast(c, cdist)
+        self.setValues(c, bodies, points)
+
+
+@profiled("updateIRs")
+def updateIRs(sensors):
+    """Update several IR sensors with a single batch of rays, sensors is a list of (IR, pos, angle, r)."""
+    rays = [ir.rays(pos, angle, r) for ir, pos, angle, r in sensors]
+    if(len(rays) == 0): return
+    c = np.concatenate([ray[0] for ray in rays])
+    bodies, points = rayCast(c, np.concatenate([ray[1] for ray in rays]))
+    i = 0
+    for (ir, pos, angle, r), ray in zip(sensors, rays):
+        n = len(ray[0])
+        ir.setValues(c[i:i + n], bodies[i:i + n], points[i:i + n])
+        i += n
+
 class VisualSensor(object):
     """Infraread sensors class implemented as RayCast used by EPuck, CartPole."""
 
     def __init__(self, retinaSize=10,span=90,maxdist=20):
-        """Init IRAngles and IRValues and RayCast."""
+        """Init VSAngles and RGB."""
         self.retinaSize = retinaSize
         self.maxdist = maxdist
-        self.callback = RayCastCallback()
         if(retinaSize < 4):
             m, da = (1 + retinaSize) % 2, 2*np.pi*span/360. / (2 + retinaSize)
         else:
@@ -92,22 +121,59 @@ class VisualSensor(object):
         self.RGB = [[0,0,0] for i in range(retinaSize)]
 
     def update(self, pos, angle, r=0.1):
-        """Udpate casting ray."""
-        for k in range(self.retinaSize):
-            v = vrotate((1, 0), angle + self.VSAngles[k])
-            c = pos + [0.9 * r * v[0], 0.9 * r * v[1]]
-            cdist = pos + [self.maxdist * v[0], self.maxdist * v[1]]
-            self.callback.fixture = None
-            world.RayCast(self.callback, c, cdist)
-            if(self.callback.fixture is not None):
-                if 'RGB' in self.callback.fixture.body.userData.keys():
-                    self.RGB[k] = [int(col-100*dist(c, self.callback.point) / self.maxdist) for col in self.callback.fixture.body.userData['RGB']]
+        """Udpate casting all the rays in one batch."""
+        a = angle + np.array(self.VSAngles)
+        v = np.column_stack((np.cos(a), np.sin(a)))
+        p = np.array([pos[0], pos[1]])
+        c = p + 0.9 * r * v
+        bodies, points = rayCast(c, p + self.maxdist * v)
+        dists = np.hypot(points[:, 0] - c[:, 0], points[:, 1] - c[:, 1])
+        for k, body in enumerate(bodies):
+            if(body is not None):
+                if 'RGB' in body.userData.keys():
+                    self.RGB[k] = [int(col-100*dists[k] / self.maxdist) for col in body.userData['RGB']]
                 else:
                     self.RGB[k] = [255,255,255]
             else:
                 self.RGB[k] = [0,0,0]
 
 
+# *****************************************************************
+# Motors of epucks applied to their bodies
+
+class MotorDrive(object):
+    """Applies the (left, right) motors (n, 2) of epucks to their bodies in one pass. From
+    fangle = 50 (right - left) and fdist = 1000 (left + right) along the heading:
+        "velocity"  linear velocity fdist / 50 and angular velocity fangle / 2 (kinematic, the default)
+        "force"     force fdist at the center and torque fangle; bodies are woken only by non zero motors."""
+    modes = ["velocity", "force"]
+
+    def __init__(self, bodies, mode="velocity"):
+        if(mode not in self.modes): raise ValueError("unknown drive mode %s, not in %s" % (mode, self.modes))
+        self.bodies = bodies
+        self.mode = mode
+
+    def apply(self, motors, angles=None):
+        """motors (n, 2) and angles (n,) of the bodies, read from them if None."""
+        motors = np.asarray(motors, dtype=float).reshape(-1, 2)
+        if(angles is None): angles = [b.angle for b in self.bodies]
+        angles = np.asarray(angles, dtype=float)
+        mLeft, mRight = motors[:, 0], motors[:, 1]
+        fangle, fdist = 50 * (mRight - mLeft), 1000 * (mLeft + mRight)
+        dx, dy = fdist * np.cos(angles), fdist * np.sin(angles)
+        if(self.mode == "velocity"):
+            vx, vy, w = (dx / 50).tolist(), (dy / 50).tolist(), (fangle / 2).tolist()
+            for k, body in enumerate(self.bodies):
+                body.linearVelocity = (vx[k], vy[k])
+                body.angularVelocity = w[k]
+        else:
+            wake = ((fangle != 0) | (fdist != 0)).tolist()
+            fx, fy, torque = dx.tolist(), dy.tolist(), fangle.tolist()
+            for k, body in enumerate(self.bodies):
+                body.ApplyTorque(torque[k], wake=wake[k])
+                body.ApplyForceToCenter((fx[k], fy[k]), wake[k])
+
+
 # *****************************************************************
 # Epuck class
 
@@ -115,8 +181,8 @@ class Epuck(object):
     """Epuck robot class: two motors and infrared sensors."""
 
     def __init__(self, position=(0, 0), angle=np.pi / 2, r=0.48, bHorizontal=False, frontIR=6, nother=0, nrewsensors=0,
-                 RGB=[255,0,0],bodyType='circle',categoryBits=0x0001,name='epuck',maskBits=0x0009):
-        """Init of userData map with relevant values."""
+                 RGB=[255,0,0],bodyType='circle',categoryBits=0x0001,name='epuck',maskBits=0x0009, drive="velocity"):
+        """Init of userData map with relevant values, drive is the MotorDrive mode."""
 
         self.ini_pos = position
         if bodyType=='circle':
@@ -128,7 +194,7 @@ class Epuck(object):
 
         self.motors = [0, 0]
         self.bHorizontal = bHorizontal
-        self.bForceMotors = True
+        self.drive = MotorDrive([self.body], drive)
 
         self.frontIR = frontIR
         self.IR = IR(frontIR)
@@ -191,27 +257,174 @@ class Epuck(object):
         step()
 
 
-    def update(self):
-        """update of position applying forces and IR."""
+    def update(self, bIR=True):
+        """update of position applying forces and IR (bIR=False leaves the IR to a batched updateIRs)."""
         body, angle, pos = self.body, self.body.angle, self.body.position
-        mLeft, mRight = self.motors
-        fangle, fdist = 50 * (mRight - mLeft), 1000 * (mLeft + mRight)
-        d = (fdist * np.cos(angle), fdist * np.sin(angle))
-
-        if(not self.bHorizontal):
-            self.body.linearVelocity = [d[0]/50,d[1]/50]
-            self.body.angularVelocity = fangle/2
-
-        #if(self.bForceMotors):
-        #    body.ApplyTorque(fangle, wake=True)
-        #    body.ApplyForce(force=d, point=body.worldCenter, wake=False)
-
         if(self.bHorizontal):
             body.angularVelocity = 0
             body.angle = np.pi / 2
+        else:
+            self.drive.apply([self.motors], [angle])
 
-        nir = self.frontIR
-        self.IR.update(pos, angle, self.r)
+        if(bIR):
+            self.updateIR(pos, angle)
+
+    def updateIR(self, pos=None, angle=None):
+        """IR at pos and angle, those of the body if None. Kept while the epuck sleeps and nothing moves
+        within the range of the rays."""
+        if(pos is None): pos, angle = self.body.position, self.body.angle
+        cachedAsleep(self.body, "IR", lambda body: self.IR.update(pos, angle, self.r), radius=self.IR.maxdist)
+
+
+# *****************************************************************
+# Swarm of epucks with the state in arrays
+
+def gradientValues(pos, angle, gradAngles, centers, maxd):
+    """Values (n, ngrad) of the gradient sensors of agents at pos (n, 2) heading angle (n,) towards the
+    emitters at centers (m, 2), as GradSensor.update of each agent."""
+    a = angle[:, np.newaxis] + gradAngles                                  # (n, ngrad)
+    vc = centers[np.newaxis, :, :] - pos[:, np.newaxis, :]                 # (n, m, 2)
+    d = np.hypot(vc[..., 0], vc[..., 1])
+    return 1 - np.max(gradientTerms(a[:, :, np.newaxis], vc[:, np.newaxis], d[:, np.newaxis], maxd), axis=2)
+
+def gradientTerms(a, vc, d, maxd):
+    """((maxd - d) / maxd) (1 - |angle between heading a and vc| / pi) of GradSensor, broadcasting."""
+    cos = (np.cos(a) * vc[..., 0] + np.sin(a) * vc[..., 1]) / np.where(d > 0, d, 1)
+    angle = np.where(d > 0, np.arccos(np.clip(cos, -1, 1)), 0)
+    return ((maxd - np.minimum(d, maxd)) / maxd) * (1 - angle / np.pi)
+
+def directedPairs(pos, radius):
+    """Arrays i, j, d of both (i, j) and (j, i) for the pairs of points closer than radius, sorted by i."""
+    pairs = spatial.cKDTree(pos).query_pairs(radius, output_type='ndarray')
+    i = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    j = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    order = np.argsort(i, kind='mergesort')
+    i, j = i[order], j[order]
+    return i, j, np.hypot(pos[j, 0] - pos[i, 0], pos[j, 1] - pos[i, 1])
+
+def runStarts(i):
+    """Where each run of equal values of the sorted i starts, for ufunc.reduceat."""
+    return np.flatnonzero(np.r_[True, i[1:] != i[:-1]]) if len(i) else np.zeros(0, dtype=int)
+
+
+class Swarm(object):
+    """n epucks with their state in arrays, row k being epuck k: pos (n, 2), angle (n,), motors (n, 2) and
+    the sensor values ir (n, nir), other (n, nother) and reward (n, nrewsensors). The motors of all the
+    epucks are applied at once by a MotorDrive and the sensors are computed in
+    batches from the pairs of epucks close enough to sense each other (kd-tree of the positions)."""
+
+    def __init__(self, positions, angles, r=0.2, nir=6, nother=2, nrewsensors=4, RGB=[255,0,0], name="epuck",
+                 ignoreList=["reward"], drive="velocity"):
+        self.n = len(positions)
+        self.r = r
+        self.bodies = [createCircle(p, r=r, bDynamic=True, restitution=0, name=name) for p in positions]
+        for body, a in zip(self.bodies, angles): body.angle = a
+        self.drive = MotorDrive(self.bodies, drive)
+
+        self.pos, self.angle = np.zeros((self.n, 2)), np.zeros(self.n)
+        self.motors = np.zeros((self.n, 2))
+        ir, other, reward = IR(nir, ignoreList), GradSensor(nother, name="other"), GradSensor(nrewsensors, name="reward")
+        self.ignoreList = ignoreList
+        self.maxdist, self.maxd = ir.maxdist, other.maxd
+        self.irAngles = np.array(ir.IRAngles[:nir])
+        self.otherAngles, self.rewardAngles = np.array(other.GradAngles), np.array(reward.GradAngles)
+        self.ir = np.ones((self.n, nir))
+        self.other = np.zeros((self.n, nother))
+        self.reward = np.zeros((self.n, nrewsensors))
+
+        for k, body in enumerate(self.bodies):      # same userData as Epuck, values are views of the rows
+            body.userData.update({"nIR": nir, "IRAngles": ir.IRAngles, "IRValues": self.ir[k], "RGB": RGB, "radius": r,
+                                  "nOtherSensors": nother, "OtherAngles": other.GradAngles, "OtherValues": self.other[k],
+                                  "nRewardSensors": nrewsensors, "RewardAngles": reward.GradAngles,
+                                  "RewardValues": self.reward[k]})
+        self.readState()
+
+    def readState(self):
+        """Positions and angles of the bodies into pos and angle."""
+        positions = [b.position for b in self.bodies]
+        self.pos[:] = [(p.x, p.y) for p in positions]
+        self.angle[:] = [b.angle for b in self.bodies]
+
+    @profiled("Swarm.applyMotors")
+    def applyMotors(self):
+        """Motors of all the epucks to their bodies, at the angles read."""
+        self.drive.apply(self.motors, self.angle)
+
+    def neighbours(self):
+        """Pairs (i, j, d) of epucks within reach of the IR or the gradient sensors of each other."""
+        return directedPairs(self.pos, max(self.maxdist + self.r, self.maxd))
+
+    @profiled("Swarm.updateIR")
+    def updateIR(self, pairs):
+        """IR rays of all the epucks against each other (analytic circles) and the static bodies (ray table)."""
+        n, nir = self.ir.shape
+        if(nir == 0): return
+        a = self.angle[:, np.newaxis] + self.irAngles
+        u = np.dstack((np.cos(a), np.sin(a)))                                  # (n, nir, 2)
+        c = self.pos[:, np.newaxis, :] + 0.9 * self.r * u                      # rays start on the body
+        length = self.maxdist - 0.9 * self.r
+        frac, ignored = np.full((n, nir), np.inf), np.zeros((n, nir), dtype=bool)
+
+        table = Box2DWorld.rayTable
+        walls = np.flatnonzero(table.nearStatic(self.pos, self.maxdist))
+        if(len(walls) > 0):
+            ends = self.pos[walls, np.newaxis, :] + self.maxdist * u[walls]
+            fw, hit, near = table.castRays(c[walls].reshape(-1, 2), ends.reshape(-1, 2), bDynamic=False)
+            frac[walls] = fw.reshape(-1, nir)
+            hit = hit.reshape(-1, nir)
+            for ibody in np.unique(hit[hit >= 0]).tolist():
+                userData = table.bodies[ibody].userData
+                if("ignore" in userData or any([ig in userData["name"] for ig in self.ignoreList])):
+                    ignored[walls] |= hit == ibody
+
+        i, j, d = pairs
+        close = d <= self.maxdist + self.r
+        i, j = i[close], j[close]
+        if(len(i) > 0):
+            # ray circle intersection as in RayTable.castRays, rays starting inside a circle do not hit
+            s = c[i] - self.pos[j][:, np.newaxis, :]                           # (npairs, nir, 2)
+            b = length * (s[..., 0] * u[i][..., 0] + s[..., 1] * u[i][..., 1])
+            rr = length * length
+            sigma = b * b - rr * (s[..., 0] ** 2 + s[..., 1] ** 2 - self.r * self.r)
+            t = -(b + np.sqrt(np.maximum(sigma, 0))) / rr
+            t[(sigma < 0) | (t < 0) | (t > 1)] = np.inf
+            starts = runStarts(i)
+            tmin = np.minimum.reduceat(t, starts, axis=0)
+            rows = i[starts]
+            closer = tmin < frac[rows]
+            frac[rows] = np.where(closer, tmin, frac[rows])
+            ignored[rows] &= ~closer
+        self.ir[:] = np.where(np.isinf(frac) | ignored, 1, frac * length / self.maxdist)
+
+    @profiled("Swarm.updateGradients")
+    def updateGradients(self, pairs, rewards=[]):
+        """other from the epucks closer than maxd, reward from the rewards positions (m, 2) like the Epuck
+        setups: every sensor from the first reward, then the two extreme sensors from the last one."""
+        n, nother = self.other.shape
+        if(nother > 0 and n > 1):
+            i, j, d = pairs
+            close = d <= self.maxd
+            i, j, d = i[close], j[close], d[close]
+            self.other[:] = 1
+            if(len(i) > 0):
+                a = self.angle[i][:, np.newaxis] + self.otherAngles
+                vc = self.pos[j] - self.pos[i]
+                terms = gradientTerms(a, vc[:, np.newaxis, :], d[:, np.newaxis], self.maxd)
+                starts = runStarts(i)
+                self.other[i[starts]] = 1 - np.maximum.reduceat(terms, starts, axis=0)
+        rewards = np.asarray(rewards, dtype=float).reshape(-1, 2)
+        if(self.reward.shape[1] > 0 and len(rewards) > 0):
+            self.reward[:] = gradientValues(self.pos, self.angle, self.rewardAngles, rewards[:1], self.maxd)
+            last = gradientValues(self.pos, self.angle, self.rewardAngles[[0, -1]], rewards[-1:], self.maxd)
+            self.reward[:, [0, -1]] = last
+
+    def update(self, rewards=[]):
+        """Read the state, apply the motors and compute the sensors at the state read."""
+        self.readState()
+        self.applyMotors()
+        pairs = self.neighbours()
+        self.updateIR(pairs)
+        self.updateGradients(pairs, rewards)
 
 
 # ********************************************************
@@ -221,10 +434,11 @@ class Epuck(object):
 class NaoRobot:
     """Two Arm robot top view."""
 
-    def __init__(self, position=(0,0), name="simple", bTwoArms=True, collisionGroup=None, bOppositeArms=False):
-        """Init body and arms of the robot."""
+    def __init__(self, position=(0,0), name="simple", bTwoArms=True, collisionGroup=None, bOppositeArms=False, rng=None):
+        """Init body and arms of the robot, rng (seed or RandomState) drives the random deltaMotor."""
         global nao
         nao = self
+        self.rng = getRNG(rng)
         self.ini_pos = position
         x, y = position[0], position[1]
         self.salient = []
@@ -249,15 +463,28 @@ class NaoRobot:
         self.arms = []
 
         if(not bOppositeArms):
-            self.arms.append(Arm(bLateralize=1, hdiv=1, nparts=self.nparts, position=(x - w, y), length=length, name=name, bShrink=bShrink, collisionGroup=collisionGroup))
+            self.arms.append(Arm(bLateralize=1, hdiv=1, nparts=self.nparts, position=(x - w, y), length=length, name=name, bShrink=bShrink, collisionGroup=collisionGroup, rng=self.rng))
             if(bTwoArms):
-                self.arms.append(Arm(bLateralize=2, hdiv=1, nparts=self.nparts, position=(x+w,y), length=length, name=name, bShrink=bShrink, collisionGroup=collisionGroup))
+                self.arms.append(Arm(bLateralize=2, hdiv=1, nparts=self.nparts, position=(x+w,y), length=length, name=name, bShrink=bShrink, collisionGroup=collisionGroup, rng=self.rng))
         else:
-            arm1 = Arm(position=(x, y), bLateralize=0, hdiv=1, nparts=self.nparts, length = length, name=name, bShrink=bShrink, collisionGroup=collisionGroup)
-            arm2 = Arm(position=(x, y + 3), signDir=-1, bLateralize=0, hdiv=1, nparts=self.nparts, length=length, name=name, bShrink=bShrink, collisionGroup=collisionGroup)
+            arm1 = Arm(position=(x, y), bLateralize=0, hdiv=1, nparts=self.nparts, length = length, name=name, bShrink=bShrink, collisionGroup=collisionGroup, rng=self.rng)
+            arm2 = Arm(position=(x, y + 3), signDir=-1, bLateralize=0, hdiv=1, nparts=self.nparts, length=length, name=name, bShrink=bShrink, collisionGroup=collisionGroup, rng=self.rng)
             self.arms.append(arm1)
             self.arms.append(arm2)
 
+        self.controller = JointController(self.arms)     # PID of the joints of both arms at once
+        for arm in self.arms: arm.controller = self.controller
+        self.workspace = None                             # RobotWorkspace, built by getWorkspace
+
+    def getWorkspace(self, **kwargs):
+        """Workspace maps of the arms over s_mins/s_maxs (see Workspace.RobotWorkspace), cached on disk."""
+        if(self.workspace is None or kwargs):
+            self.workspace = RobotWorkspace(self.arms, self.s_mins(), self.s_maxs(), **kwargs)
+        return self.workspace
+
+    def setPID(self, kp=None, ki=0.0, kd=0.0, umax=None, ilimit=0.05):
+        """Gains of the joints of all the arms (scalars or one per joint), see JointControl.JointController."""
+        self.controller.setGains(kp, ki, kd, umax, ilimit)
 
     def getMotorSpeeds(self):
         speeds = []
@@ -318,6 +545,16 @@ class NaoRobot:
                 return
             self.arms[iarm].setTargetJoints(t)
 
+    def setTrajectory(self, waypoints, times):
+        """Both arms follow one spline through waypoints of all their joints (as setTargetJoints), evaluated
+        for all the joints at once; from the current angles if the first time is > 0."""
+        arms = self.arms if self.bTwoArms else self.arms[:1]
+        angles = [a for arm in arms for a in arm.getJointAngles()]
+        waypoints, times = startingAt(angles, waypoints, times)
+        traj = JointTrajectory(waypoints, times)
+        self.controller.setTrajectory(traj, arms)
+        return traj
+
     def restPosition(self, online=True, iarms=[0, 1], otherarm=-1):
         if(otherarm >= 0): 
             if(otherarm == 0):
@@ -352,31 +589,33 @@ class NaoRobot:
         self.deltaMotor(dm)
         for i in range(25):
             self.update()
-            world.Step(TIME_STEP, vel_iters, pos_iters)
-            world.ClearForces()
+            step()
         return self.getFinalPos()
 
     def deltaMotor(self, dm=[], iarm=-1):
         if(iarm < 0):
             if(len(dm) == 0):
                 l = 2 * self.arms[0].nparts
-                dm = [round(2 * r - 1, 2) for r in np.random.rand(l)]
+                dm = [round(2 * r - 1, 2) for r in self.rng.rand(l)]
             i = len(dm) / 2
             self.arms[0].deltaMotor(dm[0:i])
             self.arms[1].deltaMotor(dm[i:])
         else:
             if(len(dm) == 0):
                 l = self.arms[iarm].nparts
-                dm = [round(2 * r - 1, 2) for r in np.random.rand(l)]
+                dm = [round(2 * r - 1, 2) for r in self.rng.rand(l)]
             self.arms[iarm].deltaMotor(dm)
 
     def update(self, iarm=-1):
         sum = 0
         if(iarm < 0):
             self.salient = []
-            for iarm, a in enumerate(self.arms):
-                sum += self.arms[iarm].update()
-                self.salient += self.arms[iarm].getSalient()
+            shared = [a for a in self.arms if a.controller is self.controller]
+            errors = dict(zip(shared, self.controller.update(shared)))
+            for a in self.arms:
+                if(a in errors): sum += errors[a] + a.update(bPID=False)
+                else: sum += a.update()
+                self.salient += a.getSalient()
         else:
             sum = self.arms[iarm].update()
         return sum
@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+import Box2DWorld
+import ExpRobotSetup
+
+# *****************************************************************
+# Reproducible rollouts: a fresh world, a seeded setup and a fixed action
+# sequence always give the same trajectory, bit for bit. RolloutCache keeps
+# them on disk keyed on (setup config, seed, actions).
+# *****************************************************************
+
+CACHE_VERSION = 1          # bump when a change in the simulation makes cached trajectories stale
+
+
+def actEpucks(exp, a):
+    for i, motors in enumerate(np.reshape(a, (-1, 2))):
+        exp.setMotors(epuck=i, motors=list(motors))
+
+def actRandall(exp, a):
+    for i, motor in enumerate(a):
+        exp.setMotor(epuck=i, motor=motor)
+
+def actDualCartPole(exp, a):
+    for i in [0, 1]:
+        exp.setMotorSpeed(i, a[i])
+
+def actSwarm(exp, a):
+    exp.act(a)
+
+def actNao(exp, a):
+    exp.deltaMotor(list(a))
+
+# how an action vector is applied to each setup
+ACTIONS = {"ExpSetupRandall": actRandall,          # one motor per epuck
+           "ExpSetupEpuck": actEpucks,             # (left, right) motors per epuck
+           "ExpSetupMultiAgent": actEpucks,
+           "ExpSetupSwarm": actSwarm,              # (left, right) motors per epuck, as one array
+           "ExpSetupDualCartPole": actDualCartPole,  # motor speed of each cart
+           "ExpSetupNao": actNao,                  # deltaMotor of all the joints
+           "ExpSetupScene": actEpucks}             # (left, right) motors per epuck of the scene
+
+
+def worldState():
+    """Array (nbodies, 6) with x, y, angle, vx, vy and angular velocity of every body."""
+    return np.array([(b.position[0], b.position[1], b.angle, b.linearVelocity[0], b.linearVelocity[1],
+                      b.angularVelocity) for b in Box2DWorld.getWorld().bodies])
+
+
+def makeSetup(config, seed):
+    """Build config = {"setup": "ExpSetupNao", "kwargs": {...}} in a new empty world."""
+    Box2DWorld.newWorld()
+    cls = getattr(ExpRobotSetup, config["setup"])
+    return cls(seed=seed, **config.get("kwargs", {}))
+
+
+def rollout(config, seed, actions, steps_per_action=1, cache=None):
+    """Trajectory (len(actions), nbodies, 6) of worldState after each action, each one applied
+    and followed by steps_per_action physics steps and updates. Served from cache if given, except
+    with seed=None (the global np.random, not reproducible)."""
+    actions = np.asarray(actions, dtype=float)
+    if(seed is None): cache = None
+    if(cache is not None):
+        key = cache.key(config, seed, actions, steps_per_action)
+        traj = cache.get(key)
+        if(traj is not None): return traj
+
+    exp = makeSetup(config, seed)
+    act = ACTIONS[config["setup"]]
+    traj = []
+    for a in actions:
+        act(exp, a)
+        for i in range(steps_per_action):
+            Box2DWorld.step()
+            exp.update()
+        traj.append(worldState())
+    traj = np.array(traj)
+
+    if(cache is not None): cache.put(key, traj)
+    return traj
+
+
+class RolloutCache(object):
+    """Directory of trajectories, one .npz per (setup config, seed, actions, steps_per_action)."""
+
+    def __init__(self, path="rollouts"):
+        self.path = path
+        if(not os.path.isdir(path)): os.makedirs(path)
+        self.hits, self.misses = 0, 0
+
+    def key(self, config, seed, actions, steps_per_action=1):
+        """Only int seeds identify a rollout: a RandomState is consumed by the run, None is the global one."""
+        if(isinstance(seed, bool) or not isinstance(seed, (int, long, np.integer))):
+            raise ValueError("rollouts are cached for int seeds only, not %r" % (seed,))
+        seed = int(seed)
+        actions = np.ascontiguousarray(actions, dtype='<f8')
+        desc = {"version": CACHE_VERSION, "config": config, "seed": seed,
+                "steps_per_action": steps_per_action, "shape": list(actions.shape),
+                "actions": hashlib.sha1(actions.tostring()).hexdigest()}
+        return hashlib.sha1(json.dumps(desc, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.path, key + ".npz")
+
+    def get(self, key):
+        fname = self.filename(key)
+        if(not os.path.exists(fname)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        with np.load(fname) as data:
+            return data["traj"]
+
+    def put(self, key, traj):
+        # write then rename, so that concurrent workers never read half written files
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(f, traj=traj)
+        os.rename(tmp, self.filename(key))
@@ -0,0 +1,240 @@
+import os
+import json
+import inspect
+import hashlib
+import tempfile
+import cPickle as pickle
+import Box2D
+import Box2DWorld
+from Box2DWorld import (createBox, createCircle, createTri, createRope, myCreateRevoluteJoint, myCreateDistanceJoint,
+                        myCreateLinearJoint)
+import Robots
+
+# *****************************************************************
+# Declarative scenes: the bodies, robots (with their sensors) and joints of a world as
+# JSON data instead of setup code. Entries are built in order, each one by the function
+# of its "shape", "robot" or "joint" with the other keys as keyword arguments:
+#
+#     {"version": 1, "gravity": [0, -0.001],
+#      "bodies": [{"robot": "Epuck", "id": "e0", "position": [-3, 2.2], "nother": 2, "nrewsensors": 4},
+#                 {"shape": "box", "position": [0, -0.9], "w": 3.5, "h": 0.2, "bDynamic": false, "name": "wall_top"},
+#                 {"shape": "circle", "position": [0, 4.2], "r": 0.27, "name": "reward", "userData": {"energy": 1.0}}],
+#      "joints": [{"joint": "distance", "bodyA": "e0", "bodyB": ["rope", -1]}]}
+#
+# "id" names an entry for the joints, which refer to it by id or by [id, k] for the k-th
+# body of a rope, robot or multi body entry; "userData" is merged into the body userData.
+# parseScene checks the whole scene against the signatures of the builders (arguments and
+# the type of their values) and the bodies each entry makes (references, userData) once,
+# before anything is built, and keeps the parsed form in memory (and on disk with a cache
+# directory), keyed on the content, so loading the same scene again only runs the builders.
+#
+#     scene = loadScene("epuck.json")      # in the current world, see ExpSetupScene
+# *****************************************************************
+
+SCENE_VERSION = 1
+SCENE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scenes")
+
+SHAPES = {"box": createBox, "circle": createCircle, "tri": createTri, "rope": createRope}
+ROBOTS = {"Epuck": Robots.Epuck, "NaoRobot": Robots.NaoRobot, "CartPole": Robots.CartPole}
+JOINTS = {"revolute": myCreateRevoluteJoint, "distance": myCreateDistanceJoint, "linear": myCreateLinearJoint}
+RESERVED = ("shape", "robot", "joint", "id", "userData", "bodyA", "bodyB")
+
+BODY_COUNTS = {"box": 1, "circle": 1, "tri": 1, "Epuck": 1, "CartPole": 2, "NaoRobot": 0}   # len(entryBodies), rope: nparts + 1
+
+# kinds of the values the defaults of the builders do not tell (see valueKind)
+INTEGERS = ("nparts", "nir", "frontIR", "nother", "nrewsensors", "wdiv", "hdiv", "categoryBits", "maskBits", "collisionGroup")
+POINTS = ("position", "anchor")               # (x, y), required
+NUMBERS = ("restitution",)                    # None by default
+
+parsedScenes = {}          # content key -> parsed scene
+
+
+def entryBodies(obj):
+    """Bodies an entry can be joined by: the body, the segments of a rope, or the bodies of a robot."""
+    if(isinstance(obj, Box2D.b2Body)): return [obj]
+    if(isinstance(obj, tuple)): return obj[0]                      # createRope -> (bodies, end joints)
+    if(isinstance(obj, Robots.Epuck)): return [obj.body]
+    if(isinstance(obj, Robots.CartPole)): return [obj.circle, obj.box]
+    return []
+
+
+def bodyCount(name, kwargs):
+    """Number of bodies of an entry (see entryBodies), known before building it."""
+    if(name != "rope"): return BODY_COUNTS[name]
+    args, varargs, keywords, defaults = inspect.getargspec(createRope)
+    return kwargs.get("nparts", dict(zip(args[-len(defaults):], defaults))["nparts"]) + 1
+
+
+def signature(f):
+    if(inspect.isclass(f)): f = f.__init__
+    args, varargs, keywords, defaults = inspect.getargspec(f)
+    if(args and args[0] == "self"): args = args[1:]
+    required = args[:len(args) - len(defaults or ())]
+    return args, required, dict(zip(args[len(required):], defaults or ()))
+
+
+def isNumber(v):
+    return isinstance(v, (int, long, float)) and not isinstance(v, bool)
+
+
+def valueKind(k, default):
+    """What argument k of a builder takes, from its name or its default: "int", "number", "bool", "flag"
+    (bool or number), "string", an int n for a list of n numbers, or None (not checked)."""
+    if(k in INTEGERS): return "int"
+    if(k in POINTS): return 2
+    if(k in NUMBERS): return "number"
+    if(isinstance(default, bool)): return "bool"
+    if(k[:1] == "b" and k[1:2].isupper()): return "flag"
+    if(isNumber(default)): return "number"
+    if(isinstance(default, basestring)): return "string"
+    if(isinstance(default, (list, tuple)) and default and all(isNumber(x) for x in default)): return len(default)
+    return None
+
+
+def isKind(v, kind):
+    if(kind == "int"): return isinstance(v, (int, long)) and not isinstance(v, bool)
+    if(kind == "number"): return isNumber(v)
+    if(kind == "bool"): return isinstance(v, bool)
+    if(kind == "flag"): return isinstance(v, bool) or isNumber(v)
+    if(kind == "string"): return isinstance(v, basestring)
+    if(isinstance(kind, int)): return isinstance(v, list) and len(v) == kind and all(isNumber(x) for x in v)
+    return True
+
+
+KIND_NAMES = {"int": "an integer", "number": "a number", "bool": "true or false", "flag": "a bool or a number",
+              "string": "a string"}
+
+
+def checkArguments(where, kind, f, kwargs, skip=()):
+    args, required, defaults = signature(f)
+    for k in kwargs:
+        if(k not in args): raise ValueError("%s: unknown argument %r of %s" % (where, k, kind))
+        expected = valueKind(k, defaults.get(k))
+        if(kwargs[k] is None and k in defaults and defaults[k] is None): continue
+        if(not isKind(kwargs[k], expected)):
+            what = KIND_NAMES.get(expected) or "a list of %d numbers" % expected
+            raise ValueError("%s: argument %r of %s is %r, not %s" % (where, k, kind, kwargs[k], what))
+    for k in required:
+        if(k not in kwargs and k not in skip): raise ValueError("%s: missing argument %r of %s" % (where, k, kind))
+
+
+def parseEntry(where, entry, table, key):
+    kind = entry.get(key)
+    if(not isinstance(kind, basestring) or kind not in table): raise ValueError("%s: unknown %s %r, not one of %s" % (where, key, kind, sorted(table)))
+    kwargs = dict((k, v) for k, v in entry.items() if k not in RESERVED)
+    userData = entry.get("userData", {})
+    if(not isinstance(userData, dict)): raise ValueError("%s: userData is not an object" % where)
+    return kind, kwargs, userData
+
+
+def plain(v):
+    """JSON data with str instead of unicode strings, as the setups pass them."""
+    if(isinstance(v, unicode)): return str(v)
+    if(isinstance(v, list)): return [plain(x) for x in v]
+    if(isinstance(v, dict)): return dict((plain(k), plain(x)) for k, x in v.items())
+    return v
+
+
+def parseScene(scene, cache=None):
+    """Validated, parsed form of scene (a dict, or a JSON file name, looked up in SCENE_DIR if not found),
+    from memory or the cache directory when already parsed."""
+    if(not isinstance(scene, dict)):
+        fname = scene if os.path.exists(scene) else os.path.join(SCENE_DIR, scene)
+        with open(fname) as f: scene = json.load(f)
+    key = hashlib.sha1(json.dumps(scene, sort_keys=True).encode("utf-8")).hexdigest()
+    if(key in parsedScenes): return parsedScenes[key]
+    fname = None if cache is None else os.path.join(cache, "scene_" + key + ".pkl")
+    if(fname is not None and os.path.exists(fname)):
+        with open(fname, "rb") as f: parsed = pickle.load(f)
+    else:
+        parsed = validate(plain(scene))
+        if(fname is not None):
+            if(not os.path.isdir(cache)): os.makedirs(cache)
+            # write then rename, so that concurrent workers never read half written files
+            fd, tmp = tempfile.mkstemp(dir=cache, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f: pickle.dump(parsed, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, fname)
+    parsedScenes[key] = parsed
+    return parsed
+
+
+def validate(scene):
+    """Check a scene dict, returns (gravity, [(builder kind, name, kwargs, userData, id)], [(joint, kwargs, refA, refB)])
+    with the joint references turned into entry indices."""
+    if(scene.get("version", SCENE_VERSION) != SCENE_VERSION):
+        raise ValueError("scene version %r, expected %d" % (scene.get("version"), SCENE_VERSION))
+    unknown = set(scene) - set(["version", "gravity", "bodies", "joints", "description"])
+    if(unknown): raise ValueError("scene: unknown keys %s" % sorted(unknown))
+    gravity = scene.get("gravity")
+    if(gravity is not None and not isKind(gravity, 2)): raise ValueError("scene: gravity is not (x, y)")
+    for key in ["bodies", "joints"]:
+        if(not isinstance(scene.get(key, []), list)): raise ValueError("scene: %s is not a list" % key)
+
+    entries, ids, counts = [], {}, []
+    for i, entry in enumerate(scene.get("bodies", [])):
+        where = "bodies[%d]" % i
+        if(not isinstance(entry, dict)): raise ValueError("%s: not an object" % where)
+        if("robot" in entry): kind, name, table = "robot", entry.get("robot"), ROBOTS
+        elif("shape" in entry): kind, name, table = "shape", entry.get("shape"), SHAPES
+        else: raise ValueError("%s: neither a shape nor a robot" % where)
+        name, kwargs, userData = parseEntry(where, entry, table, kind)
+        checkArguments(where, name, table[name], kwargs)
+        nbodies = bodyCount(name, kwargs)
+        if(userData and nbodies == 0): raise ValueError("%s: userData on a %s, which has no body to hold it" % (where, name))
+        if("id" in entry):
+            if(not isinstance(entry["id"], basestring)): raise ValueError("%s: id %r is not a string" % (where, entry["id"]))
+            if(entry["id"] in ids): raise ValueError("%s: id %r already used" % (where, entry["id"]))
+            ids[entry["id"]] = i
+        entries.append((kind, name, kwargs, userData, entry.get("id")))
+        counts.append(nbodies)
+
+    def ref(where, r):
+        k = 0
+        if(isinstance(r, list)):
+            if(len(r) != 2): raise ValueError("%s: body reference %r is not [id, k]" % (where, r))
+            r, k = r
+        if(not isinstance(r, basestring) or r not in ids): raise ValueError("%s: no body with id %r" % (where, r))
+        n = counts[ids[r]]
+        if(not isinstance(k, (int, long)) or isinstance(k, bool) or not -n <= k < n):
+            raise ValueError("%s: no body %r in %r, which has %d bodies" % (where, k, r, n))
+        return ids[r], k
+
+    joints = []
+    for i, entry in enumerate(scene.get("joints", [])):
+        where = "joints[%d]" % i
+        if(not isinstance(entry, dict)): raise ValueError("%s: not an object" % where)
+        name, kwargs, userData = parseEntry(where, entry, JOINTS, "joint")
+        checkArguments(where, name, JOINTS[name], kwargs, skip=("bodyA", "bodyB"))
+        joints.append((name, kwargs, ref(where, entry.get("bodyA")), ref(where, entry.get("bodyB"))))
+    return gravity, entries, joints
+
+
+class Scene(object):
+    """What a scene built: the object of each entry in order (bodies, robots, ropes), by id, and the joints."""
+
+    def __init__(self, objects, ids, joints):
+        self.objects, self.ids, self.joints = objects, ids, joints
+
+    def robots(self, name):
+        return [o for o in self.objects if isinstance(o, ROBOTS[name])]
+
+    def bodies(self):
+        """Every body of the entries, in order."""
+        return [b for o in self.objects for b in entryBodies(o)]
+
+
+def loadScene(scene, cache=None):
+    """Build the scene (dict, file name or parsed form) in the current world, returns its Scene."""
+    gravity, entries, joints = scene if isinstance(scene, tuple) else parseScene(scene, cache)
+    if(gravity is not None): Box2DWorld.getWorld().gravity = Box2D.b2Vec2(*gravity)
+    objects, ids = [], {}
+    for kind, name, kwargs, userData, id in entries:
+        table = ROBOTS if kind == "robot" else SHAPES
+        obj = table[name](**kwargs)
+        for body in entryBodies(obj): body.userData.update(userData)
+        objects.append(obj)
+        if(id is not None): ids[id] = obj
+    built = []
+    for name, kwargs, (ia, ka), (ib, kb) in joints:
+        built.append(JOINTS[name](entryBodies(objects[ia])[ka], entryBodies(objects[ib])[kb], **kwargs))
+    return Scene(objects, ids, built)
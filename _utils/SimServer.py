@@ -0,0 +1,338 @@
+import time
+import errno
+import select
+import socket
+import struct
+import multiprocessing
+import numpy as np
+import Envs
+
+# *****************************************************************
+# Simulation server for remote agents.
+# One event loop (select) serves many clients over TCP. Each hosted experiment is an
+# Envs environment running in its own process (the Box2D world is global per process).
+# Clients send batched actions as segments of the action vector of an experiment,
+# e.g. each controller of one epuck writes its two motors. All the actions received
+# for an experiment are merged into a single physics step, taken as soon as every client
+# of that experiment has acted or max_wait seconds after the first action, and every
+# client that acted gets the resulting observation.
+#
+# Frames, little endian: header <IHHI (payload bytes, type, experiment, sequence), payload
+#     HELLO  client: empty                       -> INFO
+#     INFO   server: <II obs_dim, act_dim, float32 action low[act_dim], high[act_dim]
+#     ACT    client: <H nseg, nseg x (<HH start, length, float32 values[length])  -> OBS
+#     RESET  client: empty                       -> OBS
+#     OBS    server: <fB reward, done, float32 obs[obs_dim]; sequence is the step count
+#     ERROR  server: utf-8 message, instead of INFO or OBS (bad request, the environment
+#            raised, or its process stopped)
+# The framing is plain length prefixed binary, so a python 3 asyncio client only needs
+# StreamReader.readexactly and struct.
+#
+#     server = SimServer(("127.0.0.1", 5555), [(Envs.EpuckEnv, {"n": 2})])
+#     server.serve()
+#     client = SimClient(("127.0.0.1", 5555)); client.hello(0)
+#     obs, reward, done = client.act(0, [(0, [0.5, 0.5])])
+# *****************************************************************
+
+HEADER = struct.Struct("<IHHI")
+HELLO, INFO, ACT, RESET, OBS, ERROR = 1, 2, 3, 4, 5, 6
+
+
+def frame(msgtype, iexp=0, seq=0, payload=b""):
+    return HEADER.pack(len(payload), msgtype, iexp, seq) + payload
+
+def packSegments(segments):
+    """ACT payload of [(start, values), ...]."""
+    parts = [struct.pack("<H", len(segments))]
+    for start, values in segments:
+        values = np.asarray(values, dtype="<f4")
+        parts.append(struct.pack("<HH", start, len(values)) + values.tostring())
+    return b"".join(parts)
+
+def unpackSegments(payload):
+    nseg, = struct.unpack_from("<H", payload, 0)
+    k, segments = 2, []
+    for i in range(nseg):
+        start, n = struct.unpack_from("<HH", payload, k)
+        segments.append((start, np.frombuffer(payload, dtype="<f4", count=n, offset=k + 4)))
+        k += 4 + 4 * n
+    return segments
+
+
+class FrameReader(object):
+    """Splits a byte stream into (type, experiment, sequence, payload) frames."""
+
+    def __init__(self):
+        self.buf = b""
+
+    def feed(self, data):
+        self.buf += data
+        frames = []
+        while len(self.buf) >= HEADER.size:
+            n, msgtype, iexp, seq = HEADER.unpack_from(self.buf, 0)
+            if(len(self.buf) < HEADER.size + n): break
+            frames.append((msgtype, iexp, seq, self.buf[HEADER.size:HEADER.size + n]))
+            self.buf = self.buf[HEADER.size + n:]
+        return frames
+
+
+# ********************************************
+# Experiments, each one in a process
+
+def errorText(e):
+    return "%s: %s" % (type(e).__name__, e)
+
+
+def experimentLoop(conn, envclass, kwargs):
+    """Replies (OBS payload, steps) to each step or reset, or (None, error text) if the environment raised."""
+    try:
+        env = envclass(**kwargs)
+        low, high = env.action_space.low, env.action_space.high
+    except Exception as e:
+        conn.send(errorText(e))
+        return
+    conn.send((len(env.obs), len(low), low.astype("<f4").tostring() + high.astype("<f4").tostring()))
+    while True:
+        msg = conn.recv()
+        if(msg is None): break
+        try:
+            if(msg[0] == "step"):
+                obs, reward, done, info = env.step(msg[1])
+            else:
+                obs, reward, done = env.reset(), 0.0, False
+        except Exception as e:
+            conn.send((None, errorText(e)))
+            continue
+        conn.send((struct.pack("<fB", reward, done) + obs.astype("<f4").tostring(), env.nsteps))
+
+
+class Experiment(object):
+    """Server side state of a hosted experiment: its process, clients and the action being merged."""
+
+    def __init__(self, iexp, envclass, kwargs):
+        self.iexp = iexp
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=experimentLoop, args=(child, envclass, kwargs))
+        self.process.daemon = True
+        self.process.start()
+        reply = self.conn.recv()
+        if(isinstance(reply, basestring)): raise RuntimeError("experiment %d: %s" % (iexp, reply))
+        self.obs_dim, self.act_dim, self.bounds = reply
+        self.info = struct.pack("<II", self.obs_dim, self.act_dim) + self.bounds
+        self.action = np.zeros(self.act_dim)
+        self.clients = set()            # clients that said hello
+        self.acted = []                 # clients waiting for the next step
+        self.deferred = []              # (client, segments) of clients that already acted for it
+        self.resets = []                # clients waiting for a reset
+        self.first = None               # time of the first action of the next step
+        self.busy = False               # the process is stepping, replies go to self.replyTo
+        self.replyTo = []
+        self.steps = 0
+        self.bAlive = True              # False once the process is gone
+
+    def addAction(self, client, segments):
+        if(client in self.acted):
+            self.deferred.append((client, segments))
+            return
+        for start, values in segments:
+            self.action[start:start + len(values)] = values
+        if(self.first is None): self.first = time.time()
+        self.clients.add(client)
+        self.acted.append(client)
+
+    def ready(self, max_wait):
+        if(not self.bAlive or self.busy or not (self.acted or self.resets)): return False
+        if(self.resets): return True
+        return len(set(self.acted) & self.clients) >= len(self.clients) or time.time() - self.first >= max_wait
+
+    def dispatch(self):
+        if(self.resets):
+            self.conn.send(("reset",))
+            self.replyTo, self.resets = self.resets, []
+        else:
+            self.conn.send(("step", self.action.copy()))
+            self.replyTo, self.acted, self.first = self.acted, [], None
+            self.steps += 1
+            deferred, self.deferred = self.deferred, []
+            for client, segments in deferred:
+                self.addAction(client, segments)
+        self.busy = True
+
+
+class SimServer(object):
+    """Event loop hosting experiments = [(Envs class, kwargs), ...] for the clients of address."""
+
+    def __init__(self, address=("127.0.0.1", 5555), experiments=[(Envs.EpuckEnv, {})], max_wait=0.005):
+        self.max_wait = max_wait
+        self.experiments = [Experiment(i, cls, kwargs) for i, (cls, kwargs) in enumerate(experiments)]
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen(64)
+        self.listener.setblocking(0)
+        self.address = self.listener.getsockname()
+        self.readers = {}               # client socket -> FrameReader
+        self.outbox = {}                # client socket -> bytes not sent yet
+        self.bRunning = False
+
+    def send(self, client, data):
+        if(client in self.outbox): self.outbox[client] += data
+
+    def error(self, client, iexp, text):
+        self.send(client, frame(ERROR, iexp, 0, text.encode("utf-8")))
+
+    def handle(self, client, msgtype, iexp, seq, payload):
+        if(iexp >= len(self.experiments)):
+            return self.error(client, iexp, "no experiment %d" % iexp)
+        exp = self.experiments[iexp]
+        if(not exp.bAlive):
+            return self.error(client, iexp, "experiment %d stopped" % iexp)
+        if(msgtype == HELLO):
+            exp.clients.add(client)
+            self.send(client, frame(INFO, iexp, exp.steps, exp.info))
+        elif(msgtype == ACT):
+            try:
+                segments = unpackSegments(payload)
+            except (struct.error, ValueError):
+                return self.error(client, iexp, "malformed ACT")
+            if(any(start + len(values) > exp.act_dim for start, values in segments)):
+                return self.error(client, iexp, "action segment out of range")
+            exp.addAction(client, segments)
+        elif(msgtype == RESET):
+            exp.resets.append(client)
+        else:
+            self.error(client, iexp, "unknown message type %d" % msgtype)
+
+    def stopped(self, exp):
+        """The process of exp is gone: its waiting clients get an error, later requests too (see handle)."""
+        exp.bAlive, exp.busy = False, False
+        for client in set(exp.replyTo + exp.acted + exp.resets + [c for c, segs in exp.deferred]):
+            self.error(client, exp.iexp, "experiment %d stopped" % exp.iexp)
+        exp.replyTo, exp.acted, exp.deferred, exp.resets, exp.first = [], [], [], [], None
+
+    def drop(self, client):
+        for exp in self.experiments:
+            exp.clients.discard(client)
+            exp.acted = [c for c in exp.acted if c is not client]
+            exp.deferred = [(c, segs) for c, segs in exp.deferred if c is not client]
+            exp.resets = [c for c in exp.resets if c is not client]
+        self.readers.pop(client, None)
+        self.outbox.pop(client, None)
+        client.close()
+
+    def serve(self, duration=None):
+        """Run the event loop, for duration seconds or until stop()."""
+        self.bRunning = True
+        tend = None if duration is None else time.time() + duration
+        pipes = dict((exp.conn.fileno(), exp) for exp in self.experiments)
+        while self.bRunning and (tend is None or time.time() < tend):
+            for exp in self.experiments:
+                if(not exp.ready(self.max_wait)): continue
+                try:
+                    exp.dispatch()
+                except IOError:
+                    pipes.pop(exp.conn.fileno(), None)
+                    self.stopped(exp)
+            timeout = 0.1
+            for exp in self.experiments:
+                if(exp.first is not None and not exp.busy):
+                    timeout = min(timeout, max(0, exp.first + self.max_wait - time.time()))
+            writers = [c for c, data in self.outbox.items() if data]
+            rlist, wlist, xlist = select.select([self.listener] + list(self.readers) + list(pipes), writers, [], timeout)
+
+            for r in rlist:
+                if(r is self.listener):
+                    try:
+                        client, addr = self.listener.accept()
+                    except socket.error:
+                        continue
+                    client.setblocking(0)
+                    client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self.readers[client], self.outbox[client] = FrameReader(), b""
+                elif(r in pipes):
+                    exp = pipes[r]
+                    try:
+                        data, steps = exp.conn.recv()
+                    except (EOFError, IOError):
+                        del pipes[r]
+                        self.stopped(exp)
+                        continue
+                    for client in exp.replyTo:
+                        if(data is None): self.error(client, exp.iexp, steps)
+                        else: self.send(client, frame(OBS, exp.iexp, steps, data))
+                    exp.replyTo, exp.busy = [], False
+                elif(r in self.readers):
+                    try:
+                        data = r.recv(1 << 16)
+                    except socket.error as e:
+                        if(e.errno in (errno.EAGAIN, errno.EWOULDBLOCK)): continue
+                        data = b""
+                    if(not data):
+                        self.drop(r)
+                        continue
+                    for f in self.readers[r].feed(data):
+                        self.handle(r, *f)
+
+            for w in wlist:
+                if(w not in self.outbox): continue
+                try:
+                    n = w.send(self.outbox[w])
+                    self.outbox[w] = self.outbox[w][n:]
+                except socket.error as e:
+                    if(e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK)): self.drop(w)
+
+    def stop(self):
+        self.bRunning = False
+
+    def close(self):
+        for client in list(self.readers): self.drop(client)
+        self.listener.close()
+        for exp in self.experiments:
+            if(exp.bAlive): exp.conn.send(None)
+            exp.process.join(5)
+
+
+class SimClient(object):
+    """Blocking client, one request at a time."""
+
+    def __init__(self, address=("127.0.0.1", 5555)):
+        self.sock = socket.create_connection(address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = FrameReader()
+        self.frames = []
+        self.dims = {}
+
+    def receive(self):
+        while not self.frames:
+            data = self.sock.recv(1 << 16)
+            if(not data): raise IOError("connection closed by the server")
+            self.frames += self.reader.feed(data)
+        msgtype, iexp, seq, payload = self.frames.pop(0)
+        if(msgtype == ERROR): raise ValueError("server: " + payload.decode("utf-8"))
+        return msgtype, iexp, seq, payload
+
+    def hello(self, iexp=0):
+        """(obs_dim, act_dim, action low, action high) of the experiment."""
+        self.sock.sendall(frame(HELLO, iexp))
+        msgtype, iexp, seq, payload = self.receive()
+        obs_dim, act_dim = struct.unpack_from("<II", payload, 0)
+        bounds = np.frombuffer(payload, dtype="<f4", offset=8)
+        self.dims[iexp] = obs_dim
+        return obs_dim, act_dim, bounds[:act_dim], bounds[act_dim:]
+
+    def observation(self):
+        msgtype, iexp, seq, payload = self.receive()
+        reward, done = struct.unpack_from("<fB", payload, 0)
+        return np.frombuffer(payload, dtype="<f4", offset=5), reward, bool(done)
+
+    def act(self, iexp, segments):
+        """Send [(start, values), ...] of the action vector, returns (obs, reward, done) after the step."""
+        self.sock.sendall(frame(ACT, iexp, 0, packSegments(segments)))
+        return self.observation()
+
+    def reset(self, iexp=0):
+        self.sock.sendall(frame(RESET, iexp))
+        return self.observation()
+
+    def close(self):
+        self.sock.close()
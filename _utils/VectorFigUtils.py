@@ -1,6 +1,7 @@
 import numpy as np
 import math
-import matplotlib.pyplot as plt
+from LazyImport import lazyImport
+plt = lazyImport("matplotlib.pyplot")    # imported on first use, not by the physics modules
 
 font = {'family': 'Bitstream Vera Sans', 'size': 20}
 x_lim, y_lim = (-4, 4), (-1.5, 5.5)
@@ -0,0 +1,132 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+from Box2DWorld import getRNG
+
+# *****************************************************************
+# Workspace maps: which cells of a grid over [s_mins, s_maxs] the end point of an arm
+# reaches, from random joint configurations within getJointLimits() rasterized through
+# the arm kinematics (Kinematics.ArmKinematics, collisions not modelled). A map is
+# computed once per arm geometry, position and grid, and kept on disk keyed on them.
+# Reachability queries and goal sampling are then lookups in the grid.
+#
+#     ws = nao.getWorkspace()
+#     ws.reach([(0.5, 1.0)])          # bit i set if arm i reaches the point: 1 left, 2 right, 3 both
+#     goals = ws.sample(100, bAll=True)    # points reached by both arms
+# *****************************************************************
+
+CACHE_VERSION = 1          # bump when a change in the kinematics makes cached maps stale
+
+
+class WorkspaceMap(object):
+    """Cells of the grid reached by one arm, counts (w, h) of the sampled end points in each cell."""
+
+    def __init__(self, arm, s_mins=None, s_maxs=None, resolution=0.02, samples=400000, path="workspace", seed=0):
+        self.mins = np.array(arm.s_mins() if s_mins is None else s_mins, dtype=float)
+        self.maxs = np.array(arm.s_maxs() if s_maxs is None else s_maxs, dtype=float)
+        self.resolution = resolution
+        self.shape = tuple(int(np.ceil(v)) for v in (self.maxs - self.mins) / resolution)
+        self.samples, self.seed = samples, seed
+        self.path = path                   # directory of the cached maps, None for no disk cache
+        self.kin = arm.getKinematics()
+        self.bCached = False               # loaded from the disk cache
+        self.counts = self.load()
+        if(self.counts is None):
+            self.counts = self.build()
+            self.save()
+        self.mask = self.counts > 0
+
+    def key(self):
+        desc = {"version": CACHE_VERSION, "arm": repr(self.kin.key()), "base": list(np.round(self.kin.base, 6)),
+                "mins": list(self.mins), "maxs": list(self.maxs), "resolution": self.resolution,
+                "samples": self.samples, "seed": self.seed}
+        return hashlib.sha1(json.dumps(desc, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def cells(self, points):
+        """Grid cells (i, j) of points (m, 2), and whether they are inside the grid."""
+        ij = np.floor((np.atleast_2d(np.asarray(points, dtype=float)) - self.mins) / self.resolution).astype(int)
+        inside = np.all((ij >= 0) & (ij < self.shape), axis=1)
+        return ij, inside
+
+    def build(self, batch=100000):
+        rng = getRNG(self.seed)
+        counts = np.zeros(self.shape[0] * self.shape[1], dtype=np.int64)
+        for k in range(0, self.samples, batch):
+            Q = rng.uniform(self.kin.lo, self.kin.hi, (min(batch, self.samples - k), self.kin.n))
+            ij, inside = self.cells(self.kin.points(Q)[0][:, -1])
+            ij = ij[inside]
+            counts += np.bincount(ij[:, 0] * self.shape[1] + ij[:, 1], minlength=len(counts))
+        return counts.reshape(self.shape)
+
+    def filename(self):
+        return os.path.join(self.path, "workspace_" + self.key() + ".npz")
+
+    def load(self):
+        if(self.path is None or not os.path.exists(self.filename())): return None
+        with np.load(self.filename()) as data:
+            self.bCached = True
+            return data["counts"]
+
+    def save(self):
+        if(self.path is None): return
+        if(not os.path.isdir(self.path)): os.makedirs(self.path)
+        # write then rename, so that concurrent processes never read half written files
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(f, counts=self.counts)
+        os.rename(tmp, self.filename())
+
+    def reachable(self, points):
+        """Whether each of points (m, 2) is in a reached cell."""
+        ij, inside = self.cells(points)
+        ok = np.zeros(len(ij), dtype=bool)
+        ok[inside] = self.mask[ij[inside, 0], ij[inside, 1]]
+        return ok
+
+    def coverage(self):
+        """Fraction of the grid reached."""
+        return self.mask.mean()
+
+
+class RobotWorkspace(object):
+    """Workspace maps of several arms on one grid, with the set of arms reaching each cell as bits."""
+
+    def __init__(self, arms, s_mins=None, s_maxs=None, **kwargs):
+        self.maps = [WorkspaceMap(arm, s_mins, s_maxs, **kwargs) for arm in arms]
+        m = self.maps[0]
+        self.mins, self.resolution, self.shape = m.mins, m.resolution, m.shape
+        self.bits = np.zeros(self.shape, dtype=np.uint32)
+        for i, wm in enumerate(self.maps):
+            self.bits |= wm.mask.astype(np.uint32) << i
+        self.candidates = {}               # (arms bits, bAll) -> flat indices of the cells to sample
+
+    def reach(self, points):
+        """Bit i of each value is set if arm i reaches the point, 0 outside of the grid."""
+        ij, inside = self.maps[0].cells(points)
+        bits = np.zeros(len(ij), dtype=np.uint32)
+        bits[inside] = self.bits[ij[inside, 0], ij[inside, 1]]
+        return bits
+
+    def reachable(self, points, iarms=None, bAll=False):
+        """Whether the points are reached by any (or all with bAll) of the arms iarms (default all)."""
+        want = self.armBits(iarms)
+        bits = self.reach(points) & want
+        return bits == want if bAll else bits > 0
+
+    def armBits(self, iarms):
+        if(iarms is None): iarms = range(len(self.maps))
+        return np.uint32(sum(1 << i for i in iarms))
+
+    def sample(self, k=1, iarms=None, bAll=False, rng=np.random):
+        """k points drawn uniformly over the cells reached by any (or all with bAll) of the arms iarms."""
+        want = self.armBits(iarms)
+        key = (int(want), bAll)
+        if(key not in self.candidates):
+            bits = self.bits & want
+            self.candidates[key] = np.flatnonzero(bits == want if bAll else bits > 0)
+        cells = self.candidates[key]
+        if(len(cells) == 0): raise ValueError("no cell of the workspace is reached by arms %s" % (iarms,))
+        i, j = np.unravel_index(cells[rng.randint(len(cells), size=k)], self.shape)
+        return self.mins + (np.column_stack((i, j)) + rng.uniform(0, 1, (k, 2))) * self.resolution
@@ -0,0 +1,245 @@
+"""Headless throughput benchmarks of every ExpSetup class.
+
+Each case is built in its own process from a fixed seed, driven by a scripted
+random action sequence and timed per phase. Results are printed as JSON.
+
+    python benchmarks.py                       # all cases, 1000 steps each
+    python benchmarks.py --steps 200 --render  # also time pygame drawing
+    python benchmarks.py --cases nao_bimanual multiagent_100 --output bench.json
+    python benchmarks.py --pacing              # check that slow frames are skipped, not simulated time
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '_utils'))
+import json
+import time
+import random
+import resource
+import platform
+import argparse
+import multiprocessing
+import numpy as np
+os.environ.setdefault("MPLBACKEND", "Agg")      # headless, in case a setup plots
+
+ACTION_EVERY = 10          # steps between two scripted actions
+
+
+# ****************************************************************************
+# Cases: build the setup, act on it and split its update in timed phases
+# ****************************************************************************
+
+class Case(object):
+    """Benchmark case: a setup constructor plus how to drive and time it."""
+
+    def __init__(self, name, build, act, phases, metrics=None):
+        self.name = name
+        self.build = build        # build() -> exp
+        self.act = act            # act(exp, rng) scripted action
+        self.phases = phases      # phases(exp) -> [(phase name, function)] run in order each step
+        self.metrics = metrics    # metrics(exp) -> {name: value} each step, untimed, the maximum is reported
+
+
+def epuckPhases(exp):
+    return [("sensors", exp.update)]
+
+def naoPhases(exp):
+    return [("control", exp.nao.update),
+            ("salient_haptic", lambda: (exp.updateSalient(), exp.updateHaptic()))]
+
+def actRandall(exp, rng):
+    for i in range(len(exp.epucks)):
+        exp.action(epuck=i, action=rng.randint(3))
+
+def actEpucks(exp, rng):
+    for i in range(len(exp.epucks)):
+        exp.setMotors(epuck=i, motors=list(rng.uniform(-1, 1, 2)))
+
+def actSwarm(exp, rng):
+    exp.act(rng.uniform(-1, 1, (exp.swarm.n, 2)))
+
+def actDualCartPole(exp, rng):
+    for i in [0, 1]:
+        exp.setMotorSpeed(i, rng.uniform(-1, 1) * exp.max_motor_speed)
+
+def ropeMetrics(exp):
+    """Stability of the rope: stretch of the links from their initial length, speed of the segments, and
+    segments gone out of the walls (or NaN)."""
+    pos = np.array([(p.x, p.y) for p in [b.position for b in exp.link]])
+    d = np.hypot(*np.diff(pos, axis=0).T)
+    if(not hasattr(exp, "ropeRest")): exp.ropeRest = d
+    v = np.array([(u.x, u.y) for u in [b.linearVelocity for b in exp.link]])
+    out = ~np.all(np.isfinite(pos), axis=1) | (np.abs(pos[:, 0]) > 5) | (pos[:, 1] < -2)
+    return {"stretch_max": float(np.abs(d - exp.ropeRest).max()),
+            "speed_max": float(np.hypot(*v.T).max()),
+            "escaped": int(out.sum())}
+
+def actNao(exp, rng):
+    dm = [round(d, 2) for d in rng.uniform(-1, 1, 2 * exp.nao.nparts)]
+    exp.deltaMotor(dm)
+
+def buildNao(name):
+    def build():
+        from ExpRobotSetup import ExpSetupNao
+        exp = ExpSetupNao(name=name, obj_type="box" if name == "bimanual" else "circle")
+        exp.setObjPos()
+        return exp
+    return build
+
+def buildSetup(clsname, **kwargs):
+    def build():
+        import ExpRobotSetup
+        return getattr(ExpRobotSetup, clsname)(**kwargs)
+    return build
+
+
+def allCases():
+    cases = [Case("randall", buildSetup("ExpSetupRandall"), actRandall, epuckPhases),
+             Case("epuck", buildSetup("ExpSetupEpuck"), actEpucks, epuckPhases)]
+    for n in [1, 10, 100]:
+        cases.append(Case("multiagent_%d" % n, buildSetup("ExpSetupMultiAgent", n=n), actEpucks, epuckPhases))
+    for n in [1000, 3000]:
+        cases.append(Case("swarm_%d" % n, buildSetup("ExpSetupSwarm", n=n), actSwarm, epuckPhases))
+    for objBetween in [1, 2, 3, 4]:
+        cases.append(Case("dualcartpole_%d" % objBetween, buildSetup("ExpSetupDualCartPole", objBetween=objBetween),
+                          actDualCartPole, epuckPhases, ropeMetrics if objBetween == 4 else None))
+    for joint in ["distance", "revolute", "rope"]:          # Box2DWorld.ROPE_JOINTS
+        for n in [5, 10, 20]:
+            cases.append(Case("rope_%s_%d" % (joint, n), buildSetup("ExpSetupDualCartPole", objBetween=4, ropeParts=n,
+                              ropeJoint=joint, bRopeSelfCollide=False, ropeDensity=1), actDualCartPole, epuckPhases, ropeMetrics))
+    for name in ["bimanual", "twooppositearms"]:
+        cases.append(Case("nao_%s" % name, buildNao(name), actNao, naoPhases))
+    return cases
+
+
+# ****************************************************************************
+# Running a case
+# ****************************************************************************
+
+def runCase(case, steps=1000, seed=0, render=False):
+    """Build and run one case in the current process, returns its stats dict."""
+    random.seed(seed)
+    np.random.seed(seed)
+    rng = np.random.RandomState(seed)
+
+    stdout, sys.stdout = sys.stdout, sys.stderr     # keep setup and pygame banners out of the JSON
+    try:
+        import Box2DWorld
+        if(render):
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+            import pygame
+            import PyGameUtils
+        t0 = time.time()
+        exp = case.build()
+        tbuild = time.time() - t0
+    finally:
+        sys.stdout = stdout
+
+    phases = [("physics", Box2DWorld.step)] + case.phases(exp)
+    if(render):
+        screen = pygame.Surface((PyGameUtils.SCREEN_WIDTH, PyGameUtils.SCREEN_HEIGHT))
+        def draw():
+            screen.fill((0, 0, 0, 0))
+            PyGameUtils.draw_world(screen)
+            if(hasattr(exp, "haptic")): PyGameUtils.draw_salient(screen, exp)
+        phases.append(("render", draw))
+
+    times = dict((name, 0.0) for name, f in phases)
+    metrics, tmetrics = {}, 0.0
+    tstart = time.time()
+    for i in range(steps):
+        if(i % ACTION_EVERY == 0): case.act(exp, rng)
+        for name, f in phases:
+            t = time.time()
+            f()
+            times[name] += time.time() - t
+        if(case.metrics):
+            t = time.time()
+            for name, v in case.metrics(exp).items(): metrics[name] = max(metrics.get(name, v), v)
+            tmetrics += time.time() - t
+    total = time.time() - tstart - tmetrics
+
+    result = {"steps": steps,
+              "build_s": round(tbuild, 4),
+              "total_s": round(total, 4),
+              "steps_per_s": round(steps / total, 2),
+              "phases_s": dict((name, round(t, 4)) for name, t in times.items()),
+              "phases_us_per_step": dict((name, round(1e6 * t / steps, 1)) for name, t in times.items()),
+              "bodies": Box2DWorld.getWorld().bodyCount,
+              "world": Box2DWorld.fixtureStats(),
+              "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    if(case.metrics): result["metrics"] = metrics
+    import Profiling
+    if(Profiling.bProfile): result["profile"] = Profiling.stats()     # ROBOT2DSIM_PROFILE=1
+    return result
+
+
+def _runCaseChild(conn, case, steps, seed, render):
+    try:
+        conn.send(runCase(case, steps, seed, render))
+    except Exception as e:
+        conn.send({"error": "%s: %s" % (type(e).__name__, e)})
+    conn.close()
+
+
+def runIsolated(case, steps=1000, seed=0, render=False):
+    """Run a case in a fresh process: the Box2D world is global, and peak memory is per case."""
+    parent, child = multiprocessing.Pipe(duplex=False)
+    p = multiprocessing.Process(target=_runCaseChild, args=(child, case, steps, seed, render))
+    p.start()
+    result = parent.recv()
+    p.join()
+    return result
+
+
+def checkPacing(render_s=0.3, dt=1.0 / 50, seconds=3.0):
+    """Pacer of a loop whose drawing takes render_s: slow frames must be skipped rather than simulated
+    time dropped. Returns the Pacer stats with "ok"."""
+    import Pacing
+    pacer = Pacing.Pacer(dt)
+    while(time.time() - pacer.start < seconds):
+        pacer.steps()
+        if(pacer.render()): time.sleep(render_s)
+        pacer.wait()
+    stats = pacer.stats()
+    stats["ok"] = stats["render_dropped"] > 0 and stats["sim_dropped_s"] == 0
+    return stats
+
+
+def runBenchmarks(names=[], steps=1000, seed=0, render=False):
+    cases = [c for c in allCases() if len(names) == 0 or c.name in names]
+    import Box2D
+    results = {"python": platform.python_version(),
+               "numpy": np.__version__,
+               "box2d": Box2D.__version__,
+               "steps": steps,
+               "seed": seed,
+               "render": render,
+               "cases": {}}
+    for case in cases:
+        sys.stderr.write("benchmark %s\n" % case.name)
+        results["cases"][case.name] = runIsolated(case, steps, seed, render)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless throughput benchmarks of the ExpSetup classes.")
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--render", action="store_true", help="also time pygame drawing to an offscreen surface")
+    parser.add_argument("--cases", nargs="*", default=[], help="case names, all by default: " +
+                        " ".join(c.name for c in allCases()))
+    parser.add_argument("--output", default=None, help="write the JSON to this file instead of stdout")
+    parser.add_argument("--pacing", action="store_true", help="only check that Pacing.Pacer skips slow frames")
+    args = parser.parse_args()
+
+    if(args.pacing):
+        stats = checkPacing()
+        print(json.dumps(stats, sort_keys=True))
+        sys.exit(0 if stats["ok"] else 1)
+    results = runBenchmarks(args.cases, args.steps, args.seed, args.render)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if(args.output):
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)